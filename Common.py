@@ -1,3 +1,5 @@
+import weakref
+
 import numpy as np
 # import mutex
 
@@ -43,6 +45,185 @@ class IDManager:
         if self.exists(idd):
             idx = self._ids.index(idd)
             self._ids = self._ids[:idx] + self._ids[idx+1:]
+
+
+class PointBuffer(object):
+    """
+    a growable (n, 2) float64 array: capacity doubles when full, so appending points one at a time is amortized O(1)
+    """
+    MIN_CAPACITY = 16
+
+    def __init__(self, points=None):
+        self._data = np.zeros((self.MIN_CAPACITY, 2))
+        self._n = 0
+        # False while the buffer wraps an array given to assign, which is copied before it is first written to
+        self._owned = True
+        if points is not None:
+            self.assign(points)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def points(self):
+        """
+        :return: a view of the used part of the buffer, to be read only, see writable
+        """
+        return self._data[:self._n]
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def _reserve(self, n):
+        if n > len(self._data) or not self._owned:
+            capacity = max(len(self._data), self.MIN_CAPACITY)
+            while capacity < n:
+                capacity *= 2
+            data = np.zeros((capacity, 2))
+            data[:self._n] = self._data[:self._n]
+            self._data = data
+            self._owned = True
+
+    def assign(self, points):
+        """
+        use points as the content of the buffer. A float64 (n, 2) array is not copied until the buffer is written
+        to, so that it can be shared with its owner (e.g. GeometryStore) without either seeing the other's edits.
+        Other arrays are converted to float64, so that edits are not truncated
+        :param points:
+        :return:
+        """
+        source = points
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2:
+            points = np.atleast_2d(points).reshape(-1, 2)
+        self._data = points
+        self._n = len(points)
+        self._owned = not isinstance(source, np.ndarray) or not np.may_share_memory(points, source)
+
+    def writable(self):
+        """
+        :return: the used part of the buffer, to be modified in place
+        """
+        self._reserve(self._n)
+        return self._data[:self._n]
+
+    def append(self, points):
+        """
+        :param points: (k, 2) array-like
+        :return: range of the new points
+        """
+        points = np.asarray(points).reshape(-1, 2)
+        start = self._n
+        self._reserve(start + len(points))
+        self._data[start:start + len(points)] = points
+        self._n += len(points)
+        return start, self._n
+
+    def _clamp(self, index):
+        """
+        resolve an index the way list slices do: negative indices count from the end, the result is in [0, n]
+        """
+        if index < 0:
+            index += self._n
+        return min(max(int(index), 0), self._n)
+
+    def insert(self, index, points):
+        """
+        :param index: position of the first inserted point, resolved like list.insert
+        :param points: (k, 2) array-like
+        :return: range of the new points
+        """
+        index = self._clamp(index)
+        points = np.asarray(points).reshape(-1, 2)
+        k = len(points)
+        self._reserve(self._n + k)
+        self._data[index + k:self._n + k] = self._data[index:self._n].copy()
+        self._data[index:index + k] = points
+        self._n += k
+        return index, index + k
+
+    def delete(self, start, stop):
+        """
+        remove the points in [start, stop), indices are resolved like those of a slice
+        :return: the removed range
+        """
+        start, stop = self._clamp(start), self._clamp(stop)
+        if start > stop:
+            raise ValueError('invalid range [%d, %d)' % (start, stop))
+        self._reserve(self._n)
+        self._data[start:self._n - (stop - start)] = self._data[stop:self._n].copy()
+        self._n -= stop - start
+        return start, stop
+
+
+class Signal(object):
+    """
+    a pure-python stand-in for pyqtSignal, declared as a class attribute the same way:
+
+        class Geometry(object):
+            changed = Signal(int)
+
+    each instance gets its own BoundSignal with connect/disconnect/emit, no Qt event loop is involved
+    """
+    def __init__(self, *types):
+        self._types = types
+        self._attr = None
+
+    def __set_name__(self, owner, name):
+        self._attr = '_signal_' + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
+        bound = obj.__dict__.get(self._attr)
+        if bound is None:
+            bound = obj.__dict__[self._attr] = BoundSignal()
+        return bound
+
+
+def _slotRef(slot):
+    """
+    a callable returning the slot, or None once it is gone. Bound methods are only weakly referenced, so that
+    connecting an object does not keep it alive, like a Qt connection to a deleted receiver
+    :param slot:
+    :return:
+    """
+    if hasattr(slot, '__self__') and hasattr(slot, '__func__'):
+        return weakref.WeakMethod(slot)
+    return lambda: slot
+
+
+class BoundSignal(object):
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(_slotRef(slot))
+
+    def disconnect(self, slot=None):
+        """
+        :param slot: the slot to disconnect, all of them if None
+        :return:
+        """
+        if slot is None:
+            self._slots = []
+            return
+
+        for ix, ref in enumerate(self._slots):
+            if ref() == slot:
+                del self._slots[ix]
+                return
+        raise ValueError('slot is not connected')
+
+    def emit(self, *args):
+        for ref in list(self._slots):
+            slot = ref()
+            if slot is None:
+                self._slots.remove(ref)
+            else:
+                slot(*args)
 #
 # import thread
 # import time
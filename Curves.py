@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Flattening of piecewise cubic Bezier curves and circles, simplification of polylines.
+
+A spline is stored as [p0, c1, c2, p1, c1, c2, p2, ...], every 3 points after the first one add a cubic segment.
+All segments are evaluated in one batch, each one with as many sub-segments as Wang's formula asks for to stay
+within the given distance of the true curve.
+"""
+
+import numpy as np
+
+DEFAULT_TOLERANCE = 0.25
+MAX_SUBDIVISIONS = 1024
+MIN_CIRCLE_SEGMENTS = 8
+MAX_CIRCLE_SEGMENTS = 4096
+# unit circle vertices by number of segments
+_circle_tables = {}
+
+
+def bezierSegments(control_points):
+    """
+    split a control point array into cubic segments
+    :param control_points: (3k + 1, 2) array, extra trailing points are ignored
+    :return: (k, 4, 2) array
+    """
+    points = np.asarray(control_points, dtype=np.float64)
+    n_segments = (len(points) - 1) // 3
+    if n_segments <= 0:
+        return np.zeros((0, 4, 2))
+
+    idx = 3 * np.arange(n_segments)[:, None] + np.arange(4)[None, :]
+    return points[idx]
+
+
+def subdivisions(segments, tolerance=DEFAULT_TOLERANCE):
+    """
+    number of straight pieces needed for each segment so that the flattened curve is within tolerance of it
+    (Wang's formula)
+    :param segments: (k, 4, 2) array
+    :param tolerance: maximum distance in pixels
+    :return: (k,) int array
+    """
+    dd = np.maximum(np.linalg.norm(segments[:, 0] - 2 * segments[:, 1] + segments[:, 2], axis=1),
+                    np.linalg.norm(segments[:, 1] - 2 * segments[:, 2] + segments[:, 3], axis=1))
+    n = np.ceil(np.sqrt(0.75 * dd / tolerance))
+    return np.clip(n, 1, MAX_SUBDIVISIONS).astype(np.int64)
+
+
+def flattenBeziers(control_points, tolerance=DEFAULT_TOLERANCE):
+    """
+    flatten a piecewise cubic Bezier curve to a polyline
+    :param control_points: (3k + 1, 2) array
+    :param tolerance: maximum distance in pixels between the polyline and the curve
+    :return: (m, 2) array, starting at the first and ending at the last on-curve point
+    """
+    segments = bezierSegments(control_points)
+    if len(segments) == 0:
+        return np.asarray(control_points, dtype=np.float64).reshape(-1, 2)[:1]
+
+    counts = subdivisions(segments, tolerance)
+    total = counts.sum()
+    seg = np.repeat(np.arange(len(segments)), counts)
+    step = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = (step / counts[seg])[:, None]
+    mt = 1 - t
+
+    p = segments[seg]
+    points = (mt ** 3) * p[:, 0] + (3 * mt * mt * t) * p[:, 1] + (3 * mt * t * t) * p[:, 2] + (t ** 3) * p[:, 3]
+    return np.vstack([points, segments[-1, 3]])
+
+
+def circleTable(n):
+    """
+    the n vertices of the unit circle, counter-clockwise from (1, 0), computed once per n
+    :param n:
+    :return: read-only (n, 2) array
+    """
+    table = _circle_tables.get(n)
+    if table is None:
+        angles = np.arange(n) * (2 * np.pi / n)
+        table = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        table.flags.writeable = False
+        _circle_tables[n] = table
+
+    return table
+
+
+def circleSegments(r, tolerance=DEFAULT_TOLERANCE):
+    """
+    number of segments of a regular polygon staying within tolerance of a circle of radius r, rounded up to a
+    multiple of 4 so that the polygon is symmetric
+    :param r:
+    :param tolerance: maximum distance in pixels
+    :return:
+    """
+    if r <= tolerance:
+        n = MIN_CIRCLE_SEGMENTS
+    else:
+        n = np.ceil(np.pi / np.arccos(1 - tolerance / float(r)))
+    n = int(np.clip(n, MIN_CIRCLE_SEGMENTS, MAX_CIRCLE_SEGMENTS))
+    return (n + 3) // 4 * 4
+
+
+def circlePolygons(center, radii, tolerance=DEFAULT_TOLERANCE):
+    """
+    polygons of concentric circles, all with the number of segments needed by the largest one. Every other circle
+    winds clockwise, so that nested circles describe rings with the usual hole orientation
+    :param center: (x, y)
+    :param radii: list of radii
+    :param tolerance: maximum distance in pixels
+    :return: (len(radii), n, 2) array
+    """
+    radii = np.asarray(radii, dtype=np.float64)
+    table = circleTable(circleSegments(radii.max() if len(radii) else 0, tolerance))
+    polies = table[None, :, :] * radii[:, None, None] + np.asarray(center, dtype=np.float64)
+    polies[1::2] = polies[1::2, ::-1]
+    return polies
+
+
+def simplifyPolyline(points, tolerance):
+    """
+    Douglas-Peucker simplification, the end points are always kept
+    :param points: (n, 2) array
+    :param tolerance: maximum distance between a removed point and the simplified polyline
+    :return: (m, 2) array, m <= n
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) <= 2 or tolerance <= 0:
+        return points
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    ranges = [(0, len(points) - 1)]
+    while len(ranges) > 0:
+        start, stop = ranges.pop()
+        if stop - start < 2:
+            continue
+
+        a = points[start]
+        d = points[stop] - a
+        rel = points[start + 1:stop] - a
+        length = np.hypot(d[0], d[1])
+        if length > 0:
+            dist = np.abs(d[0] * rel[:, 1] - d[1] * rel[:, 0]) / length
+        else:
+            dist = np.hypot(rel[:, 0], rel[:, 1])
+
+        ix = int(np.argmax(dist))
+        if dist[ix] > tolerance:
+            mid = start + 1 + ix
+            keep[mid] = True
+            ranges.append((start, mid))
+            ranges.append((mid, stop))
+
+    return points[keep]
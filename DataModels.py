@@ -3,32 +3,143 @@
 
 from abc import ABCMeta, abstractmethod
 import numpy as np
-from PyQt5.QtCore import pyqtSignal, QObject
-from skimage import draw
 import json
+import mmap
+import operator
+from collections import namedtuple
+from functools import partial
+from .Common import Signal, PointBuffer
+from .JsonStream import iterFeatures, readFeature, DEFAULT_CHUNK_SIZE
+from .Raster import rasterize, polyBounds, LAYOUT_BINARY
+from .Curves import flattenBeziers, circlePolygons, DEFAULT_TOLERANCE
+from .SpatialIndex import GridIndex, pointsInPolies
 
 
 class GeometryFactory(object):
     def __init__(self):
         pass
 
-    def createGeometry(self, geo_type, control_points):
-        if geo_type == "Polyline":
-            obj = Polyline(points=control_points)
-        elif geo_type == "Rect":
-            obj = Rect(0, 0, 0, 0)
+    def createGeometry(self, geo_type, control_points, part_types=None):
+        """
+        create a geometry from its type name and control points
+        :param geo_type: class name, e.g. "Polyline"
+        :param control_points: (n, 2) array, or a list of them for multi geometries and groups
+        :param part_types: type names of the parts of a Group
+        :return:
+        """
+        if geo_type in ("Polyline", "Polygon", "Spline", "MultiSpline", "MultiPolyline"):
+            obj = GEOMETRY_TYPES[geo_type](control_points)
+        elif geo_type == "Point":
+            x, y = np.ravel(control_points)[:2]
+            obj = Point(x, y)
+        elif geo_type == "Group":
+            obj = Group([self.createGeometry(t, cps) for t, cps in zip(part_types, control_points)])
+        elif geo_type in GEOMETRY_TYPES:
+            obj = GEOMETRY_TYPES[geo_type]()
+            obj.control_points = np.asarray(control_points)
+        else:
+            raise ValueError('unknown geometry type: %s' % geo_type)
+
+        return obj
+
+
+def translation(dx, dy):
+    """
+    :return: 3x3 affine matrix
+    """
+    return np.array([[1., 0., dx], [0., 1., dy], [0., 0., 1.]])
+
+
+def scaling(sx, sy, origin=(0, 0)):
+    """
+    :param sx:
+    :param sy:
+    :param origin: fixed point of the scaling
+    :return: 3x3 affine matrix
+    """
+    ox, oy = origin
+    return np.array([[sx, 0., ox - sx * ox], [0., sy, oy - sy * oy], [0., 0., 1.]])
+
+
+def rotation(angle, origin=(0, 0)):
+    """
+    :param angle: in degrees, clockwise on screen since y points down
+    :param origin: center of the rotation
+    :return: 3x3 affine matrix
+    """
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    ox, oy = origin
+    return np.array([[c, -s, ox - c * ox + s * oy], [s, c, oy - s * ox - c * oy], [0., 0., 1.]])
+
+
+def applyAffine(points, matrix):
+    """
+    :param points: (n, 2) or (2,) array
+    :param matrix: 2x3 or 3x3 affine matrix acting on column vectors (x, y, 1)
+    :return: transformed points, same shape
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return np.asarray(points, dtype=np.float64).dot(matrix[:2, :2].T) + matrix[:2, 2]
 
 
-class Geometry(QObject):
+# describes a change of a geometry: kind is one of the Geometry.*Changed/Inserted/Removed/Moved constants, the
+# affected control points are [start, stop) or, when given, indices
+GeometryChange = namedtuple('GeometryChange', ['kind', 'start', 'stop', 'indices'])
+GeometryChange.__new__.__defaults__ = (None,)
+
+
+class Geometry(object):
     """A region
 
+    changed is emitted with 0 for an unspecified change or with a GeometryChange
     """
-    changed = pyqtSignal(int)
+    changed = Signal(object)
     ControlPointPositionHasChanged = 0
+    ControlPointsInserted = 1
+    ControlPointsRemoved = 2
+    ControlPointsMoved = 3
+    # derived data (polygons, bounds, ...), dropped whenever the geometry changes
+    _cache = None
+    _label = ""
+    # feature properties other than the label
+    _properties = None
+    # set while the parts of a multi geometry are changed together, see _transformParts
+    _muted = False
 
     def __init__(self):
         super(Geometry, self).__init__()
 
+    def _cached(self, key, compute):
+        """
+        return derived data from the cache, computing it on the first access after a change
+        :param key:
+        :param compute: function computing the value
+        :return:
+        """
+        if self._cache is None:
+            self._cache = {}
+
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = compute()
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+            self._cache[key] = value
+            return value
+
+    def _signedAreas(self):
+        polies = [np.asarray(p, dtype=np.float64) for p in self.polies if len(p) >= 3]
+        areas, centroids = [], []
+        for p in polies:
+            x, y = p[:, 0], p[:, 1]
+            xn, yn = np.roll(x, -1), np.roll(y, -1)
+            cross = x * yn - xn * y
+            areas.append(cross.sum() / 2.)
+            centroids.append([((x + xn) * cross).sum(), ((y + yn) * cross).sum()])
+
+        return np.array(areas), np.array(centroids).reshape(-1, 2)
+
     def _toDict(self):
         return {
             "type": "Feature",
@@ -36,9 +147,7 @@ class Geometry(QObject):
                 "type": type(self).__name__,
                 "coordinates": self.control_points.tolist()
             },
-            "properties": {
-                "label": ""
-            }
+            "properties": dict({"label": self.label}, **(self.properties or {}))
         }
 
     def _fromDict(self, d):
@@ -59,10 +168,84 @@ class Geometry(QObject):
         d = json.loads(string)
         self.control_points = np.array(d['geometry']['coordinates'])
 
+    @property
+    def label(self):
+        return self._label
+
+    @label.setter
+    def label(self, value):
+        self._label = value
+
+    @property
+    def properties(self):
+        return self._properties
+
+    @properties.setter
+    def properties(self, value):
+        self._properties = value
+
+    def invalidate(self):
+        """
+        drop all cached derived data
+        :return:
+        """
+        self._cache = None
+
+    def cachedPolies(self, tolerance=DEFAULT_TOLERANCE):
+        """
+        same as toPolies, but only recomputed after the geometry has changed
+        :param tolerance:
+        :return:
+        """
+        return self._cached(('polies', tolerance), lambda: self.toPolies(tolerance))
+
+    @property
+    def polies(self):
+        return self.cachedPolies()
+
+    @property
+    def bounds(self):
+        """
+        axis-aligned bounding box of the polygons, or of the control points for geometries without area
+        :return: (xmin, ymin, xmax, ymax) or None if empty
+        """
+        def compute():
+            bounds = polyBounds(self.polies)
+            if bounds is None:
+                bounds = polyBounds([self.control_points])
+            return None if bounds is None else tuple(float(b) for b in bounds)
+
+        return self._cached('bounds', compute)
+
+    @property
+    def area(self):
+        """
+        area enclosed by the polygons, holes must wind opposite to their outline
+        :return:
+        """
+        return self._cached('area', lambda: float(abs(self._signedAreas()[0].sum())))
+
+    @property
+    def centroid(self):
+        """
+        center of mass of the polygons, mean of the control points if they have no area
+        :return: (x, y)
+        """
+        def compute():
+            areas, moments = self._signedAreas()
+            if len(areas) > 0 and areas.sum() != 0:
+                cx, cy = moments.sum(axis=0) / (6. * areas.sum())
+            else:
+                cx, cy = np.atleast_2d(self.control_points).mean(axis=0)
+            return float(cx), float(cy)
+
+        return self._cached('centroid', compute)
+
     @abstractmethod
-    def toPolies(self):
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
         """
         Convert this geometry to a set of polygons
+        :param tolerance: maximum distance in pixels between curved outlines and their polygons
         :return:
         """
 
@@ -89,34 +272,130 @@ class Geometry(QObject):
         :param change: 0 = default change
         :return:
         """
+        self.invalidate()
         self.changed.emit(change)
 
+    def transform(self, matrix):
+        """
+        apply an affine transform to the control points, listeners are notified once
+        :param matrix: 2x3 or 3x3 affine matrix acting on column vectors (x, y, 1), see translation, scaling, rotation
+        :return:
+        """
+        self.control_points = applyAffine(self.control_points, matrix)
+        self.update()
 
-class Polyline(Geometry):
-    def __init__(self, points=[[0, 0]] * 2):
-        self._points = np.atleast_2d(points)
-        # if len(self._points.shape) != 2:
-        #     raise ValueError('invalid points')
+    def _transformParts(self, matrix):
+        """
+        transform every part, notifying the listeners of this geometry once
+        :param matrix:
+        :return:
+        """
+        self._muted = True
+        try:
+            for geo in self.geos:
+                geo.transform(matrix)
+        finally:
+            self._muted = False
+        self.update()
+
+    def _partChanged(self, change=0):
+        """
+        a part of a multi geometry changed, its indices mean nothing at this level
+        """
+        if not self._muted:
+            self.update()
 
-        if self._points.shape[1] != 2:
+
+class PointsGeometry(Geometry):
+    """
+    A geometry defined by a growable array of control points, edited in place with precise change notifications
+    """
+    def __init__(self, points):
+        points = np.atleast_2d(points)
+        if points.shape[1] != 2:
             raise ValueError('only 2D points are supported')
 
-        super(Polyline, self).__init__()
+        self._buffer = PointBuffer(points)
+        super(PointsGeometry, self).__init__()
 
-    def toPolies(self):
-        return self._points[None, ...]
+    @property
+    def _points(self):
+        return self._buffer.points
 
     @property
     def control_points(self):
-        return self._points
+        return self._buffer.points
 
     @control_points.setter
     def control_points(self, points):
-        self._points = points
+        self._buffer.assign(points)
+        self.invalidate()
+
+    def appendControlPoints(self, points):
+        """
+        add points at the end, amortized O(len(points))
+        :param points: (k, 2) array-like
+        :return:
+        """
+        start, stop = self._buffer.append(points)
+        self.update(GeometryChange(self.ControlPointsInserted, start, stop))
+
+    def insertControlPoints(self, index, points):
+        """
+        :param index: position of the first new point, resolved like list.insert
+        :param points: (k, 2) array-like
+        :return:
+        """
+        start, stop = self._buffer.insert(index, points)
+        self.update(GeometryChange(self.ControlPointsInserted, start, stop))
+
+    def deleteControlPoints(self, start, stop):
+        """
+        remove the points in [start, stop), indices are resolved like those of a slice
+        :return:
+        """
+        start, stop = self._buffer.delete(start, stop)
+        self.update(GeometryChange(self.ControlPointsRemoved, start, stop))
+
+    def moveControlPoints(self, indices, points):
+        """
+        set the position of some points
+        :param indices: indices of the points
+        :param points: (len(indices), 2) array-like
+        :return:
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        self._buffer.writable()[indices] = points
+        start, stop = (int(indices.min()), int(indices.max()) + 1) if len(indices) else (0, 0)
+        self.update(GeometryChange(self.ControlPointsMoved, start, stop, indices))
+
+    def transform(self, matrix):
+        """
+        apply an affine transform to all the points, they are replaced by a new float64 array, so that arrays
+        shared with the caller are left as they were
+        :param matrix: 2x3 or 3x3 affine matrix
+        :return:
+        """
+        self._buffer.assign(applyAffine(self._buffer.points, matrix))
+        self.update(GeometryChange(self.ControlPointsMoved, 0, len(self._buffer)))
+
+
+class Polyline(PointsGeometry):
+    def __init__(self, points=[[0, 0]] * 2):
+        super(Polyline, self).__init__(points)
+
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        return self._points[None, ...]
 
     def addControlPoints(self, points):
-        self.control_points = np.concatenate([self.control_points, points])
-        self.update()
+        self.appendControlPoints(points)
+
+
+class Polygon(Polyline):
+    """
+    A closed polyline, the type name used by existing annotation files such as sample.json
+    """
+    pass
 
 
 class Rect(Geometry):
@@ -128,38 +407,52 @@ class Rect(Geometry):
     def x(self): return self._x
 
     @x.setter
-    def x(self, value): self._x = value
+    def x(self, value): self._x = value; self.invalidate()
 
     @property
     def y(self): return self._y
 
     @y.setter
-    def y(self, value): self._y = value
+    def y(self, value): self._y = value; self.invalidate()
 
     @property
     def width(self): return self._width
 
     @width.setter
-    def width(self, value): self._width = value
+    def width(self, value): self._width = value; self.invalidate()
 
     @property
     def height(self): return self._height
 
     @height.setter
-    def height(self, value): self._height = value
+    def height(self, value): self._height = value; self.invalidate()
 
     @property
     def control_points(self):
-        return np.array([[self._x, self._y], [self._x + self._width, self._y + self._height]])
+        return self._cached('control_points', lambda: np.array([[self._x, self._y],
+                                                                [self._x + self._width, self._y + self._height]]))
 
     @control_points.setter
     def control_points(self, points):
         if points.shape == (2, 2):
             self._x, self._y, self._width, self._height = \
                 points[0][0], points[0][1], abs(points[1][0] - points[0][0]), abs(points[1][1] - points[0][1])
+            self.invalidate()
 
-    def toPolies(self):
-        return np.array([])
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        x0, y0, x1, y1 = self._x, self._y, self._x + self._width, self._y + self._height
+        return np.array([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]]], dtype=np.float64)
+
+    def transform(self, matrix):
+        """
+        the rect becomes the bounding box of its transformed corners
+        :param matrix:
+        :return:
+        """
+        corners = applyAffine(self.toPolies()[0], matrix)
+        (x0, y0), (x1, y1) = corners.min(axis=0), corners.max(axis=0)
+        self._x, self._y, self._width, self._height = x0, y0, x1 - x0, y1 - y0
+        self.update()
 
 
 class Box(Rect):
@@ -169,58 +462,110 @@ class Box(Rect):
 
 class Circle(Geometry):
     def __init__(self, x=0, y=0, r=0):
-        self.x, self.y, self.r = x, y, r
+        self._x, self._y, self._r = x, y, r
         super(Circle, self).__init__()
 
+    @property
+    def x(self): return self._x
+
+    @x.setter
+    def x(self, value): self._x = value; self.invalidate()
+
+    @property
+    def y(self): return self._y
+
+    @y.setter
+    def y(self, value): self._y = value; self.invalidate()
+
+    @property
+    def r(self): return self._r
+
+    @r.setter
+    def r(self, value): self._r = value; self.invalidate()
+
     @property
     def center(self):
-        return np.array([self.x, self.y])
+        return self._cached('center', lambda: np.array([self.x, self.y]))
 
     @center.setter
     def center(self, value):
-        self.x, self.y = value[0], value[1]
+        self._x, self._y = value[0], value[1]
+        self.invalidate()
 
     @property
     def control_points(self):
-        return np.array([[self.x, self.y], [self.x + self.r, self.y]])
+        return self._cached('control_points', lambda: np.array([[self.x, self.y], [self.x + self.r, self.y]]))
 
     @control_points.setter
     def control_points(self, points):
         if len(points) >= 2:
-            self.x, self.y = points[0][0], points[0][1]
-            self.r = np.linalg.norm(points[0] - points[1])
+            self._x, self._y = points[0][0], points[0][1]
+            self._r = np.linalg.norm(points[0] - points[1])
+            self.invalidate()
             # self.update()
 
-    def toPolies(self):
-        return np.array([])
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        return circlePolygons((self.x, self.y), [self.r], tolerance)
 
 
 class Ring(Geometry):
     def __init__(self, x=0, y=0, inner_r=0, outer_r=0):
-        self.x, self.y, self.inner_r, self.outer_r = x, y, inner_r, outer_r
+        self._x, self._y, self._inner_r, self._outer_r = x, y, inner_r, outer_r
         super(Ring, self).__init__()
 
+    @property
+    def x(self): return self._x
+
+    @x.setter
+    def x(self, value): self._x = value; self.invalidate()
+
+    @property
+    def y(self): return self._y
+
+    @y.setter
+    def y(self, value): self._y = value; self.invalidate()
+
+    @property
+    def inner_r(self): return self._inner_r
+
+    @inner_r.setter
+    def inner_r(self, value): self._inner_r = value; self.invalidate()
+
+    @property
+    def outer_r(self): return self._outer_r
+
+    @outer_r.setter
+    def outer_r(self, value): self._outer_r = value; self.invalidate()
+
     @property
     def center(self):
-        return np.array([self.x, self.y])
+        return self._cached('center', lambda: np.array([self.x, self.y]))
 
     @center.setter
     def center(self, value):
-        self.x, self.y = value[0], value[1]
+        self._x, self._y = value[0], value[1]
+        self.invalidate()
 
     @property
     def control_points(self):
-        return np.array([[self.x, self.y], [self.x + self.inner_r, self.y], [self.x + self.outer_r, self.y]])
+        return self._cached('control_points', lambda: np.array([[self.x, self.y], [self.x + self.inner_r, self.y],
+                                                                [self.x + self.outer_r, self.y]]))
 
     @control_points.setter
     def control_points(self, points):
         if len(points) == 3:
-            self.x, self.y = points[0][0], points[0][1]
-            self.inner_r = np.linalg.norm(points[0] - points[1])
-            self.outer_r = np.linalg.norm(points[0] - points[2])
+            self._x, self._y = points[0][0], points[0][1]
+            self._inner_r = np.linalg.norm(points[0] - points[1])
+            self._outer_r = np.linalg.norm(points[0] - points[2])
+            self.invalidate()
 
-    def toPolies(self):
-        return np.array([])
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        """
+        the outer circle and the inner one as a hole
+        :param tolerance:
+        :return:
+        """
+        return circlePolygons((self.x, self.y), [self.outer_r, self.inner_r], tolerance)
 
 
 class Point(Geometry):
@@ -236,6 +581,7 @@ class Point(Geometry):
     @x.setter
     def x(self, value):
         self._x = value
+        self.invalidate()
 
     @property
     def y(self):
@@ -244,13 +590,21 @@ class Point(Geometry):
     @y.setter
     def y(self, value):
         self._y = value
+        self.invalidate()
 
-    def toPolies(self):
-        return np.array([[[self._x, self._y]]])
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        """
+        a pixel-sized square centered on the point, so that points show up in masks (as the pixel whose center,
+        see Raster, is the closest) and the polygon keeps the centroid of the point
+        :param tolerance:
+        :return:
+        """
+        x0, y0, x1, y1 = self._x - .5, self._y - .5, self._x + .5, self._y + .5
+        return np.array([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]]], dtype=np.float64)
 
     @property
     def control_points(self):
-        return np.array([self.x, self.y])
+        return self._cached('control_points', lambda: np.array([self.x, self.y]))
 
     @control_points.setter
     def control_points(self, point):
@@ -263,29 +617,25 @@ class Line(Polyline):
         super(Line, self).__init__([[x0, y0], [x1, y1]])
 
 
-class Spline(Geometry):
+class Spline(PointsGeometry):
     def __init__(self, points=[[0, 0]] * 4):
-        self._points = np.array(points)
-        if len(self._points.shape) != 2:
+        if np.ndim(points) != 2:
             raise ValueError('invalid points')
 
-        if self._points.shape[1] != 2:
-            raise ValueError('only 2D points are supported')
-
-        super(Spline, self).__init__()
+        super(Spline, self).__init__(points)
 
-    def toPolies(self):
-        # TODO: implement this
-        return self._points[None, ...]
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        return flattenBeziers(self._points, tolerance)[None, ...]
 
     @property
     def control_points(self):
-        return self._points
+        return self._buffer.points
 
     @control_points.setter
     def control_points(self, points):
         if len(points) >= 4:
-            self._points = np.array(points)
+            self._buffer.assign(points)
+            self.invalidate()
 
     def addControlPoints(self, points):
         if len(points) == 1:
@@ -295,9 +645,8 @@ class Spline(Geometry):
             mid_point = diff / 2 + cur_point
             c_point1 = diff * np.array([1, -1]) + mid_point
             c_point2 = diff * np.array([-1, 1]) + mid_point
-            self.control_points = np.concatenate([self.control_points, [c_point1, c_point2, end_point]])
+            self.appendControlPoints([c_point1, c_point2, end_point])
         # elif len(points) == 3:
-        self.update()
 
 
 class Group(Geometry):
@@ -307,6 +656,8 @@ class Group(Geometry):
         """
         super(Group, self).__init__()
         self._geos = geometries
+        for geo in self._geos:
+            geo.changed.connect(self._partChanged)
 
     @property
     def geos(self):
@@ -319,11 +670,14 @@ class Group(Geometry):
 
         if sum([issubclass(v.__class__, Geometry) for v in value]) == len(value):
             self._geos = value
+            for geo in self._geos:
+                geo.changed.connect(self._partChanged)
+            self.invalidate()
         else:
             raise ValueError('objects in the list must be Geometry')
 
-    def toString(self):
-        d = self._toDict()
+    def _toDict(self):
+        d = super(Group, self)._toDict()
         cps = []
         types = []
         for geo in self.geos:
@@ -331,8 +685,8 @@ class Group(Geometry):
             types.append(type(geo).__name__)
 
         d['geometry']['coordinates'] = cps
-        d['geometry']['properties']['types'] = types
-        return json.dumps(d)
+        d['properties']['types'] = types
+        return d
 
     def fromString(self, text):
         # TODO: Under construction
@@ -342,8 +696,11 @@ class Group(Geometry):
             tmp = json.dumps(feature)
             # geos.append(super())
 
-    def toPolies(self):
-        return [geo.toPolies() for geo in self.geometries]
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        return [poly for geo in self.geos for poly in geo.toPolies(tolerance)]
+
+    def transform(self, matrix):
+        self._transformParts(matrix)
 
     @property
     def control_points(self):
@@ -357,6 +714,8 @@ class MultiGeometry(Geometry):
     def __init__(self, geos):
         self._geos = geos
         super(MultiGeometry, self).__init__()
+        for geo in self._geos:
+            geo.changed.connect(self._partChanged)
 
     @property
     def geos(self):
@@ -377,10 +736,13 @@ class MultiGeometry(Geometry):
 
     @property
     def control_points(self):
-        return np.vstack([geo.control_points for geo in self._geos])
+        return self._cached('control_points', lambda: np.vstack([geo.control_points for geo in self._geos]))
 
-    def toPolies(self):
-        return np.vstack([geo.toPolies()[0] for geo in self._geos])
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        return [poly for geo in self._geos for poly in geo.toPolies(tolerance)]
+
+    def transform(self, matrix):
+        self._transformParts(matrix)
 
 
 class MultiSpline(MultiGeometry):
@@ -399,6 +761,10 @@ class MultiPolyline(Group):
         super(MultiPolyline, self).__init__(polygons)
 
 
+GEOMETRY_TYPES = {cls.__name__: cls for cls in [Polyline, Polygon, Line, Spline, Rect, Box, Circle, Ring, Point,
+                                                 Group, MultiSpline, MultiPolyline]}
+
+
 class AnnotationModel(object):
     """Model for Annotating Objects
 
@@ -406,7 +772,8 @@ class AnnotationModel(object):
     __geos__ = {'MultiSpline': MultiSpline,
                 "MultiPolyline": MultiPolyline,
                 "Spline": Spline,
-                "Polyline": Polyline}
+                "Polyline": Polyline,
+                "Polygon": Polygon}
 
     def __init__(self, regions):
         """
@@ -414,6 +781,7 @@ class AnnotationModel(object):
         :param label:
         """
         self.regions = regions
+        self._index = None
         super(AnnotationModel, self).__init__()
 
     def _toDict(self):
@@ -433,47 +801,276 @@ class AnnotationModel(object):
             json.dump(self._toDict(), fp)
 
     @staticmethod
-    def load(filename):
-        with open(filename, 'r') as fp:
-            d = json.load(fp)
-            regions = []
-            for sub_d in d['features']:
-                data = sub_d['geometry']['coordinates']
-                regions.append(AnnotationModel.__geos__[sub_d['geometry']['type']](data))
+    def _acceptFeature(feature, types=None, labels=None):
+        """
+        :param feature: a feature dict
+        :param types: geometry type names to keep, all if None
+        :param labels: labels to keep, all if None
+        :return:
+        """
+        if types is not None and feature['geometry']['type'] not in types:
+            return False
+        if labels is not None and (feature.get('properties') or {}).get('label', "") not in labels:
+            return False
+        return True
 
-        return AnnotationModel(regions)
+    @staticmethod
+    def _regionFromFeature(feature):
+        geometry = feature['geometry']
+        properties = dict(feature.get('properties') or {})
+        label = properties.pop('label', "")
+        part_types = properties.pop('types', None) if geometry['type'] == 'Group' else None
+        region = GeometryFactory().createGeometry(geometry['type'], geometry['coordinates'], part_types)
+        region.label = label
+        region.properties = properties or None
+        return region
 
-    def toMasks(self, mode='auto', shape=None):
+    @staticmethod
+    def iterLoad(filename, types=None, labels=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        parse a file incrementally and yield its regions one by one
+        :param filename:
+        :param types: geometry type names to keep, all if None
+        :param labels: labels to keep, all if None
+        :param chunk_size: number of bytes read at once
+        :return: generator of Geometry
         """
-        convert to a binary mask
-        :param mode
+        with open(filename, 'rb') as fp:
+            for feature, start, end in iterFeatures(fp, chunk_size):
+                if AnnotationModel._acceptFeature(feature, types, labels):
+                    yield AnnotationModel._regionFromFeature(feature)
+
+    @staticmethod
+    def load(filename, types=None, labels=None):
+        return AnnotationModel(list(AnnotationModel.iterLoad(filename, types, labels)))
+
+    @staticmethod
+    def loadLazy(filename, types=None, labels=None):
+        """
+        index a file without creating any region, regions are parsed on first access
+        :param filename:
+        :param types: geometry type names to keep, all if None
+        :param labels: labels to keep, all if None
+        :return: LazyAnnotationModel
+        """
+        return LazyAnnotationModel(filename, types, labels)
+
+    def _regionChanged(self, rx, change=0):
+        if self._index is not None:
+            self._index.update(rx, self.regions[rx].bounds)
+
+    @property
+    def spatial_index(self):
+        """
+        grid index of the region bounds, kept up to date through Geometry.changed; regions added, removed or
+        replaced since the last access are found by identity and indexed again
+        :return: GridIndex keyed by region index
+        """
+        if self._index is not None:
+            replaced = self._replacedRegions()
+            if len(replaced) > len(self.regions) // 2:
+                self.invalidateIndex()
+            else:
+                self._reindex(replaced)
+
+        if self._index is None:
+            boxes = [region.bounds for region in self.regions]
+            boxes = np.array([b if b is not None else (np.nan,) * 4 for b in boxes]).reshape(-1, 4)
+            self._index = GridIndex.build(range(len(boxes)), boxes)
+            self._index_regions = list(self.regions)
+            self._index_slots = []
+            for rx, region in enumerate(self._index_regions):
+                slot = partial(self._regionChanged, rx)
+                region.changed.connect(slot)
+                self._index_slots.append(slot)
+
+        return self._index
+
+    def _replacedRegions(self):
+        """
+        :return: indices of the regions that are not the ones of the index, including added and removed ones
+        """
+        n = min(len(self.regions), len(self._index_regions))
+        same = np.fromiter(map(operator.is_, self.regions, self._index_regions), dtype=bool, count=n)
+        return np.flatnonzero(~same).tolist() + list(range(n, max(len(self.regions), len(self._index_regions))))
+
+    def _reindex(self, replaced):
+        """
+        move the index and the change slots to the current regions
+        :param replaced: see _replacedRegions
+        :return:
+        """
+        regions, slots = list(self.regions), self._index_slots[:len(self.regions)]
+        slots += [None] * (len(regions) - len(slots))
+        for rx in replaced:
+            if rx < len(self._index_regions):
+                self._index_regions[rx].changed.disconnect(self._index_slots[rx])
+            if rx < len(regions):
+                slots[rx] = partial(self._regionChanged, rx)
+                regions[rx].changed.connect(slots[rx])
+                self._index.update(rx, regions[rx].bounds)
+            else:
+                self._index.remove(rx)
+
+        self._index_regions, self._index_slots = regions, slots
+
+    def invalidateIndex(self):
+        """
+        drop the spatial index, it is built again on the next access
+        :return:
+        """
+        if self._index is not None:
+            for region, slot in zip(self._index_regions, self._index_slots):
+                region.changed.disconnect(slot)
+            self._index = None
+
+    def queryRect(self, xmin, ymin, xmax, ymax):
+        """
+        regions whose bounds intersect a rectangle
+        :return: sorted region indices
+        """
+        return self.spatial_index.queryRect(xmin, ymin, xmax, ymax)
+
+    def queryPoint(self, x, y):
+        """
+        regions containing a point
+        :return: region indices, topmost (last) first
+        """
+        hits = self.spatial_index.queryPoint(x, y)
+        return [rx for rx in reversed(hits) if pointsInPolies([[x, y]], self.regions[rx].polies)[0]]
+
+    def nearest(self, x, y, k=1):
+        """
+        the k regions whose bounds are closest to a point
+        :return: list of (region index, distance), closest first
+        """
+        return self.spatial_index.nearest(x, y, k)
+
+    def _polyGroups(self, tolerance=DEFAULT_TOLERANCE):
+        """
+        flatten all regions to polygons
+        :param tolerance:
+        :return: list of polygons and the index of the region each one belongs to
+        """
+        polies, groups = [], []
+        for rx, region in enumerate(self.regions):
+            for poly in region.cachedPolies(tolerance):
+                polies.append(poly)
+                groups.append(rx)
+
+        return polies, groups
+
+    def toPolies(self, tolerance=DEFAULT_TOLERANCE):
+        """
+        Convert all regions to a flat list of polygons
+        :param tolerance: maximum distance in pixels between curved outlines and their polygons
+        :return:
+        """
+        return self._polyGroups(tolerance)[0]
+
+    def toMasks(self, mode='auto', shape=None, layout=LAYOUT_BINARY, labels=None, dtype=None, return_offset=False,
+                tolerance=DEFAULT_TOLERANCE):
+        """
+        rasterize all regions in one pass
+        :param mode: 'auto' crops the mask to the bounding box of the regions, otherwise shape is used
         :type str
-        :param shape
+        :param shape: (height, width) of the mask
+        :param layout: 'binary' (0/1), 'label' (label of the topmost region, uint16/uint32 when needed) or
+        'channels' (one binary channel per region)
+        :param labels: label of each region for the 'label' layout, defaults to region index + 1
+        :param dtype: output type
+        :param return_offset: also return the (x, y) position of the top left pixel
+        :param tolerance: maximum distance in pixels between curved outlines and their polygons
         :return:
         """
+        polies, groups = self._polyGroups(tolerance)
+        offset = (0, 0)
         if mode == 'auto':
-            polies = self.toPolies()
-            points = np.vstack(polies)
-            xmax, ymax = tuple(points.max(axis=0))
-            xmin, ymin = tuple(points.min(axis=0))
-            w, h = xmax - xmin, ymax - ymin
-
-            mask = np.zeros((ymax - ymin, xmax - xmin), dtype=np.uint8)
-            for poly in polies:
-                poly1 = poly - np.array([xmin, ymin])
-                rr, cc = draw.polygon(poly1[:, 1], poly[:, 0], shape=(h, w))
-                mask[rr, cc] = 1
+            bounds = polyBounds(polies)
+            if bounds is None:
+                mask = None
+            else:
+                xmin, ymin, xmax, ymax = bounds
+                offset = (int(np.floor(xmin)), int(np.floor(ymin)))
+                shape = (int(np.ceil(ymax)) - offset[1], int(np.ceil(xmax)) - offset[0])
+                mask = rasterize(polies, shape, groups=groups, layout=layout, labels=labels, offset=offset,
+                                 dtype=dtype, n_regions=len(self.regions))
         elif isinstance(shape, tuple):
-            mask = np.zeros(shape, dtype=np.uint8)
-            polies = self.toPolies()
-            for poly in polies:
-                rr, cc = draw.polygon(poly[:, 1], poly[:, 0], shape=shape)
-                mask[rr, cc] = 1
+            mask = rasterize(polies, shape, groups=groups, layout=layout, labels=labels, dtype=dtype,
+                             n_regions=len(self.regions))
         else:
             mask = None
 
+        if return_offset:
+            return mask, offset
         return mask
 
+class LazyRegions(object):
+    """
+    a read-only sequence of regions parsed from byte ranges of a buffer when first accessed
+    """
+    def __init__(self, buf, ranges):
+        self._buf = buf
+        self._ranges = ranges
+        self._regions = {}
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('region index out of range')
+
+        region = self._regions.get(index)
+        if region is None:
+            start, end = self._ranges[index]
+            region = AnnotationModel._regionFromFeature(readFeature(self._buf, start, end))
+            self._regions[index] = region
+
+        return region
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    def isLoaded(self, index):
+        return index in self._regions
+
+
+class LazyAnnotationModel(AnnotationModel):
+    """
+    AnnotationModel over a memory-mapped file, only the byte range of each feature is kept until it is accessed
+    """
+    def __init__(self, filename, types=None, labels=None):
+        self._fp = open(filename, 'rb')
+        try:
+            self._buf = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            ranges = [(start, end) for feature, start, end in iterFeatures(self._fp)
+                      if AnnotationModel._acceptFeature(feature, types, labels)]
+        except Exception:
+            self.close()
+            raise
+        super(LazyAnnotationModel, self).__init__(LazyRegions(self._buf, ranges))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        release the file, regions not accessed so far can no longer be loaded
+        :return:
+        """
+        buf = getattr(self, '_buf', None)
+        if buf is not None:
+            buf.close()
+        self._fp.close()
+
+
 if __name__ == '__main__':
     # polygon = Polyline([[0, 0], [10, 10]])
     # spline = MultiSpline(np.array([[[0, 0], [100, 100], [0, 150], [50, 200]],
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Export masks of many annotation files in parallel, without a GUI.
+
+    python -m pywidgets.ExportMasks annotations/ -o masks/ --layout label --workers 8
+
+Inputs are directories, files or glob patterns of GeoJSON-like (.json) or binary (.npz, see
+GeometryStore.saveBinary) annotation files. Files whose output is newer than the input are skipped. Masks cropped
+to their regions keep the position of their top left pixel: in the oFFs chunk of PNG files (see readPngOffset) and
+in the offset array of npz files.
+"""
+
+import argparse
+import glob
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from multiprocessing import Pool
+
+import numpy as np
+
+from .DataModels import AnnotationModel
+from .GeometryStore import GeometryStore
+from .Raster import LAYOUT_BINARY, LAYOUT_LABEL, LAYOUT_CHANNELS
+
+INPUT_EXTENSIONS = ('.json', '.npz')
+FORMAT_PNG = 'png'
+FORMAT_NPZ = 'npz'
+
+
+def writePng(filename, image, offset=None):
+    """
+    write a 2D uint8 or uint16 array as a grayscale PNG
+    :param filename:
+    :param image:
+    :param offset: (x, y) position of the top left pixel in pixels, stored in an oFFs chunk
+    :return:
+    """
+    image = np.asarray(image)
+    if image.ndim != 2 or image.dtype not in (np.uint8, np.uint16):
+        raise ValueError('PNG output needs a 2D uint8 or uint16 mask, got %s %s' % (image.dtype, image.shape))
+
+    h, w = image.shape
+    bit_depth = 8 * image.dtype.itemsize
+    # each row starts with filter type 0, 16 bit samples are big endian
+    rows = np.zeros((h, 1 + w * image.dtype.itemsize), dtype=np.uint8)
+    rows[:, 1:] = image.astype(image.dtype.newbyteorder('>'), copy=False).view(np.uint8).reshape(h, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(filename, 'wb') as fp:
+        fp.write(b'\x89PNG\r\n\x1a\n')
+        fp.write(chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, bit_depth, 0, 0, 0, 0)))
+        if offset is not None:
+            # unit 0: pixels
+            fp.write(chunk(b'oFFs', struct.pack('>iiB', int(offset[0]), int(offset[1]), 0)))
+        fp.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        fp.write(chunk(b'IEND', b''))
+
+
+def readPngOffset(filename):
+    """
+    :param filename: a PNG file
+    :return: (x, y) from the oFFs chunk, (0, 0) if there is none
+    """
+    with open(filename, 'rb') as fp:
+        if fp.read(8) != b'\x89PNG\r\n\x1a\n':
+            raise ValueError('%s is not a PNG file' % filename)
+        while True:
+            header = fp.read(8)
+            if len(header) < 8:
+                return 0, 0
+            length, tag = struct.unpack('>I', header[:4])[0], header[4:]
+            if tag == b'oFFs':
+                x, y, _ = struct.unpack('>iiB', fp.read(length))
+                return x, y
+            if tag in (b'IDAT', b'IEND'):
+                return 0, 0
+            fp.seek(length + 4, os.SEEK_CUR)
+
+
+def loadModel(filename):
+    if filename.endswith('.npz'):
+        return GeometryStore.loadBinary(filename).toModel()
+    return AnnotationModel.load(filename)
+
+
+def findInputs(patterns):
+    """
+    expand directories and glob patterns to a sorted list of annotation files
+    :param patterns:
+    :return:
+    """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        for filename in glob.glob(pattern):
+            if os.path.isfile(filename) and filename.endswith(INPUT_EXTENSIONS):
+                files.add(filename)
+
+    return sorted(files)
+
+
+def outputNames(inputs, output_dir, fmt):
+    """
+    output file of each input. Inputs sharing a stem (same name in different directories, or a .json and a .npz)
+    are numbered in the order of their paths, so that they do not overwrite each other
+    :param inputs: list of distinct annotation files
+    :param output_dir:
+    :param fmt:
+    :return: list of output files, in the order of inputs
+    """
+    groups = {}
+    for filename in inputs:
+        groups.setdefault(os.path.splitext(os.path.basename(filename))[0], []).append(filename)
+
+    used = set(stem for stem, group in groups.items() if len(group) == 1)
+    stems = {}
+    for stem, group in sorted(groups.items()):
+        if len(group) == 1:
+            stems[group[0]] = stem
+            continue
+
+        ix = 0
+        for filename in sorted(group):
+            while '%s_%d' % (stem, ix) in used:
+                ix += 1
+            stems[filename] = '%s_%d' % (stem, ix)
+            used.add(stems[filename])
+
+    return [os.path.join(output_dir, '%s.%s' % (stems[filename], fmt)) for filename in inputs]
+
+
+def isUpToDate(src, dst):
+    return os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src)
+
+
+def exportOne(job):
+    """
+    rasterize one annotation file, run in the worker processes
+    :param job: (input file, output file, options dict)
+    :return: (input file, number of pixels written, error message or None)
+    """
+    src, dst, options = job
+    try:
+        model = loadModel(src)
+        mask, offset = model.toMasks(mode=options['mode'], shape=options['shape'], layout=options['layout'],
+                                     return_offset=True)
+        if mask is None:
+            return src, 0, 'no regions'
+
+        tmp = dst + '.tmp'
+        if options['format'] == FORMAT_PNG:
+            writePng(tmp, mask, offset)
+        else:
+            with open(tmp, 'wb') as fp:
+                np.savez_compressed(fp, mask=mask, offset=np.array(offset))
+        os.replace(tmp, dst)
+        return src, int(mask.size), None
+    except Exception as e:
+        return src, 0, '%s: %s' % (type(e).__name__, e)
+
+
+def exportMasks(inputs, output_dir, fmt=FORMAT_PNG, layout=LAYOUT_BINARY, mode='auto', shape=None, workers=None,
+                chunk_size=1, force=False, log=sys.stderr):
+    """
+    export the masks of many annotation files with a process pool
+    :param inputs: list of annotation files
+    :param output_dir:
+    :param fmt: 'png' or 'npz'
+    :param layout: see AnnotationModel.toMasks
+    :param mode: see AnnotationModel.toMasks
+    :param shape: (height, width), used when mode is not 'auto'
+    :param workers: number of processes, all cores by default, 1 runs in this process
+    :param chunk_size: number of files handed to a worker at once
+    :param force: also export files whose output is newer than the input
+    :param log: stream for progress messages, None to stay quiet
+    :return: list of (input file, error message) for the files that failed
+    """
+    if fmt == FORMAT_PNG and layout == LAYOUT_CHANNELS:
+        raise ValueError('the channels layout can only be written as npz')
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    options = {'format': fmt, 'layout': layout, 'mode': mode, 'shape': shape}
+    # an input given twice would be written twice to the same file
+    inputs = list(OrderedDict.fromkeys(inputs))
+    jobs = [(src, dst, options) for src, dst in zip(inputs, outputNames(inputs, output_dir, fmt))]
+    skipped = 0 if force else sum(isUpToDate(src, dst) for src, dst, _ in jobs)
+    if not force:
+        jobs = [job for job in jobs if not isUpToDate(job[0], job[1])]
+
+    if log is not None:
+        log.write('%d files to export, %d up to date\n' % (len(jobs), skipped))
+
+    failed = []
+    pixels = 0
+    start = time.time()
+    pool = Pool(workers) if workers != 1 and len(jobs) > 1 else None
+    try:
+        results = pool.imap_unordered(exportOne, jobs, chunk_size) if pool is not None else map(exportOne, jobs)
+        for ix, (src, n_pixels, error) in enumerate(results):
+            pixels += n_pixels
+            if error is not None:
+                failed.append((src, error))
+            if log is not None:
+                elapsed = max(time.time() - start, 1e-9)
+                log.write('[%d/%d] %s %s (%.1f files/s, %.1f Mpx/s)\n' % (
+                    ix + 1, len(jobs), src, 'FAILED ' + error if error else 'ok', (ix + 1) / elapsed,
+                    pixels / elapsed / 1e6))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if log is not None:
+        log.write('exported %d files in %.1fs, %d failed\n' % (len(jobs) - len(failed), time.time() - start,
+                                                                len(failed)))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export masks of annotation files in parallel.')
+    parser.add_argument('inputs', nargs='+', help='annotation files, directories or glob patterns')
+    parser.add_argument('-o', '--output', required=True, help='output directory')
+    parser.add_argument('-f', '--format', choices=[FORMAT_PNG, FORMAT_NPZ], default=FORMAT_PNG)
+    parser.add_argument('-l', '--layout', choices=[LAYOUT_BINARY, LAYOUT_LABEL, LAYOUT_CHANNELS],
+                        default=LAYOUT_BINARY)
+    parser.add_argument('--shape', type=int, nargs=2, metavar=('HEIGHT', 'WIDTH'),
+                        help='full mask size, by default masks are cropped to the regions')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes, default: all cores')
+    parser.add_argument('-c', '--chunk-size', type=int, default=1, help='files handed to a worker at once')
+    parser.add_argument('--force', action='store_true', help='also export files whose output is up to date')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    inputs = findInputs(args.inputs)
+    shape = tuple(args.shape) if args.shape else None
+    failed = exportMasks(inputs, args.output, fmt=args.format, layout=args.layout,
+                         mode='shape' if shape else 'auto', shape=shape, workers=args.workers,
+                         chunk_size=args.chunk_size, force=args.force, log=None if args.quiet else sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
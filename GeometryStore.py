@@ -0,0 +1,571 @@
+# -*- coding: utf-8 -*-
+"""
+Struct-of-arrays storage for large numbers of geometries.
+
+All control points live in one contiguous (n, 2) coordinate buffer. Regions are made of parts (a Spline has one
+part, a MultiSpline or a Group one per member), parts are ranges of the buffer. Geometry objects are only created
+when a region is accessed and, for Polyline and Spline, their control points are views into the buffer.
+"""
+
+import os
+import json
+import struct
+import zipfile
+import numpy as np
+
+from .DataModels import Geometry, MultiGeometry, Group, GeometryFactory, AnnotationModel, translation, scaling
+from .JsonStream import iterFeatures
+
+# nesting depth of the GeoJSON coordinates of a region
+DEPTH_POSITION = 1
+DEPTH_PART = 2
+DEPTH_PARTS = 3
+
+# types whose bounds are not those of their control points, see GeometryStore.bounds
+ROUND_TYPES = ('Circle', 'Ring')
+
+BINARY_FORMAT_VERSION = 1
+_BINARY_ARRAYS = ['coords', 'part_offsets', 'part_types', 'region_offsets', 'types', 'depths', 'labels']
+
+
+def _depth(coordinates):
+    depth = 0
+    while isinstance(coordinates, (list, tuple, np.ndarray)):
+        depth += 1
+        if len(coordinates) == 0:
+            break
+        coordinates = coordinates[0]
+
+    return depth
+
+
+def _mapNpzMember(filename, info):
+    """
+    memory-map an array stored uncompressed in a .npz file (np.load ignores mmap_mode for archives)
+    :param filename:
+    :param info: ZipInfo of the member
+    :return: copy-on-write memmap
+    """
+    with open(filename, 'rb') as fp:
+        fp.seek(info.header_offset)
+        header = fp.read(30)
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        fp.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+        offset = fp.tell()
+
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='c', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+class PackedJson(object):
+    """
+    a read-only list of JSON values stored as one byte array and offsets, values are decoded on access
+    """
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        if start == end:
+            return None
+        return json.loads(bytes(self._data[start:end]).decode('utf-8'))
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    @staticmethod
+    def pack(values):
+        """
+        :param values: list of JSON-serializable values, None values take no space
+        :return: uint8 data array and int64 offsets
+        """
+        chunks = [b'' if v is None else json.dumps(v).encode('utf-8') for v in values]
+        offsets = np.concatenate([[0], np.cumsum([len(c) for c in chunks])]).astype(np.int64)
+        return np.frombuffer(b''.join(chunks), dtype=np.uint8), offsets
+
+
+class StringTable(object):
+    """
+    names stored once and referred to by integer codes
+    """
+    def __init__(self, names=()):
+        self._names = list(names)
+        self._codes = {name: ix for ix, name in enumerate(self._names)}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, code):
+        return self._names[code]
+
+    @property
+    def names(self):
+        return self._names
+
+    def code(self, name):
+        """
+        code of a name, the name is added if missing
+        :param name:
+        :return:
+        """
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self._names)
+            self._names.append(name)
+        return code
+
+
+def _geometryParts(geo):
+    """
+    control points of each part of a geometry
+    :param geo:
+    :return: list of (n, 2) arrays, list of part type names and the coordinate depth
+    """
+    if isinstance(geo, (MultiGeometry, Group)):
+        return ([np.atleast_2d(g.control_points) for g in geo.geos], [type(g).__name__ for g in geo.geos],
+                DEPTH_PARTS)
+
+    depth = DEPTH_POSITION if np.ndim(geo.control_points) == 1 else DEPTH_PART
+    return [np.atleast_2d(geo.control_points)], [type(geo).__name__], depth
+
+
+class GeometryStore(object):
+    """
+    Many geometries stored as columns: coordinates, part offsets, region offsets, types and labels
+    """
+    def __init__(self):
+        self._coords = np.zeros((0, 2))
+        self._part_offsets = np.zeros(1, dtype=np.int64)
+        self._part_types = np.zeros(0, dtype=np.int32)
+        self._region_offsets = np.zeros(1, dtype=np.int64)
+        self._types = np.zeros(0, dtype=np.int32)
+        self._depths = np.zeros(0, dtype=np.int8)
+        self._labels = np.zeros(0, dtype=np.int32)
+        # string tables for the type and label codes
+        self._type_names = StringTable()
+        self._label_names = StringTable()
+        # feature properties other than the label, None for regions without any
+        self._properties = []
+        # whether all coordinates were given as integers, so that they are written back as such
+        self._integral = True
+        # geometries created so far, by region index
+        self._geos = {}
+        self._factory = GeometryFactory()
+
+    def __len__(self):
+        return len(self._types)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('region index out of range')
+
+        geo = self._geos.get(index)
+        if geo is None:
+            geo = self._createGeometry(index)
+            self._geos[index] = geo
+
+        return geo
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    @property
+    def coords(self):
+        return self._coords
+
+    @property
+    def part_offsets(self):
+        return self._part_offsets
+
+    @property
+    def region_offsets(self):
+        return self._region_offsets
+
+    @property
+    def type_names(self):
+        return np.array(self._type_names.names, dtype=object)[self._types]
+
+    @property
+    def labels(self):
+        return np.array(self._label_names.names, dtype=object)[self._labels]
+
+    @property
+    def n_points(self):
+        return len(self._coords)
+
+    def _regionRanges(self):
+        """
+        :return: first and last (exclusive) coordinate of each region
+        """
+        return self._part_offsets[self._region_offsets[:-1]], self._part_offsets[self._region_offsets[1:]]
+
+    def _partViews(self, index):
+        p0, p1 = self._region_offsets[index], self._region_offsets[index + 1]
+        return [self._coords[self._part_offsets[p]:self._part_offsets[p + 1]] for p in range(p0, p1)]
+
+    def _createGeometry(self, index):
+        parts = self._partViews(index)
+        type_name = self._type_names[self._types[index]]
+        if self._depths[index] == DEPTH_PARTS:
+            p0, p1 = self._region_offsets[index], self._region_offsets[index + 1]
+            part_types = [self._type_names[t] for t in self._part_types[p0:p1]]
+            geo = self._factory.createGeometry(type_name, parts, part_types)
+        else:
+            geo = self._factory.createGeometry(type_name, parts[0])
+
+        geo.label = self._label_names[self._labels[index]]
+        if self._properties[index] is not None:
+            geo.properties = dict(self._properties[index])
+        return geo
+
+    def _extend(self, records):
+        """
+        append regions in one go
+        :param records: list of (type name, parts, part type names, depth, label, properties)
+        :return:
+        """
+        if len(records) == 0:
+            return
+
+        parts = [np.asarray(p).reshape(-1, 2) for r in records for p in r[1]]
+        part_sizes = np.array([len(p) for p in parts], dtype=np.int64)
+        region_sizes = np.array([len(r[1]) for r in records], dtype=np.int64)
+
+        self._integral = self._integral and all(p.dtype.kind in 'iu' for p in parts)
+        self._coords = np.concatenate([self._coords] + parts).astype(np.float64, copy=False)
+        self._part_offsets = np.concatenate([self._part_offsets, self._part_offsets[-1] + np.cumsum(part_sizes)])
+        self._region_offsets = np.concatenate([self._region_offsets,
+                                               self._region_offsets[-1] + np.cumsum(region_sizes)])
+        self._part_types = np.concatenate([self._part_types, np.array(
+            [self._type_names.code(t) for r in records for t in r[2]], dtype=np.int32)])
+        self._types = np.concatenate([self._types, np.array(
+            [self._type_names.code(r[0]) for r in records], dtype=np.int32)])
+        self._depths = np.concatenate([self._depths, np.array([r[3] for r in records], dtype=np.int8)])
+        self._labels = np.concatenate([self._labels, np.array(
+            [self._label_names.code(r[4]) for r in records], dtype=np.int32)])
+        self._properties = list(self._properties) + [r[5] for r in records]
+
+    def _sync(self):
+        """
+        write the control points of the geometries created so far back to the buffer, regions whose number of
+        points changed are re-packed
+        :return:
+        """
+        resized = {}
+        for ix, geo in self._geos.items():
+            parts, part_types, depth = _geometryParts(geo)
+            self._labels[ix] = self._label_names.code(geo.label)
+            views = self._partViews(ix)
+            if [len(p) for p in parts] == [len(v) for v in views]:
+                for view, part in zip(views, parts):
+                    view[...] = part
+            else:
+                resized[ix] = parts, [self._type_names.code(t) for t in part_types]
+
+        if len(resized) == 0:
+            return
+
+        # rebuild the buffer from unchanged slices and resized regions, then point every geometry at it again
+        chunks, part_types, region_sizes = [], [], []
+        for ix in range(len(self)):
+            if ix in resized:
+                parts, types = resized[ix]
+            else:
+                p0, p1 = self._region_offsets[ix], self._region_offsets[ix + 1]
+                parts, types = self._partViews(ix), self._part_types[p0:p1].tolist()
+            chunks += parts
+            part_types += types
+            region_sizes.append(len(parts))
+
+        self._coords = np.concatenate([np.zeros((0, 2))] + [np.asarray(c, dtype=np.float64) for c in chunks])
+        self._part_offsets = np.concatenate([[0], np.cumsum([len(c) for c in chunks])]).astype(np.int64)
+        self._region_offsets = np.concatenate([[0], np.cumsum(region_sizes)]).astype(np.int64)
+        self._part_types = np.array(part_types, dtype=np.int32)
+        self._refresh(list(self._geos))
+
+    def _refresh(self, indices):
+        """
+        reload geometries from the buffer and notify their listeners
+        :param indices: region indices
+        :return:
+        """
+        for ix in indices:
+            geo = self._geos.get(ix)
+            if geo is None:
+                continue
+
+            views = self._partViews(ix)
+            if isinstance(geo, (MultiGeometry, Group)):
+                for g, view in zip(geo.geos, views):
+                    g.control_points = view if np.ndim(g.control_points) == 2 else view[0]
+            else:
+                geo.control_points = views[0] if self._depths[ix] != DEPTH_POSITION else views[0][0]
+            geo.update()
+
+    @staticmethod
+    def fromRegions(regions):
+        """
+        build a store from geometries
+        :param regions: iterable of Geometry
+        :return:
+        """
+        store = GeometryStore()
+        records = []
+        for geo in regions:
+            parts, part_types, depth = _geometryParts(geo)
+            records.append((type(geo).__name__, parts, part_types, depth, geo.label, geo.properties))
+        store._extend(records)
+        return store
+
+    @staticmethod
+    def fromModel(model):
+        return GeometryStore.fromRegions(model.regions)
+
+    @staticmethod
+    def fromDict(d):
+        """
+        build a store from a GeoJSON-like FeatureCollection
+        :param d:
+        :return:
+        """
+        return GeometryStore.fromFeatures(d['features'])
+
+    @staticmethod
+    def fromFeatures(features):
+        """
+        build a store from GeoJSON-like features
+        :param features: iterable of feature dicts
+        :return:
+        """
+        store = GeometryStore()
+        records = []
+        for feature in features:
+            geometry = feature['geometry']
+            properties = dict(feature.get('properties') or {})
+            label = properties.pop('label', "")
+            coordinates = geometry['coordinates']
+            depth = _depth(coordinates)
+            if depth == DEPTH_PARTS:
+                parts = coordinates
+                part_types = properties.pop('types', None) or [geometry['type']] * len(parts)
+            else:
+                parts = [np.reshape(coordinates, (-1, 2))]
+                part_types = [geometry['type']]
+            records.append((geometry['type'], parts, part_types, depth, label, properties or None))
+        store._extend(records)
+        return store
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'rb') as fp:
+            return GeometryStore.fromFeatures(feature for feature, start, end in iterFeatures(fp))
+
+    def saveBinary(self, filename):
+        """
+        write the columns to an uncompressed .npz file, see loadBinary
+        :param filename: may be the file this store was memory-mapped from, it is only replaced once written
+        :return:
+        """
+        self._sync()
+        properties, properties_offsets = PackedJson.pack(list(self._properties))
+        arrays = {name: getattr(self, '_' + name) for name in _BINARY_ARRAYS}
+        arrays.update(type_names=np.array(self._type_names.names, dtype=np.str_),
+                      label_names=np.array(self._label_names.names, dtype=np.str_),
+                      properties=properties, properties_offsets=properties_offsets,
+                      integral=np.array(self._integral), format_version=np.array(BINARY_FORMAT_VERSION))
+        # truncating a memory-mapped file would pull the pages from under the columns
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as fp:
+            np.savez(fp, **arrays)
+        os.replace(tmp, filename)
+
+    @staticmethod
+    def loadBinary(filename, mmap=True):
+        """
+        open a file written by saveBinary
+        :param filename:
+        :param mmap: memory-map the columns (copy-on-write) instead of reading them, so opening costs nothing until
+        regions are touched
+        :return:
+        """
+        arrays = {}
+        with zipfile.ZipFile(filename) as zf:
+            for info in zf.infolist():
+                name = info.filename[:-len('.npy')]
+                if mmap and info.compress_type == zipfile.ZIP_STORED:
+                    arrays[name] = _mapNpzMember(filename, info)
+                else:
+                    with zf.open(info) as fp:
+                        arrays[name] = np.lib.format.read_array(fp)
+
+        if int(arrays['format_version']) > BINARY_FORMAT_VERSION:
+            raise ValueError('unsupported format version %d' % int(arrays['format_version']))
+
+        store = GeometryStore()
+        for name in _BINARY_ARRAYS:
+            setattr(store, '_' + name, arrays[name])
+        store._type_names = StringTable(arrays['type_names'].tolist())
+        store._label_names = StringTable(arrays['label_names'].tolist())
+        store._properties = PackedJson(arrays['properties'], arrays['properties_offsets'])
+        store._integral = bool(arrays['integral'])
+        return store
+
+    def append(self, geo):
+        """
+        add a geometry at the end of the store
+        :param geo:
+        :return: index of the new region
+        """
+        self._sync()
+        parts, part_types, depth = _geometryParts(geo)
+        self._extend([(type(geo).__name__, parts, part_types, depth, geo.label, geo.properties)])
+        self._geos[len(self) - 1] = geo
+        # the buffer has been re-allocated
+        self._refresh([ix for ix in self._geos if ix != len(self) - 1])
+        return len(self) - 1
+
+    def toModel(self):
+        """
+        an AnnotationModel whose regions are created lazily from this store
+        :return:
+        """
+        return AnnotationModel(self)
+
+    def regionIndex(self):
+        """
+        :return: the region index of every coordinate
+        """
+        starts, stops = self._regionRanges()
+        return np.repeat(np.arange(len(self)), stops - starts)
+
+    def transform(self, matrix, regions=None):
+        """
+        apply an affine transform to all the control points at once
+        :param matrix: 2x3 or 3x3 affine matrix acting on column vectors (x, y, 1)
+        :param regions: indices of the regions to transform, all by default
+        :return:
+        """
+        self._sync()
+        matrix = np.asarray(matrix, dtype=np.float64)
+        a, t = matrix[:2, :2], matrix[:2, 2]
+        if regions is None:
+            self._coords[...] = self._coords.dot(a.T) + t
+            self._refresh(list(self._geos))
+        else:
+            selected = np.zeros(len(self), dtype=bool)
+            selected[regions] = True
+            rows = selected[self.regionIndex()]
+            self._coords[rows] = self._coords[rows].dot(a.T) + t
+            self._refresh([ix for ix in self._geos if selected[ix]])
+
+    def translate(self, dx, dy, regions=None):
+        self.transform(translation(dx, dy), regions)
+
+    def scale(self, sx, sy, origin=(0, 0), regions=None):
+        self.transform(scaling(sx, sy, origin), regions)
+
+    def _partBounds(self):
+        """
+        bounding box of every part, see bounds
+        :return: (n_parts, 4) array of xmin, ymin, xmax, ymax, NaN for parts without points
+        """
+        starts, stops = self._part_offsets[:-1], self._part_offsets[1:]
+        result = np.full((len(starts), 4), np.nan)
+        filled = stops > starts
+        if filled.any():
+            # empty parts have no coordinates, so each filled part runs up to the start of the next one
+            result[filled, :2] = np.minimum.reduceat(self._coords, starts[filled], axis=0)
+            result[filled, 2:] = np.maximum.reduceat(self._coords, starts[filled], axis=0)
+
+        # the control points of circles and rings are the center followed by a point on each circle
+        codes = [self._type_names.names.index(name) for name in ROUND_TYPES if name in self._type_names.names]
+        round_parts = np.flatnonzero(np.isin(self._part_types, codes) & filled)
+        if len(round_parts) > 0:
+            first, sizes = starts[round_parts], (stops - starts)[round_parts]
+            heads = np.cumsum(sizes) - sizes
+            points = np.arange(sizes.sum()) - np.repeat(heads, sizes) + np.repeat(first, sizes)
+            centers = self._coords[first]
+            radii = np.maximum.reduceat(np.linalg.norm(self._coords[points] - np.repeat(centers, sizes, axis=0),
+                                                       axis=1), heads)
+            result[round_parts] = np.hstack([centers - radii[:, None], centers + radii[:, None]])
+        return result
+
+    def bounds(self):
+        """
+        bounding box of every region: of the control points, which contain the curve for splines, and of the whole
+        disk for circles and rings
+        :return: (n_regions, 4) array of xmin, ymin, xmax, ymax, NaN for regions without points
+        """
+        self._sync()
+        part_bounds = self._partBounds()
+        starts, stops = self._region_offsets[:-1], self._region_offsets[1:]
+        result = np.full((len(self), 4), np.nan)
+        filled = stops > starts
+        if filled.any():
+            # fmin and fmax skip the NaN bounds of empty parts
+            result[filled, :2] = np.fmin.reduceat(part_bounds[:, :2], starts[filled], axis=0)
+            result[filled, 2:] = np.fmax.reduceat(part_bounds[:, 2:], starts[filled], axis=0)
+        return result
+
+    def _toDict(self):
+        self._sync()
+        if self._integral and np.array_equal(self._coords, np.round(self._coords)):
+            coords = self._coords.astype(np.int64).tolist()
+        else:
+            coords = self._coords.tolist()
+        offsets = self._part_offsets.tolist()
+        region_offsets = self._region_offsets.tolist()
+        label_names = self._label_names
+        type_names = self._type_names
+        features = []
+        for ix in range(len(self)):
+            p0, p1 = region_offsets[ix], region_offsets[ix + 1]
+            parts = [coords[offsets[p]:offsets[p + 1]] for p in range(p0, p1)]
+            depth = self._depths[ix]
+            if depth == DEPTH_PARTS:
+                coordinates = parts
+            elif depth == DEPTH_POSITION:
+                coordinates = parts[0][0]
+            else:
+                coordinates = parts[0]
+
+            properties = {"label": label_names[self._labels[ix]]}
+            if type_names[self._types[ix]] == "Group":
+                properties["types"] = [type_names[t] for t in self._part_types[p0:p1]]
+            if self._properties[ix] is not None:
+                properties.update(self._properties[ix])
+            features.append({
+                "type": "Feature",
+                "geometry": {
+                    "type": type_names[self._types[ix]],
+                    "coordinates": coordinates
+                },
+                "properties": properties
+            })
+
+        return {
+            "type": "FeatureCollection",
+            "features": features
+        }
+
+    def toString(self):
+        return json.dumps(self._toDict())
+
+    def save(self, filename):
+        with open(filename, 'w') as fp:
+            json.dump(self._toDict(), fp)
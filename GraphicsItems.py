@@ -6,13 +6,14 @@ Created on Tue Sep  8 07:32:13 2015
 """
 
 from PyQt5 import QtGui
-from PyQt5.QtCore import (QPointF, QRectF, Qt)
+from PyQt5.QtCore import (QPointF, QRectF, Qt, QTimer)
 from PyQt5.QtGui import (QColor, QBrush, QFont, QPen, QTransform, QPainterPath)
 from PyQt5.QtWidgets import (QGraphicsScene, QGraphicsItem, QGraphicsTextItem)
 
 from .DataModels import *
 from .Common import *
-from .Utils import _NP, _QP
+from .Utils import _NP, _QP, _QPolygon
+from .Curves import flattenBeziers, simplifyPolyline
 
 DEFAULT_COLOR = QColor(255, 255, 150, 50)
 DEFAULT_HIGH_COLOR = Qt.yellow
@@ -26,10 +27,54 @@ DEFAULT_ANN_EDGE_WIDTH = 1.5
 DEFAULT_IDMAN = IDManager()
 
 
+class LodThresholds(object):
+    """
+    Level of detail settings of the items of a scene. A level is the scale from item to device coordinates, 1 at
+    100% zoom
+    """
+    def __init__(self, handles=0.5, labels=0.25, collapse_size=4., tolerance=0.5):
+        """
+        :param handles: handles and spline tangents are not drawn below this level
+        :param labels: labels are not drawn below this level
+        :param collapse_size: items smaller than this on screen, in pixels, are drawn as a point or a box
+        :param tolerance: distance on screen, in pixels, allowed when simplifying outlines
+        """
+        self.handles = handles
+        self.labels = labels
+        self.collapse_size = collapse_size
+        self.tolerance = tolerance
+
+
+DEFAULT_LOD_THRESHOLDS = LodThresholds()
+
+
+# changes moving the scene bounding rect of an item
+_SCENE_BOUNDS_CHANGES = (QGraphicsItem.ItemScenePositionHasChanged, QGraphicsItem.ItemTransformHasChanged,
+                         QGraphicsItem.ItemRotationHasChanged, QGraphicsItem.ItemScaleHasChanged,
+                         QGraphicsItem.ItemTransformOriginPointHasChanged)
+
+
+def _levelOfDetail(painter, option):
+    if option is None:
+        return 1.
+    return option.levelOfDetailFromTransform(painter.worldTransform())
+
+
 def dataModel2GraphicsItem(model):
+    """
+    graphics item class of a data model
+    :param model: class name of a Geometry, or a Geometry whose class or closest base class has an item
+    :return: the item class, None if a Geometry has none
+    """
     if isinstance(model, str):
         return globals()[model + 'Item']
 
+    for cls in type(model).__mro__:
+        item_class = globals().get(cls.__name__ + 'Item')
+        if item_class is not None and issubclass(item_class, ControllableItem) and item_class is not ControllableItem:
+            return item_class
+    return None
+
 
 class ControllableItem(QGraphicsItem):
     """ A controllable graphics item has handles
@@ -40,7 +85,7 @@ class ControllableItem(QGraphicsItem):
 
     def __init__(self, model, color=DEFAULT_COLOR, parent=None, label="item", handle_size=DEFAULT_HANDLE_SIZE,
                  handle_color=DEFAULT_HANDLE_COLOR,
-                 edge_color=DEFAULT_EDGE_COLOR, edge_width=DEFAULT_EDGE_WIDTH):
+                 edge_color=DEFAULT_EDGE_COLOR, edge_width=DEFAULT_EDGE_WIDTH, batch_handles=False):
         """
         :param model: must be a subclass of DataModels.Geometry
         :param color: fill color
@@ -50,6 +95,8 @@ class ControllableItem(QGraphicsItem):
         :param handle_color: color of the handles
         :param edge_color:
         :param edge_width:
+        :param batch_handles: draw all the handles at once instead of using one HandleItem per control point, a
+                              real handle is only created under the cursor
         """
         super(ControllableItem, self).__init__(parent)
         # if not issubclass(model.__class__, Geometry):
@@ -59,6 +106,28 @@ class ControllableItem(QGraphicsItem):
         self._model.changed.connect(self.modelChanged)
 
         self._controls = []
+        # positions of the handles, in the same order as self._controls
+        self._handle_points = np.zeros((0, 2))
+        # hidden handles kept for reuse
+        self._handle_pool = []
+        # set while handles are moved to follow the model, so that they do not write back to it
+        self._syncing = False
+        # indices of the handles dragged since the model was last written, see _commitHandles
+        self._moved_handles = set()
+        self._commit_pending = False
+        self._batch_handles = batch_handles
+        # in batch mode, the only HandleItem, under the cursor
+        self._live_handle = None
+        # in batch mode, the handle positions ready to be drawn
+        self._handle_polygon = None
+        self._handles_hidden = False
+        # set while the level of detail of the last paint is below the handles threshold, see _setLodHandlesHidden
+        self._lod_handles_hidden = False
+        # painter paths built from the control points, see _buildPaths
+        self._paths = None
+        # simplified outlines by level of detail tier, see lodPath
+        self._lod_paths = {}
+        self._highlighted = False
         self._handle_size = handle_size
         self._handle_color = handle_color
         self._color = color
@@ -73,11 +142,16 @@ class ControllableItem(QGraphicsItem):
         #               QGraphicsItem.ItemIsSelectable |
         #               QGraphicsItem.ItemSendsGeometryChanges |
         #               QGraphicsItem.ItemIsFocusable)
+        # the scene bounds of the item, see PickIndex, change with its position and transform and with those of its
+        # ancestors
+        self.setFlags(self.flags() | QGraphicsItem.ItemIsSelectable | QGraphicsItem.ItemSendsGeometryChanges |
+                      QGraphicsItem.ItemSendsScenePositionChanges)
+        self.setAcceptHoverEvents(batch_handles)
 
         # create handles from control points
         self.control_points = self.model.control_points
 
-        self._label = QGraphicsTextItem(label, self)
+        self._label = LabelItem(label, self)
         self._label.setPos(QPointF(self.rect.x(), self.rect.y()))
         self._label.setFont(QFont('', 40))
 
@@ -87,17 +161,27 @@ class ControllableItem(QGraphicsItem):
         """
         tell the inner model to update itself with new control points, also notifies other Items sharing this model
         :param change:
-        :param value:
+        :param value: for HandlePositionHasChanged, indices of the moved control points, None if any may have moved
         :return:
         """
         if change == self.HandlePositionHasChanged:
-            self.model.control_points = self.control_points
+            points = self.control_points
+            if value is not None and isinstance(self.model, PointsGeometry) and \
+                    len(self.model.control_points) == len(points):
+                self.model.moveControlPoints(value, points[value])
+            else:
+                self.model.control_points = points[0] if np.ndim(self.model.control_points) == 1 else points
+                self.model.update()
+            self._updateRect()
             self.update()
+        elif change in _SCENE_BOUNDS_CHANGES:
+            self._updatePickIndex()
 
         return super(ControllableItem, self).itemChange(change, value)
 
     def modelChanged(self, change=0):
-        self.control_points = self.model.control_points
+        self._syncHandles(self.model.control_points, change)
+        self.update()
         # print('model changed')
 
     @property
@@ -106,7 +190,23 @@ class ControllableItem(QGraphicsItem):
 
     @rect.setter
     def rect(self, value):
-        self._rect = value
+        if value != self._rect:
+            # keeps the scene index valid
+            self.prepareGeometryChange()
+            self._rect = value
+            self._updatePickIndex()
+            # a group covers its parts
+            parent = self.parentItem()
+            if isinstance(parent, GroupItem):
+                parent._updateRect()
+
+    def _updatePickIndex(self):
+        """
+        keep the scene index valid after the scene bounds changed
+        """
+        pick_index = getattr(self.scene(), 'pick_index', None)
+        if pick_index is not None:
+            pick_index.update(self)
 
     @property
     def model(self):
@@ -137,6 +237,7 @@ class ControllableItem(QGraphicsItem):
     @edge_width.setter
     def edge_width(self, value):
         self._edge_width = value
+        self._updateRect()
 
     @property
     def half_edge_width(self):
@@ -175,6 +276,7 @@ class ControllableItem(QGraphicsItem):
     @handle_size.setter
     def handle_size(self, value):
         self._handle_size = value
+        self._updateRect()
         self.update()
 
     @property
@@ -190,24 +292,30 @@ class ControllableItem(QGraphicsItem):
     def controls(self):
         return self._controls
 
+    @property
+    def highlighted(self):
+        return self._highlighted
+
+    @highlighted.setter
+    def highlighted(self, value):
+        if value != self._highlighted:
+            self._highlighted = value
+            self.update()
+
+    @property
+    def batch_handles(self):
+        return self._batch_handles
+
     @property
     def control_points(self):
         """
         :return: control points from self._controls
         """
-        return np.array([[cp.x(), cp.y()] for cp in self._controls])
+        return self._handle_points.copy()
 
     @control_points.setter
     def control_points(self, points):
-        for ctr in self._controls:
-            self.scene().removeItem(ctr)
-            del ctr
-
-        self._controls = []
-        for cp in points:
-            self.addHandle(cp)
-
-        self._updateRect()
+        self._syncHandles(points)
 
     @abstractmethod
     def _paintMe(self, qp, option, widget):
@@ -219,6 +327,68 @@ class ControllableItem(QGraphicsItem):
         :return:
         """
 
+    def _buildPaths(self):
+        """
+        painter paths of this item, the first one is its shape. Subclasses drawing paths should impl this
+        :return: tuple of QPainterPath, or None
+        """
+        return None
+
+    @property
+    def paths(self):
+        """
+        :return: painter paths from _buildPaths, rebuilt only after the control points changed
+        """
+        if self._paths is None:
+            self._paths = self._buildPaths()
+        return self._paths
+
+    def _invalidatePaths(self):
+        self._paths = None
+        self._lod_paths = {}
+
+    def _simplified(self, tolerance):
+        """
+        outline of this item with fewer points, for low levels of detail. Subclasses drawing paths should impl this
+        :param tolerance: in item coordinates
+        :return: (n, 2) array, or None
+        """
+        return None
+
+    def lodPath(self, lod):
+        """
+        simplified outline for a level of detail, cached per power of two of the zoom out factor
+        :param lod: level of detail, see LodThresholds
+        :return: QPainterPath, None at full detail or if the item cannot be simplified
+        """
+        if lod >= 1:
+            return None
+
+        tier = int(np.ceil(-np.log2(lod)))
+        if tier not in self._lod_paths:
+            # the scale is at least 2 ** (tier - 1) here
+            points = self._simplified(self.lod_thresholds.tolerance * 2 ** (tier - 1))
+            path = None
+            if points is not None:
+                path = QPainterPath()
+                path.addPolygon(_QPolygon(points))
+            self._lod_paths[tier] = path
+
+        return self._lod_paths[tier]
+
+    @property
+    def lod_thresholds(self):
+        """
+        :return: LodThresholds of the scene, defaults if the scene has none
+        """
+        return getattr(self.scene(), 'lod_thresholds', DEFAULT_LOD_THRESHOLDS)
+
+    def shape(self):
+        paths = self.paths
+        if paths is None:
+            return super(ControllableItem, self).shape()
+        return paths[0]
+
     @abstractmethod
     def _updateRect(self):
         """
@@ -226,77 +396,386 @@ class ControllableItem(QGraphicsItem):
         :return:
         """
 
+    def _takeHandle(self, pos):
+        """
+        a handle from the pool, or a new one
+        :param pos:
+        :return:
+        """
+        if len(self._handle_pool) > 0:
+            control = self._handle_pool.pop()
+            syncing, self._syncing = self._syncing, True
+            control.setPos(_QP(pos))
+            self._syncing = syncing
+        else:
+            control = HandleItem(_QP(pos), parent=self, color=self.handle_color)
+        control.setVisible(not self._handles_hidden)
+        control.setEnabled(not self._lod_handles_hidden)
+        return control
+
+    def _releaseHandles(self, controls):
+        for control in controls:
+            control.setVisible(False)
+        self._handle_pool += controls
+
+    def _renumberHandles(self, start=0):
+        for ix in range(start, len(self._controls)):
+            self._controls[ix].index = ix
+
+    def _syncHandles(self, points, change=0):
+        """
+        make the handles follow the control points, reusing existing handles and only moving those whose position
+        changed
+        :param points: control points of the model
+        :param change: GeometryChange describing the change, if known
+        :return:
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64)).reshape(-1, 2)
+        self._syncing = True
+        try:
+            kind = getattr(change, 'kind', None)
+            if self._batch_handles:
+                self._handle_points = points.copy()
+                self._handle_polygon = None
+                self._syncLiveHandle()
+            elif kind == Geometry.ControlPointsInserted and len(points) == len(self._controls) + change.stop - \
+                    change.start:
+                new = [self._takeHandle(p) for p in points[change.start:change.stop]]
+                self._controls[change.start:change.start] = new
+                self._handle_points = np.insert(self._handle_points, change.start, points[change.start:change.stop],
+                                                axis=0)
+                self._renumberHandles(change.start)
+            elif kind == Geometry.ControlPointsRemoved and len(points) == len(self._controls) - change.stop + \
+                    change.start:
+                self._releaseHandles(self._controls[change.start:change.stop])
+                del self._controls[change.start:change.stop]
+                self._handle_points = np.delete(self._handle_points, np.s_[change.start:change.stop], axis=0)
+                self._renumberHandles(change.start)
+            elif len(points) != len(self._controls):
+                n = min(len(points), len(self._controls))
+                self._releaseHandles(self._controls[n:])
+                del self._controls[n:]
+                self._controls += [self._takeHandle(p) for p in points[n:]]
+                self._handle_points = np.concatenate([self._handle_points[:n], points[n:]])
+                self._renumberHandles(n)
+
+            # move the handles which are not where the model says
+            moved = np.nonzero((self._handle_points != points).any(axis=1))[0]
+            for ix in moved:
+                self._controls[ix].setPos(_QP(points[ix]))
+            self._handle_points[moved] = points[moved]
+        finally:
+            self._syncing = False
+
+        self._invalidatePaths()
+        self._updateRect()
+
+    def _handleMoved(self, handle, pos):
+        """
+        called by a handle which is about to move
+        :param handle:
+        :param pos: new position
+        :return:
+        """
+        if self._syncing:
+            return
+
+        self._handle_points[handle.index] = pos.x(), pos.y()
+        self._handle_polygon = None
+        self._invalidatePaths()
+        self.update()
+
+        # the model is written once per event loop iteration, however many handles moved
+        self._moved_handles.add(handle.index)
+        if not self._commit_pending:
+            self._commit_pending = True
+            QTimer.singleShot(0, self._commitHandles)
+
+    def _commitHandles(self):
+        """
+        write the positions of the handles dragged since the last call to the model, with a single change
+        :return:
+        """
+        self._commit_pending = False
+        if len(self._moved_handles) == 0:
+            return
+
+        indices = np.array(sorted(self._moved_handles))
+        self._moved_handles.clear()
+        self.itemChange(self.HandlePositionHasChanged, indices[indices < len(self._handle_points)])
+
+    def flushHandles(self):
+        """
+        write pending handle moves to the model now rather than at the next event loop iteration
+        :return:
+        """
+        self._commitHandles()
+
+    def _syncLiveHandle(self):
+        handle = self._live_handle
+        if handle is None:
+            return
+
+        if handle.index < len(self._handle_points) and not self._handles_hidden:
+            handle.setPos(_QP(self._handle_points[handle.index]))
+        else:
+            self._releaseLiveHandle()
+
+    def _releaseLiveHandle(self):
+        if self._live_handle is not None:
+            self._releaseHandles([self._live_handle])
+            self._live_handle = None
+
+    def handleAt(self, pos):
+        """
+        nearest control point within a handle size of a position
+        :param pos: QPointF in item coordinates
+        :return: index of the control point, None if there is none
+        """
+        if len(self._handle_points) == 0 or self._handles_hidden or self._lod_handles_hidden:
+            return None
+
+        d2 = ((self._handle_points - (pos.x(), pos.y())) ** 2).sum(axis=1)
+        ix = int(np.argmin(d2))
+        return ix if d2[ix] <= self.handle_size ** 2 else None
+
+    def _pickHandle(self, pos):
+        """
+        in batch mode, put the real handle on the control point under the cursor
+        :param pos:
+        :return:
+        """
+        ix = self.handleAt(pos)
+        if ix is None:
+            self._releaseLiveHandle()
+            return
+
+        if self._live_handle is None:
+            self._live_handle = self._takeHandle(self._handle_points[ix])
+        elif self._live_handle.index != ix:
+            self._syncing = True
+            self._live_handle.setPos(_QP(self._handle_points[ix]))
+            self._syncing = False
+        self._live_handle.index = ix
+
+    def hoverMoveEvent(self, e):
+        if self._batch_handles:
+            self._pickHandle(e.pos())
+        super(ControllableItem, self).hoverMoveEvent(e)
+
+    def hoverLeaveEvent(self, e):
+        if self._batch_handles and (self.scene() is None or self.scene().mouseGrabberItem() is not self._live_handle):
+            self._releaseLiveHandle()
+        super(ControllableItem, self).hoverLeaveEvent(e)
+
     def _adjustEdge(self, rect):
         """
         adjust bounding rect to
         :param rect:
         :return:
         """
-        return rect.adjusted(-self.half_edge_width, -self.half_edge_width, self.half_edge_width, self.half_edge_width)
+        margin = self.half_edge_width
+        if self._batch_handles:
+            # the handles are drawn by this item
+            margin += self.handle_size
+        return rect.adjusted(-margin, -margin, margin, margin)
 
     def addHandle(self, pos):
-        control = HandleItem(_QP(pos), parent=self, color=self.handle_color)
+        control = self._takeHandle(pos)
+        control.index = len(self._controls)
         self._controls.append(control)
+        self._handle_points = np.concatenate([self._handle_points, np.reshape(pos, (1, 2))])
         return control
 
     def hideHandles(self):
         for c in self._controls:
             c.setVisible(False)
+        self._handles_hidden = True
+        self._releaseLiveHandle()
+        self.update()
+
+    def showHandles(self):
+        for c in self._controls:
+            c.setVisible(True)
+        self._handles_hidden = False
+        self.update()
+
+    def _setLodHandlesHidden(self, hidden):
+        """
+        handles are not drawn below the handles level of detail, they are disabled then so that they cannot be hit
+        or dragged either. The level is the one of the last paint, i.e. of the view that last drew this item
+        :param hidden:
+        :return:
+        """
+        if hidden == self._lod_handles_hidden:
+            return
+
+        self._lod_handles_hidden = hidden
+        for c in self._controls:
+            c.setEnabled(not hidden)
+        if hidden:
+            self._releaseLiveHandle()
+
+    def _paintHandles(self, qp):
+        """
+        draw all the handles with a single call, in batch mode
+        :param qp:
+        :return:
+        """
+        if self._handles_hidden or len(self._handle_points) == 0:
+            return
+
+        if self._handle_polygon is None:
+            self._handle_polygon = _QPolygon(self._handle_points)
+        qp.setPen(QPen(QBrush(self.handle_color), 2 * self.handle_size, Qt.SolidLine, Qt.RoundCap))
+        qp.drawPoints(self._handle_polygon)
+
+    def _paintCollapsed(self, qp, rect, lod):
+        """
+        draw an item too small to be seen in detail as a point or a box
+        :param qp:
+        :param rect: bounding rect
+        :param lod: level of detail
+        :return:
+        """
+        qp.setPen(QPen(QBrush(self.edge_color), 0))
+        qp.setBrush(QBrush(self.color, Qt.SolidPattern))
+        if max(rect.width(), rect.height()) * lod < 1:
+            qp.drawPoint(rect.center())
+        else:
+            qp.drawRect(rect)
 
     def paint(self, qp, option, widget=None):
+        lod = _levelOfDetail(qp, option)
+        thresholds = self.lod_thresholds
+        self._setLodHandlesHidden(lod < thresholds.handles)
+        rect = self.boundingRect()
+        if max(rect.width(), rect.height()) * lod < thresholds.collapse_size:
+            self._paintCollapsed(qp, rect, lod)
+            return
+
         qp.setPen(QPen(QBrush(self.edge_color), self.edge_width))
         qp.setBrush(QBrush(self.color, Qt.SolidPattern))
         self._paintMe(qp, option, widget)
-        for c in self._controls:
-            c.paint(qp, option, widget)
+        if self._batch_handles and lod >= thresholds.handles:
+            self._paintHandles(qp)
+
+        if self._highlighted:
+            qp.setPen(QPen(QBrush(DEFAULT_HIGH_EDGE_COLOR), self.edge_width))
+            qp.setBrush(Qt.NoBrush)
+            qp.drawPath(self.shape())
 
-        self.label.paint(qp, option, widget)
         if self.isSelected():
             qp.setPen(QPen(QBrush(self.color), self.edge_width, Qt.DotLine))
             qp.drawRect(self.boundingRect())
 
     def boundingRect(self):
-        self._updateRect()
+        """
+        :return: the rect computed by _updateRect when the control points changed
+        """
         return self.rect
 
+    def transformBy(self, matrix):
+        """
+        apply an affine transform to the model, the handles follow with a single resync
+        :param matrix: 2x3 or 3x3 affine matrix, see DataModels.translation, scaling and rotation
+        :return:
+        """
+        self.flushHandles()
+        self.model.transform(matrix)
+
     def moveBy(self, dx, dy):
-        for control in self.controls:
-            control.setPos(control.x() + dx, control.y() + dy)
+        self.transformBy(translation(dx, dy))
 
     def scaleBy(self, sx, sy):
-        for control in self.controls:
-            control.setPos(control.x() * sx, control.y() * sy)
+        self.transformBy(scaling(sx, sy))
+
+    def rotateBy(self, angle, origin=None):
+        """
+        :param angle: in degrees
+        :param origin: center of the rotation, the centroid of the model by default
+        :return:
+        """
+        self.transformBy(rotation(angle, self.model.centroid if origin is None else origin))
+
+
+def transformItems(items, matrix):
+    """
+    apply an affine transform to many items, e.g. a selection. Models shared by several items are transformed once
+    :param items: ControllableItems
+    :param matrix: 2x3 or 3x3 affine matrix
+    :return:
+    """
+    models = {}
+    for item in items:
+        item.flushHandles()
+        models[id(item.model)] = item.model
+
+    for model in models.values():
+        model.transform(matrix)
 
 
 class GroupItem(ControllableItem):
     def __init__(self, items, **kwargs):
-        model = Group([item.model for item in items])
+        """
+        :param items: ControllableItems to group, or a Group or MultiGeometry whose parts each get an item, e.g.
+        from loadModel
+        :param kwargs: see ControllableItem
+        """
+        if isinstance(items, (Group, MultiGeometry)):
+            model = items
+            classes = [dataModel2GraphicsItem(geo) for geo in model.geos]
+            items = [cls(geo) for cls, geo in zip(classes, model.geos) if cls is not None]
+        else:
+            model = Group([item.model for item in items])
         super(GroupItem, self).__init__(model, **kwargs)
         for item in items:
             item.setParentItem(self)
+        self._updateRect()
 
     def mousePressEvent(self, e):
         for ch in self.childItems():
             self.scene().sendEvent(ch, e)
             
+    def _parts(self):
+        """
+        the grouped items, without the label and handles
+        """
+        return [item for item in self.childItems() if isinstance(item, ControllableItem)]
+
+    def _syncHandles(self, points, change=0):
+        """
+        the parts have their own handles and follow their own models, which are only synced after the group model
+        is notified: the rect is updated by the parts, see ControllableItem.rect
+        """
+        self._invalidatePaths()
+
+    def _buildPaths(self):
+        """
+        :return: the shapes of the parts
+        """
+        path = QPainterPath()
+        for item in self._parts():
+            path.addPath(item.mapToParent(item.shape()))
+        return path,
+
     def _updateRect(self):
-        x1, y1, x2, y2 = [], [], [], []
-        for item in self.childItems():
-            x1.append(item.boundingRect().x())
-            y1.append(item.boundingRect().y())
-            x2.append(item.boundingRect().right())
-            y2.append(item.boundingRect().bottom())
-        if len(x1) > 0:    
-            self.rect = QRectF(min(x1), min(y1), max(x2) - min(x1), max(y2) - min(y1))
-        else:
-            self.rect = QRectF(self.x(), self.y(), 100, 100)
-            
+        """
+        the union of the rects of the parts, called again by the parts whenever their rect changes
+        """
+        rect = QRectF()
+        for item in self._parts():
+            rect = rect.united(item.mapRectToParent(item.boundingRect()))
+        self._invalidatePaths()
+        self.rect = rect
+
     def _paintMe(self, painter, option, widget=None):
-        for child in self.childItems():
+        for child in self._parts():
             child._paintMe(painter, option, widget)
     
     def addItem(self, item):
         item.setParentItem(self)
+        self._updateRect()
         if self.scene() is not None:
             self.scene().activeSubItem = item
         return item
@@ -323,21 +802,34 @@ class GroupItem(ControllableItem):
     #     return points
 
 
+class MultiGeometryItem(GroupItem):
+    """
+    a MultiSpline or another multi geometry, drawn as a group with one item per part
+    """
+    pass
+
+
 class PolylineItem(ControllableItem):
+    def _buildPaths(self):
+        path = QPainterPath()
+        path.addPolygon(_QPolygon(self._handle_points))
+        return path,
+
+    def _simplified(self, tolerance):
+        return simplifyPolyline(self._handle_points, tolerance)
+
     def _paintMe(self, qp, option, widget=None):
+        path = self.lodPath(_levelOfDetail(qp, option))
         qp.setPen(QPen(QBrush(self.edge_color), 5))
-        qp.drawPolyline(*[c.pos() for c in self.controls])
+        qp.setBrush(Qt.NoBrush)
+        qp.drawPath(path if path is not None else self.paths[0])
 
     def _updateRect(self):
-        pos = self.model.control_points
-        if len(pos) > 0:
-            xmax, xmin, ymax, ymin = pos[:, 0].max(), pos[:, 0].min(), pos[:, 1].max(), pos[:, 1].min()
+        bounds = self.model.bounds
+        if bounds is not None:
+            xmin, ymin, xmax, ymax = bounds
             self.rect = self._adjustEdge(QRectF(xmin, ymin, xmax - xmin, ymax - ymin))
 
-    def boundingRect(self):
-        self._updateRect()
-        return self.rect
-
     def mousePressEvent(self, e):
         if e.button() == 1 and e.modifiers() == Qt.ControlModifier:
             self.model.addControlPoints(_NP(e.scenePos())[None, ...])
@@ -390,62 +882,92 @@ class SRectItem(ControllableItem):
 
 
 class SplineItem(ControllableItem):
-    def _paintMe(self, qp, option, widget=None):
-        path = QPainterPath(_QP(self.model.control_points[0]))
+    def _buildPaths(self):
+        """
+        :return: the curve and the tangents at its on-curve points
+        """
+        points = [_QP(p) for p in self._handle_points]
+        if len(points) == 0:
+            return QPainterPath(), QPainterPath()
+
+        path = QPainterPath(points[0])
         ann_path = QPainterPath()
-        cur_point = 0
-        while cur_point < len(self.model.control_points) - 1:
-            path.cubicTo(_QP(self.model.control_points[cur_point + 1]),
-                         _QP(self.model.control_points[cur_point + 2]),
-                         _QP(self.model.control_points[cur_point + 3]))
+        for cur_point in range(0, len(points) - 3, 3):
+            path.cubicTo(points[cur_point + 1], points[cur_point + 2], points[cur_point + 3])
 
-            ann_path.moveTo(_QP(self.model.control_points[cur_point + 0]))
-            ann_path.lineTo(_QP(self.model.control_points[cur_point + 1]))
-            ann_path.moveTo(_QP(self.model.control_points[cur_point + 3]))
-            ann_path.lineTo(_QP(self.model.control_points[cur_point + 2]))
+            ann_path.moveTo(points[cur_point + 0])
+            ann_path.lineTo(points[cur_point + 1])
+            ann_path.moveTo(points[cur_point + 3])
+            ann_path.lineTo(points[cur_point + 2])
 
-            cur_point += 3
+        return path, ann_path
 
-        qp.drawPath(path)
-        qp.setPen(QPen(DEFAULT_ANN_EDGE_STYLE))
-        qp.drawPath(ann_path)
+    def _simplified(self, tolerance):
+        if len(self._handle_points) == 0:
+            return None
+        return simplifyPolyline(flattenBeziers(self._handle_points, tolerance / 2.), tolerance / 2.)
+
+    def _paintMe(self, qp, option, widget=None):
+        lod = _levelOfDetail(qp, option)
+        lod_path = self.lodPath(lod)
+        path, ann_path = self.paths
+        qp.drawPath(lod_path if lod_path is not None else path)
+        if lod >= self.lod_thresholds.handles:
+            qp.setPen(QPen(DEFAULT_ANN_EDGE_STYLE))
+            qp.drawPath(ann_path)
 
     def __len__(self):
-        return len(self.controls)
+        return len(self._handle_points)
 
     def _updateRect(self):
-        pos = self.model.toPolies()[0]
-        xmax, xmin, ymax, ymin = pos[:, 0].max(), pos[:, 0].min(), pos[:, 1].max(), pos[:, 1].min()
-        self.rect = self._adjustEdge(QRectF(xmin, ymin, xmax - xmin, ymax - ymin))
-
-    def boundingRect(self):
-        self._updateRect()
-        return self.rect
+        bounds = self.model.bounds
+        if bounds is not None:
+            xmin, ymin, xmax, ymax = bounds
+            self.rect = self._adjustEdge(QRectF(xmin, ymin, xmax - xmin, ymax - ymin))
 
     def mousePressEvent(self, e):
         if e.button() == 1 and e.modifiers() == Qt.ControlModifier:
             self.model.addControlPoints(_NP(e.scenePos())[None, :])
 
         
+class LabelItem(QGraphicsTextItem):
+    """
+    Label of a ControllableItem, not drawn at low levels of detail
+    """
+    def paint(self, painter, option, widget=None):
+        parent = self.parentItem()
+        if isinstance(parent, ControllableItem) and \
+                _levelOfDetail(painter, option) < parent.lod_thresholds.labels:
+            return
+        super(LabelItem, self).paint(painter, option, widget)
+
+
 class HandleItem(QGraphicsItem):
     def __init__(self, position, size=DEFAULT_HANDLE_SIZE, parent=None, color=Qt.green):
         super(HandleItem, self).__init__(parent)
-        self.setPos(position)
         self.size = size
         self.color = color
+        self.rect = QRectF(0, 0, size, size)
+        # position of this handle in its parent's control points
+        self.index = 0
+        self.setPos(position)
         self.idd = DEFAULT_IDMAN.next()
         # self.setZValue(10)
         self.setFlags(self.flags() |
                       QGraphicsItem.ItemIsMovable |
                       QGraphicsItem.ItemSendsGeometryChanges |
                       QGraphicsItem.ItemIsFocusable)
-        self.rect = QRectF(0, 0, size, size)
                     
     def boundingRect(self):
         size = self.size
         return self.rect.adjusted(-size,-size,0,0)
         
     def paint(self, painter, option, widget=None):
+        parent = self.parentItem()
+        if isinstance(parent, ControllableItem) and \
+                _levelOfDetail(painter, option) < parent.lod_thresholds.handles:
+            return
+
         qp = painter
         qp.setPen(QtGui.QColor(168, 34, 3))
         qp.setBrush(QBrush(self.color, Qt.SolidPattern))
@@ -464,7 +986,7 @@ class HandleItem(QGraphicsItem):
             
     def itemChange(self, change, value):
         if change == QGraphicsItem.ItemPositionChange:
-            self.parentItem().itemChange(ControllableItem.HandlePositionHasChanged, value)
+            self.parentItem()._handleMoved(self, value)
         return super(HandleItem, self).itemChange(change, value)
         
     def setSize(self, size):
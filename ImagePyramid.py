@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Tiled, multi-resolution background images too large to be held as a single QImage.
+
+Level 0 is the full resolution image, every next level is half the size of the previous one. Levels are any
+array-like supporting 2D slicing (numpy arrays, np.memmap, np.load(mmap_mode='r'), zarr or h5py datasets), so
+only the pixels of the tiles being drawn are read. Decoded tiles are kept in an LRU cache bounded in bytes, and a
+background thread loads the visible tiles and prefetches the ones around them.
+
+    pyramid = ImagePyramid(TileSource.fromFiles(savePyramid(np.load('slide.npy', mmap_mode='r'), 'slide')))
+    scene.setBackgroundPyramid(pyramid)
+"""
+
+import itertools
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import QObject, QRectF, pyqtSignal
+from PyQt5.QtGui import QImage
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_CACHE_BYTES = 256 << 20
+# tiles prefetched around the viewport, in tiles
+DEFAULT_PREFETCH_MARGIN = 1
+# rows of the finer level read at once by savePyramid
+PYRAMID_CHUNK_ROWS = 1024
+PRIORITY_VISIBLE = 0
+PRIORITY_PREFETCH = 1
+
+_IMAGE_FORMATS = {1: QImage.Format_Grayscale8, 3: QImage.Format_RGB888, 4: QImage.Format_RGBA8888}
+
+
+def _channels(shape):
+    return 1 if len(shape) == 2 else shape[2]
+
+
+def _toQImage(pixels):
+    """
+    QImage owning a copy of a (h, w), (h, w, 3) or (h, w, 4) uint8 array
+    :param pixels:
+    :return:
+    """
+    pixels = np.ascontiguousarray(pixels)
+    h, w = pixels.shape[:2]
+    image = QImage(pixels.data, w, h, pixels.strides[0], _IMAGE_FORMATS[_channels(pixels.shape)])
+    return image.copy()
+
+
+def savePyramid(array, prefix, tile_size=DEFAULT_TILE_SIZE):
+    """
+    write the levels of a pyramid as .npy files, each level being the 2x2 average of the previous one. The image is
+    read PYRAMID_CHUNK_ROWS rows at a time, so it can be a memory-mapped file larger than the memory
+    :param array: (h, w[, c]) uint8 array-like, level 0
+    :param prefix: the levels are written to prefix_1.npy, prefix_2.npy, ...
+    :param tile_size: levels are built until one fits in a tile
+    :return: list of file names, level 0 excluded
+    """
+    filenames = []
+    level = array
+    chunk = PYRAMID_CHUNK_ROWS - PYRAMID_CHUNK_ROWS % 2
+    while max(level.shape[:2]) > tile_size:
+        h, w = level.shape[:2]
+        filename = '%s_%d.npy' % (prefix, len(filenames) + 1)
+        coarser = np.lib.format.open_memmap(filename, mode='w+', dtype=np.uint8,
+                                            shape=((h + 1) // 2, (w + 1) // 2) + tuple(level.shape[2:]))
+        for y0 in range(0, h, chunk):
+            rows = np.asarray(level[y0:y0 + chunk], dtype=np.uint16)
+            # repeat the last row and column of odd sizes so that every output pixel averages 2x2 pixels
+            if len(rows) % 2:
+                rows = np.concatenate([rows, rows[-1:]])
+            if w % 2:
+                rows = np.concatenate([rows, rows[:, -1:]], axis=1)
+            total = rows[0::2, 0::2] + rows[1::2, 0::2] + rows[0::2, 1::2] + rows[1::2, 1::2]
+            coarser[y0 // 2:y0 // 2 + len(total)] = (total + 2) // 4
+
+        coarser.flush()
+        filenames.append(filename)
+        level = coarser
+
+    return filenames
+
+
+class TileSource(object):
+    """
+    The levels of an image, read one tile at a time
+    """
+    def __init__(self, levels, tile_size=DEFAULT_TILE_SIZE):
+        """
+        :param levels: array-like of (h, w), (h, w, 3) or (h, w, 4) uint8 pixels, or a list of them starting at full
+                       resolution, each one half the size of the previous one. Missing coarser levels are read by
+                       skipping pixels of the last given level
+        :param tile_size: in pixels
+        """
+        if not isinstance(levels, (list, tuple)):
+            levels = [levels]
+        if len(levels) == 0:
+            raise ValueError('no image')
+
+        for level in levels:
+            if level.dtype != np.uint8 or len(level.shape) not in (2, 3) or \
+                    _channels(level.shape) not in _IMAGE_FORMATS:
+                raise ValueError('levels must be uint8 arrays of shape (h, w), (h, w, 3) or (h, w, 4)')
+
+        self._levels = list(levels)
+        self._tile_size = tile_size
+        h, w = levels[0].shape[:2]
+        self._n_levels = max(len(levels), int(np.ceil(np.log2(max(h, w, tile_size) / float(tile_size)))) + 1)
+        # objects the levels depend on, e.g. the QImage whose pixels they view
+        self._owners = []
+
+    @staticmethod
+    def fromImage(image, tile_size=DEFAULT_TILE_SIZE):
+        """
+        view the pixels of a QImage without copying them
+        :param image: QImage
+        :param tile_size:
+        :return:
+        """
+        if image.format() not in (QImage.Format_Grayscale8, QImage.Format_RGBA8888):
+            image = image.convertToFormat(QImage.Format_RGBA8888)
+        channels = 1 if image.format() == QImage.Format_Grayscale8 else 4
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        rows = np.frombuffer(bits, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+        pixels = rows[:, :image.width() * channels].reshape(image.height(), image.width(), channels)
+        if channels == 1:
+            pixels = pixels[:, :, 0]
+
+        source = TileSource(pixels, tile_size)
+        source._owners.append(image)
+        return source
+
+    @staticmethod
+    def fromFiles(filenames, tile_size=DEFAULT_TILE_SIZE):
+        """
+        memory-map .npy levels, e.g. written by savePyramid
+        :param filenames: level 0 first
+        :param tile_size:
+        :return:
+        """
+        return TileSource([np.load(filename, mmap_mode='r') for filename in filenames], tile_size)
+
+    @staticmethod
+    def create(image, tile_size=DEFAULT_TILE_SIZE):
+        """
+        :param image: TileSource, QImage, array-like or list of array-likes
+        :param tile_size:
+        :return:
+        """
+        if isinstance(image, TileSource):
+            return image
+        if isinstance(image, QImage):
+            return TileSource.fromImage(image, tile_size)
+        return TileSource(image, tile_size)
+
+    @property
+    def tile_size(self):
+        return self._tile_size
+
+    @property
+    def n_levels(self):
+        return self._n_levels
+
+    @property
+    def shape(self):
+        """
+        :return: (height, width) of the full resolution image
+        """
+        return tuple(self._levels[0].shape[:2])
+
+    def levelShape(self, level):
+        h, w = self.shape
+        f = 2 ** level
+        return (h + f - 1) // f, (w + f - 1) // f
+
+    def tileCounts(self, level):
+        """
+        :return: number of tile rows and columns of a level
+        """
+        h, w = self.levelShape(level)
+        ts = self._tile_size
+        return (h + ts - 1) // ts, (w + ts - 1) // ts
+
+    def readTile(self, level, tx, ty):
+        """
+        :param level:
+        :param tx: column of the tile
+        :param ty: row of the tile
+        :return: uint8 array of the tile pixels, smaller than tile_size at the right and bottom edges
+        """
+        ts = self._tile_size
+        h, w = self.levelShape(level)
+        y0, y1, x0, x1 = ty * ts, min((ty + 1) * ts, h), tx * ts, min((tx + 1) * ts, w)
+        base = min(level, len(self._levels) - 1)
+        step = 2 ** (level - base)
+        return np.asarray(self._levels[base][y0 * step:y1 * step:step, x0 * step:x1 * step:step])
+
+
+class TileCache(object):
+    """
+    Least recently used tiles, up to a total size in bytes. Thread safe
+    """
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self._max_bytes = max_bytes
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._tiles
+
+    @property
+    def n_bytes(self):
+        return self._bytes
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def get(self, key):
+        """
+        :param key:
+        :return: the tile, marked as most recently used, or None
+        """
+        with self._lock:
+            image = self._tiles.get(key)
+            if image is not None:
+                self._tiles.move_to_end(key)
+            return image
+
+    def peek(self, key):
+        """
+        the tile without changing its rank
+        """
+        with self._lock:
+            return self._tiles.get(key)
+
+    def put(self, key, image):
+        with self._lock:
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self._bytes -= old.byteCount()
+            self._tiles[key] = image
+            self._bytes += image.byteCount()
+            while self._bytes > self._max_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self._bytes -= evicted.byteCount()
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._bytes = 0
+
+
+class ImagePyramid(QObject):
+    """
+    Draws the tiles of a TileSource at the level matching the zoom, loading them in a background thread
+    """
+    # a tile was loaded, with its rect in scene coordinates. Emitted from the loading thread
+    tileLoaded = pyqtSignal(QRectF)
+
+    def __init__(self, source, cache_bytes=DEFAULT_CACHE_BYTES, prefetch_margin=DEFAULT_PREFETCH_MARGIN,
+                 threaded=True, parent=None):
+        """
+        :param source: TileSource, or anything TileSource.create accepts
+        :param cache_bytes: size of the tile cache
+        :param prefetch_margin: number of tiles loaded around the visible ones
+        :param threaded: load tiles in a background thread, otherwise while painting
+        :param parent:
+        """
+        super(ImagePyramid, self).__init__(parent)
+        self._source = TileSource.create(source)
+        self._cache = TileCache(cache_bytes)
+        self._prefetch_margin = prefetch_margin
+        self._threaded = threaded
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        # requests made for an older view are dropped by the loading thread
+        self._generation = 0
+        # key -> (generation, priority) of the tiles queued and not loaded yet, so that repaints do not queue them
+        # again
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # level and visible tile range of the last paint, the generation changes with it
+        self._view = None
+        self._thread = None
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def rect(self):
+        """
+        :return: the image extent in scene coordinates
+        """
+        h, w = self._source.shape
+        return QRectF(0, 0, w, h)
+
+    def levelForScale(self, scale):
+        """
+        coarsest level still having at least one pixel per screen pixel
+        :param scale: screen pixels per scene unit
+        :return:
+        """
+        if scale >= 1:
+            return 0
+        return int(np.clip(np.floor(np.log2(1. / scale)), 0, self._source.n_levels - 1))
+
+    def tileRect(self, level, tx, ty):
+        """
+        :return: rect of a tile in scene coordinates
+        """
+        h, w = self._source.levelShape(level)
+        ts = self._source.tile_size
+        f = 2 ** level
+        x0, y0 = tx * ts, ty * ts
+        return QRectF(x0 * f, y0 * f, (min(x0 + ts, w) - x0) * f, (min(y0 + ts, h) - y0) * f)
+
+    def tilesInRect(self, level, rect, margin=0):
+        """
+        :param level:
+        :param rect: QRectF in scene coordinates
+        :param margin: extra tiles around the rect
+        :return: list of (tx, ty)
+        """
+        rows, cols = self._source.tileCounts(level)
+        size = float(self._source.tile_size * 2 ** level)
+        tx0 = max(int(np.floor(rect.left() / size)) - margin, 0)
+        ty0 = max(int(np.floor(rect.top() / size)) - margin, 0)
+        tx1 = min(int(np.floor(rect.right() / size)) + margin, cols - 1)
+        ty1 = min(int(np.floor(rect.bottom() / size)) + margin, rows - 1)
+        return [(tx, ty) for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1)]
+
+    def loadTile(self, level, tx, ty):
+        """
+        decode a tile and put it in the cache
+        :return: QImage
+        """
+        image = _toQImage(self._source.readTile(level, tx, ty))
+        self._cache.put((level, tx, ty), image)
+        return image
+
+    def _run(self):
+        while True:
+            priority, _, generation, key = self._queue.get()
+            if key is None:
+                return
+            if generation < self._generation or key in self._cache:
+                with self._pending_lock:
+                    # unless the tile was queued again since
+                    if self._pending.get(key) == (generation, priority):
+                        del self._pending[key]
+                continue
+
+            self.loadTile(*key)
+            with self._pending_lock:
+                self._pending.pop(key, None)
+            self.tileLoaded.emit(self.tileRect(*key))
+
+    def _request(self, keys, priority):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ImagePyramid', daemon=True)
+            self._thread.start()
+
+        with self._pending_lock:
+            for key in keys:
+                if key in self._cache:
+                    continue
+                # tiles queued for an older view are dropped, those queued for prefetching are queued again when
+                # they become visible
+                pending = self._pending.get(key)
+                if pending is not None and pending[0] == self._generation and pending[1] <= priority:
+                    continue
+
+                self._pending[key] = (self._generation, priority)
+                self._queue.put((priority, next(self._counter), self._generation, key))
+
+    def _fallback(self, level, tx, ty):
+        """
+        the cached tile of the closest coarser level covering a tile
+        :return: (QImage, its level, its tile column, its tile row) or None
+        """
+        for coarser in range(level + 1, self._source.n_levels):
+            f = 2 ** (coarser - level)
+            image = self._cache.peek((coarser, tx // f, ty // f))
+            if image is not None:
+                return image, coarser, tx // f, ty // f
+        return None
+
+    def paint(self, painter, rect, scale, viewport=None):
+        """
+        draw the tiles intersecting rect, from the cache when possible. Missing tiles are requested and replaced by
+        a coarser cached tile in the meantime
+        :param painter:
+        :param rect: QRectF in scene coordinates, e.g. the exposed rect
+        :param scale: screen pixels per scene unit
+        :param viewport: QRectF in scene coordinates of the whole visible area, by default the device viewport of
+                         the painter mapped to the scene. Pending requests are dropped when it shows other tiles,
+                         not on partial repaints within it
+        :return:
+        """
+        rect = rect.intersected(self.rect)
+        if rect.isEmpty():
+            return
+
+        level = self.levelForScale(scale)
+        if self._threaded:
+            if viewport is None:
+                viewport = painter.worldTransform().inverted()[0].mapRect(QRectF(painter.viewport()))
+            tiles = self.tilesInRect(level, viewport.intersected(self.rect))
+            view = (level, tiles[0], tiles[-1]) if len(tiles) > 0 else (level,)
+            if view != self._view:
+                self._view = view
+                self._generation += 1
+        visible = self.tilesInRect(level, rect)
+        missing = []
+        for tx, ty in visible:
+            target = self.tileRect(level, tx, ty)
+            image = self._cache.get((level, tx, ty))
+            if image is None and not self._threaded:
+                image = self.loadTile(level, tx, ty)
+
+            if image is not None:
+                painter.drawImage(target, image)
+                continue
+
+            missing.append((level, tx, ty))
+            fallback = self._fallback(level, tx, ty)
+            if fallback is not None:
+                image, coarser, ctx, cty = fallback
+                f = 2. ** coarser
+                origin = self.tileRect(coarser, ctx, cty).topLeft()
+                painter.drawImage(target, image, QRectF((target.left() - origin.x()) / f,
+                                                        (target.top() - origin.y()) / f,
+                                                        target.width() / f, target.height() / f))
+
+        if self._threaded:
+            self._request(missing, PRIORITY_VISIBLE)
+            margin = self._prefetch_margin
+            around = [(level, tx, ty) for tx, ty in self.tilesInRect(level, rect, margin)]
+            if level + 1 < self._source.n_levels:
+                around += [(level + 1, tx, ty) for tx, ty in self.tilesInRect(level + 1, rect, margin)]
+            self._request([key for key in around if key not in missing], PRIORITY_PREFETCH)
+
+    def close(self):
+        """
+        stop the loading thread
+        :return:
+        """
+        if self._thread is not None:
+            self._queue.put((-1, -1, 0, None))
+            self._thread.join()
+            self._thread = None
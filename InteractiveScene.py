@@ -1,7 +1,55 @@
-from PyQt5.QtWidgets import (QGraphicsScene, QGraphicsItem)
-from PyQt5.QtGui import (QBrush, QPen, QTransform)
-from PyQt5.QtCore import (Qt)
-from .GraphicsItems import ControllableItem, DEFAULT_IDMAN
+from contextlib import contextmanager
+
+import numpy as np
+from PyQt5.QtWidgets import (QGraphicsScene, QGraphicsItem, QGraphicsPathItem)
+from PyQt5.QtGui import (QBrush, QPen, QTransform, QPainterPath)
+from PyQt5.QtCore import (Qt, QRectF, pyqtSignal)
+from .GraphicsItems import ControllableItem, LodThresholds, transformItems, dataModel2GraphicsItem, DEFAULT_IDMAN
+from .DataModels import applyAffine
+from .SpatialIndex import GridIndex, pointsInPolies
+from .Utils import _QPolygon
+
+
+def _itemVertices(items):
+    """
+    vertices of the polygons of the models of items, mapped to the scene by the transform of each item
+    :param items: ControllableItems
+    :return: ((n, 2) array, (n,) array of the index of the item of each vertex)
+    """
+    vertices, owners = [], []
+    for ix, item in enumerate(items):
+        t = item.sceneTransform()
+        matrix = np.array([[t.m11(), t.m21(), t.dx()], [t.m12(), t.m22(), t.dy()]])
+        for poly in item.model.cachedPolies():
+            poly = np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+            vertices.append(applyAffine(poly, matrix))
+            owners.append(np.full(len(poly), ix, dtype=np.int64))
+
+    if len(vertices) == 0:
+        return np.zeros((0, 2)), np.zeros(0, dtype=np.int64)
+    return np.concatenate(vertices), np.concatenate(owners)
+
+
+def _itemsInRegion(region, candidates, vertices, owners, inside, mode):
+    """
+    test the shapes of items against a selection region. The vertices settle most items at once: an item with a
+    vertex inside intersects the region, an item with a vertex outside is not contained in it. The others, e.g.
+    items crossing the region without any vertex in it, are tested on their shape mapped to the scene
+    :param region: QPainterPath in scene coordinates
+    :param candidates: items, topmost first
+    :param vertices: see _itemVertices
+    :param owners: see _itemVertices
+    :param inside: whether each vertex is inside the region
+    :param mode: Qt.IntersectsItemShape or Qt.ContainsItemShape
+    :return: the selected items, topmost first
+    """
+    if mode == Qt.ContainsItemShape:
+        outside = np.bincount(owners[~inside], minlength=len(candidates)) > 0
+        return [item for item, out in zip(candidates, outside)
+                if not out and region.contains(item.mapToScene(item.shape()))]
+
+    hit = np.bincount(owners[inside], minlength=len(candidates)) > 0
+    return [item for item, h in zip(candidates, hit) if h or region.intersects(item.mapToScene(item.shape()))]
 
 
 class LayerItem(QGraphicsItem):
@@ -11,7 +59,23 @@ class LayerItem(QGraphicsItem):
         self._idd = DEFAULT_IDMAN.next()
         self._layer_stack = layer_stack
         # self._order = layer_stack.push(self)
-        self._items = []
+        # items by id, in drawing order through a doubly linked list of ids, so that moving one does not shift others
+        self._members = {}
+        self._prev = {}
+        self._next = {}
+        self._first_id = None
+        self._last_id = None
+        # ordering key by item id, increasing from the first item to the last one with gaps in between, see
+        # LayerStack.zValue
+        self._keys = {}
+        # self.items, rebuilt on the first access after a change
+        self._ordered = None
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, item_id):
+        return item_id in self._members
 
     @property
     def label(self):
@@ -28,29 +92,191 @@ class LayerItem(QGraphicsItem):
 
     @property
     def items(self):
-        return self._items
+        """
+        :return: the items, bottom first, O(n) on the first access after a change
+        """
+        if self._ordered is None:
+            ordered, idd = [], self._first_id
+            while idd is not None:
+                ordered.append(self._members[idd])
+                idd = self._next[idd]
+            self._ordered = ordered
+        return self._ordered
+
+    @property
+    def keys(self):
+        return [self._keys[item.idd] for item in self.items]
+
+    @property
+    def first_item_id(self):
+        return self._first_id
+
+    @property
+    def last_item_id(self):
+        return self._last_id
+
+    def item(self, item_id):
+        return self._members[item_id]
+
+    def key(self, item_id):
+        return self._keys[item_id]
+
+    def nextItemId(self, item_id):
+        """
+        :return: id of the item right above, None for the top one
+        """
+        return self._next[item_id]
+
+    def previousItemId(self, item_id):
+        """
+        :return: id of the item right below, None for the bottom one
+        """
+        return self._prev[item_id]
+
+    def _link(self, item, key, after_id):
+        """
+        insert an item in the order, O(1)
+        :param item:
+        :param key: its ordering key, between the keys of its new neighbours
+        :param after_id: id of the item right below it, None to put it at the bottom
+        :return:
+        """
+        idd = item.idd
+        before_id = self._first_id if after_id is None else self._next[after_id]
+        self._members[idd] = item
+        self._keys[idd] = key
+        self._prev[idd], self._next[idd] = after_id, before_id
+        if after_id is None:
+            self._first_id = idd
+        else:
+            self._next[after_id] = idd
+        if before_id is None:
+            self._last_id = idd
+        else:
+            self._prev[before_id] = idd
+        self._ordered = None
+
+    def _unlink(self, item_id):
+        """
+        take an item out of the order, O(1)
+        :param item_id:
+        :return: the item
+        """
+        prev_id, next_id = self._prev.pop(item_id), self._next.pop(item_id)
+        del self._keys[item_id]
+        if prev_id is None:
+            self._first_id = next_id
+        else:
+            self._next[prev_id] = next_id
+        if next_id is None:
+            self._last_id = prev_id
+        else:
+            self._prev[next_id] = prev_id
+        self._ordered = None
+        return self._members.pop(item_id)
+
+    def _setKey(self, item_id, key):
+        self._keys[item_id] = key
 
     def addItem(self, item):
-        assert(len(self.items) < self._layer_stack.MAX_N_ITEMS_PER_LAYER)
-        self._items.append(item)
+        last_id = self._last_id
+        stack = self._layer_stack
+        self._link(item, self._keys[last_id] + stack.KEY_GAP if last_id is not None else stack.FIRST_KEY,
+                   last_id)
+        stack._itemAdded(self, item.idd)
         item.setParentItem(self)
         self.update()
-        self._layer_stack.updateZValue()
+
+    def removeItem(self, item):
+        self._unlink(item.idd)
+        self._layer_stack._itemRemoved(self, item.idd)
+        self.update()
+
+    def transformBy(self, matrix):
+        """
+        apply an affine transform to all the items of this layer
+        :param matrix: 2x3 or 3x3 affine matrix
+        :return:
+        """
+        transformItems(self.items, matrix)
 
 
 class LayerStack(object):
-    MAX_N_ITEMS_PER_LAYER = 1000
+    """
+    Ordered layers of items. The Z value of an item is the index of its layer times LAYER_Z_SPAN plus its key in the
+    layer. Keys are spaced by KEY_GAP so that moving an item only changes its own key, the keys of a layer are
+    spread again when they reach the ends of the span. Items are found through a dict and each layer keeps its
+    order as a linked list, so adding, removing and moving an item are O(1), only listing the items of a layer in
+    order (LayerItem.items, itemPosition) is O(n) after a change.
+    """
+    # exact in a double up to 4096 layers
+    LAYER_Z_SPAN = 2 ** 40
+    KEY_GAP = 1024
+    FIRST_KEY = LAYER_Z_SPAN // 2
 
     def __init__(self):
+        # > 0 while Z values are only assigned at the end, see bulkLoad
+        self._bulk_depth = 0
         self.clear()
 
     def __contains__(self, item):
+        return getattr(item, 'idd', None) in self._item_index
+
+    def _placeItem(self, layer, item_id):
+        """
+        give an item the Z value of its key
+        :param layer: LayerItem holding the item
+        :param item_id:
+        :return:
+        """
+        if self._bulk_depth == 0 and layer.idd in self._layer_index:
+            layer.item(item_id).setZValue(self.zValue(self._layer_index[layer.idd], layer.key(item_id)))
+
+    def _itemAdded(self, layer, item_id):
+        """
+        called by LayerItem.addItem
+        """
+        self._item_index[item_id] = layer
+        if layer.key(item_id) >= self.LAYER_Z_SPAN:
+            self._rebalance(layer)
+        else:
+            self._placeItem(layer, item_id)
+
+    def _itemRemoved(self, layer, item_id):
+        """
+        called by LayerItem.removeItem
+        """
+        del self._item_index[item_id]
+        if self._current_item_id == item_id:
+            self._current_item_id = layer.last_item_id if layer.last_item_id is not None else -1
+
+    def _rebalance(self, layer):
+        """
+        spread the keys of a layer evenly around the middle of the span, O(n) but only needed after about
+        LAYER_Z_SPAN / 2 / KEY_GAP moves to the same end
+        :param layer:
+        :return:
+        """
+        n = len(layer)
+        step = min(self.KEY_GAP, self.LAYER_Z_SPAN // (n + 1))
+        start = (self.LAYER_Z_SPAN - step * (n - 1)) // 2
+        for ix, item in enumerate(layer.items):
+            layer._setKey(item.idd, start + step * ix)
+            self._placeItem(layer, item.idd)
+
+    def _locate(self, item_id):
+        """
+        :param item_id:
+        :return: LayerItem holding the item
+        """
         try:
-            re = self.itemById(item.idd)
-        except ValueError:
-            return False
+            return self._item_index[item_id]
+        except KeyError:
+            raise ValueError('item not found!')
 
-        return True
+    def _indexLayers(self, start=0):
+        for lx in range(start, len(self._layers)):
+            self._layer_index[self._layers[lx].idd] = lx
 
     @property
     def current_item_id(self):
@@ -58,7 +284,7 @@ class LayerStack(object):
 
     @current_item_id.setter
     def current_item_id(self, idd):
-        if self.itemById(idd) in self:
+        if idd in self._item_index:
             self._current_layer_id = self.layerByItemId(idd)
             self._current_item_id = idd
         else:
@@ -71,7 +297,6 @@ class LayerStack(object):
     @current_item.setter
     def current_item(self, item):
         self.current_item_id = item.idd
-        self.current_layer_id = self.layerByItemId(item.idd).idd
 
     @property
     def current_layer_id(self):
@@ -79,33 +304,49 @@ class LayerStack(object):
 
     @current_layer_id.setter
     def current_layer_id(self, layer_id):
-        if self.layerById(layer_id) in self._layers:
+        if layer_id in self._layer_index:
+            last_id = self.layerById(layer_id)[1].last_item_id
             self._current_layer_id = layer_id
-            self._current_item_id = self.layerById(layer_id)[1].items[-1].idd
+            self._current_item_id = last_id if last_id is not None else -1
 
     @property
     def current_layer(self):
         return self.layerById(self.current_layer_id)[1]
 
     def itemById(self, item_id):
-        for lx, l in enumerate(self._layers):
-            for item in l.items:
-                if item.idd == item_id:
-                    return item
+        return self._locate(item_id).item(item_id)
 
-        raise ValueError('item not found!')
+    def itemPosition(self, item_id):
+        """
+        :param item_id:
+        :return: (index of the layer, index of the item in the layer), O(n)
+        """
+        layer = self._locate(item_id)
+        return self._layer_index[layer.idd], layer.items.index(layer.item(item_id))
 
     def layerByItemId(self, item_id):
-        item = self.itemById(item_id)
-        if item.parentItem() is not None:
-            return item.parentItem().idd
+        """
+        :param item_id:
+        :return: id of the layer holding the item
+        """
+        return self._locate(item_id).idd
 
     def layerById(self, layer_id):
-        for lx, l in enumerate(self._layers):
-            if l.idd == layer_id:
-                return lx, l
+        try:
+            lx = self._layer_index[layer_id]
+        except KeyError:
+            raise ValueError('layer not found!')
 
-        raise ValueError('layer not found!')
+        return lx, self._layers[lx]
+
+    def zValue(self, layer_index, key):
+        """
+        Z value of an item
+        :param layer_index: index of its layer
+        :param key: ordering key of the item in the layer, 0 for the layer itself
+        :return:
+        """
+        return float(layer_index * self.LAYER_Z_SPAN + key)
 
     def layerIndexById(self, layer_id):
         lx, l = self.layerById(layer_id)
@@ -115,8 +356,13 @@ class LayerStack(object):
         return self.current_item_id > 0
 
     def push(self, layer):
-        next_key = len(self._layers) + 1
-        self._layers[next_key] = layer
+        self._layers.append(layer)
+        self._indexLayers(len(self._layers) - 1)
+        for item in layer.items:
+            self._item_index[item.idd] = layer
+            self._placeItem(layer, item.idd)
+        if self._bulk_depth == 0:
+            layer.setZValue(self.zValue(len(self._layers) - 1, 0))
 
     def pop(self):
         if len(self._layers) > 0:
@@ -143,39 +389,146 @@ class LayerStack(object):
         self.current_layer.addItem(item)
         self.current_item_id = item.idd
 
+    def removeItem(self, item):
+        """
+        take an item out of its layer
+        :param item:
+        :return:
+        """
+        self._locate(item.idd).removeItem(item)
+
     def swap(self, item_id1, item_id2):
         lx1, l1 = self.layerById(item_id1)
         lx2, l2 = self.layerById(item_id2)
         if l1 is not None and l2 is not None:
             self._layers[lx1] = l2
             self._layers[lx2] = l1
+            self._layer_index[l1.idd] = lx2
+            self._layer_index[l2.idd] = lx1
+            self.updateLayerZValue(lx1)
+            self.updateLayerZValue(lx2)
+
+    def _swapItems(self, layer, lower_id, upper_id):
+        """
+        exchange two neighbouring items of a layer, they exchange their keys too
+        """
+        lower_key, upper_key = layer.key(lower_id), layer.key(upper_id)
+        layer._link(layer._unlink(lower_id), upper_key, upper_id)
+        layer._setKey(upper_id, lower_key)
+        self._placeItem(layer, lower_id)
+        self._placeItem(layer, upper_id)
+
+    def _moveItemToEnd(self, item_id, top):
+        layer = self._locate(item_id)
+        end_id = layer.last_item_id if top else layer.first_item_id
+        if item_id == end_id:
+            return
+
+        item = layer._unlink(item_id)
+        if top:
+            layer._link(item, layer.key(end_id) + self.KEY_GAP, end_id)
+        else:
+            layer._link(item, layer.key(end_id) - self.KEY_GAP, None)
+
+        if 0 < layer.key(item_id) < self.LAYER_Z_SPAN:
+            self._placeItem(layer, item_id)
+        else:
+            self._rebalance(layer)
 
     def moveUp(self, item_id):
+        """
+        move an item above the next one of its layer, or a layer above the next layer
+        :param item_id: id of an item or of a layer
+        :return:
+        """
+        if item_id in self._item_index:
+            layer = self._locate(item_id)
+            next_id = layer.nextItemId(item_id)
+            if next_id is not None:
+                self._swapItems(layer, item_id, next_id)
+            return
+
         lx, l = self.layerById(item_id)
         if lx + 1 < len(self._layers):
-            self.swap(item_id, self._layers[lx + 1])
+            self.swap(item_id, self._layers[lx + 1].idd)
 
     def moveDown(self, item_id):
+        """
+        move an item below the previous one of its layer, or a layer below the previous layer
+        :param item_id: id of an item or of a layer
+        :return:
+        """
+        if item_id in self._item_index:
+            layer = self._locate(item_id)
+            prev_id = layer.previousItemId(item_id)
+            if prev_id is not None:
+                self._swapItems(layer, prev_id, item_id)
+            return
+
         lx, l = self.layerById(item_id)
-        if lx - 1 > 0:
+        if lx > 0:
             self.swap(item_id, self._layers[lx - 1].idd)
 
     def moveToTop(self, item_id):
-        self.swap(item_id, self._layers[len(self._layers) - 1].idd)
+        """
+        move an item above all the items of its layer, or swap a layer with the top one
+        :param item_id: id of an item or of a layer
+        :return:
+        """
+        if item_id in self._item_index:
+            self._moveItemToEnd(item_id, top=True)
+        else:
+            self.swap(item_id, self._layers[len(self._layers) - 1].idd)
 
     def moveToBottom(self, item_id):
-        self.swap(item_id, self._layers[0].idd)
+        """
+        move an item below all the items of its layer, or swap a layer with the bottom one
+        :param item_id: id of an item or of a layer
+        :return:
+        """
+        if item_id in self._item_index:
+            self._moveItemToEnd(item_id, top=False)
+        else:
+            self.swap(item_id, self._layers[0].idd)
+
+    def updateLayerZValue(self, lx):
+        """
+        update Z values of the items of one layer according to their order
+        :param lx: index of the layer
+        :return:
+        """
+        if self._bulk_depth > 0:
+            return
+
+        layer = self._layers[lx]
+        layer.setZValue(self.zValue(lx, 0))
+        for item in layer.items:
+            item.setZValue(self.zValue(lx, layer.key(item.idd)))
 
     def updateZValue(self):
         """
         update Z values of each item according to item order in each layer
         :return:
         """
-        for lx, layer in enumerate(self._layers):
-            layer.setZValue(lx * self.MAX_N_ITEMS_PER_LAYER)
-            for ix, item in enumerate(layer.items):
-                zval = lx * self.MAX_N_ITEMS_PER_LAYER + ix + 1
-                item.setZValue(zval)
+        for lx in range(len(self._layers)):
+            self.updateLayerZValue(lx)
+
+    @contextmanager
+    def bulkLoad(self):
+        """
+        add many items without updating Z values one at a time, they are all assigned once at the end
+
+            with stack.bulkLoad():
+                for item in items:
+                    stack.addItemToCurrentLayer(item)
+        """
+        self._bulk_depth += 1
+        try:
+            yield self
+        finally:
+            self._bulk_depth -= 1
+            if self._bulk_depth == 0:
+                self.updateZValue()
 
     def clear(self):
         """
@@ -183,29 +536,311 @@ class LayerStack(object):
         :return:
         """
         self._layers = [LayerItem(self, 'default', None)]
+        # item id -> LayerItem holding it, layer id -> position in self._layers
+        self._item_index = {}
+        self._layer_index = {}
+        self._indexLayers()
         self._current_layer_id = self._layers[0].idd
         self._current_item_id = -1
 
 
+class PickIndex(object):
+    """
+    Spatial index of the ControllableItems of a scene on their cached bounding rects, answering clicks and hover
+    without going through every item. Items report their new bounds through ControllableItem.rect
+    """
+    def __init__(self, cell_size=64.):
+        self._grid = GridIndex(cell_size)
+        self._items = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return getattr(item, 'idd', None) in self._items
+
+    @staticmethod
+    def _box(item):
+        r = item.sceneBoundingRect()
+        return r.left(), r.top(), r.right(), r.bottom()
+
+    def add(self, item):
+        self._items[item.idd] = item
+        self._grid.insert(item.idd, self._box(item))
+
+    def remove(self, item):
+        if self._items.pop(item.idd, None) is not None:
+            self._grid.remove(item.idd)
+
+    def update(self, item):
+        if item.idd in self._items:
+            self._grid.update(item.idd, self._box(item))
+
+    def rebuild(self, cell_size=None):
+        """
+        index all the items again, with a cell size fitted to their sizes by default
+        :param cell_size:
+        :return:
+        """
+        keys = list(self._items)
+        self._grid = GridIndex.build(keys, [self._box(self._items[k]) for k in keys], cell_size)
+
+    def clear(self):
+        self._grid = GridIndex(self._grid.cell_size)
+        self._items = {}
+
+    def itemsInRect(self, x0, y0, x1, y1):
+        """
+        :return: items whose bounds intersect a rect, topmost first
+        """
+        items = [self._items[k] for k in self._grid.queryRect(x0, y0, x1, y1)]
+        items.sort(key=lambda item: item.zValue(), reverse=True)
+        return items
+
+    def itemsAt(self, pos):
+        """
+        :param pos: QPointF in scene coordinates
+        :return: visible items whose shape contains pos, topmost first
+        """
+        return [item for item in self.itemsInRect(pos.x(), pos.y(), pos.x(), pos.y())
+                if item.isVisible() and item.contains(item.mapFromScene(pos))]
+
+    def topItemAt(self, pos):
+        """
+        :param pos: QPointF in scene coordinates
+        :return: the topmost visible item whose shape contains pos, None if there is none
+        """
+        for item in self.itemsInRect(pos.x(), pos.y(), pos.x(), pos.y()):
+            if item.isVisible() and item.contains(item.mapFromScene(pos)):
+                return item
+        return None
+
+
 class InteractiveScene(QGraphicsScene):
+    # the item under the mouse changed, None when there is none
+    hoverItemChanged = pyqtSignal(object)
+    # what dragging with the left button does, see selection_mode
+    NoDragSelection = 0
+    SelectRubberBand = 1
+    SelectLasso = 2
+
     def __init__(self, parent=None):
         # self._active_item = None
         self._layer_stack = LayerStack()
+        # level of detail settings of the items in this scene
+        self.lod_thresholds = LodThresholds()
+        # ControllableItems by position, see PickIndex
+        self.pick_index = PickIndex()
+        self._hover_item = None
+        self._selection_mode = self.NoDragSelection
+        # dashed outline of the rubber band or lasso being drawn, and its points
+        self._selection_item = None
+        self._selection_points = []
+        # tiled background image, see setBackgroundPyramid
+        self._pyramid = None
         super(InteractiveScene, self).__init__(parent)
         self.reset()
 
+    @property
+    def background_pyramid(self):
+        return self._pyramid
+
+    def setBackgroundPyramid(self, pyramid):
+        """
+        draw an ImagePyramid behind the items, the scene rect becomes the image extent
+        :param pyramid: ImagePyramid, None to remove it
+        :return:
+        """
+        if self._pyramid is not None:
+            self._pyramid.tileLoaded.disconnect(self._tileLoaded)
+        self._pyramid = pyramid
+        if pyramid is not None:
+            # tiles are loaded in another thread
+            pyramid.tileLoaded.connect(self._tileLoaded, Qt.QueuedConnection)
+            self.setSceneRect(pyramid.rect)
+        self.invalidate(self.sceneRect(), QGraphicsScene.BackgroundLayer)
+
+    def _tileLoaded(self, rect):
+        self.invalidate(rect, QGraphicsScene.BackgroundLayer)
+
+    def drawBackground(self, painter, rect):
+        super(InteractiveScene, self).drawBackground(painter, rect)
+        if self._pyramid is not None:
+            transform = painter.worldTransform()
+            scale = np.sqrt(abs(transform.determinant()))
+            self._pyramid.paint(painter, rect, scale)
+
+    @property
+    def selection_mode(self):
+        return self._selection_mode
+
+    @selection_mode.setter
+    def selection_mode(self, value):
+        """
+        :param value: NoDragSelection, SelectRubberBand or SelectLasso
+        :return:
+        """
+        self._cancelDragSelection()
+        self._selection_mode = value
+
+    @property
+    def hover_item(self):
+        return self._hover_item
+
     def addItem(self, item):
         self._layer_stack.addItemToCurrentLayer(item)
         super(InteractiveScene, self).addItem(item)
+        if isinstance(item, ControllableItem):
+            self.pick_index.add(item)
+
+    def removeItem(self, item):
+        if item in self._layer_stack:
+            self._layer_stack.removeItem(item)
+        if isinstance(item, ControllableItem):
+            self.pick_index.remove(item)
+            if item is self._hover_item:
+                self._setHoverItem(None)
+        super(InteractiveScene, self).removeItem(item)
+
+    def addItems(self, items):
+        """
+        add many items to the current layer. Z values and the current item are set once at the end, and the scene
+        index is rebuilt once instead of being updated for every item
+        :param items:
+        :return:
+        """
+        if len(items) == 0:
+            return
+
+        index_method = self.itemIndexMethod()
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        try:
+            with self._layer_stack.bulkLoad():
+                layer = self._layer_stack.current_layer
+                for item in items:
+                    layer.addItem(item)
+                    super(InteractiveScene, self).addItem(item)
+                    if isinstance(item, ControllableItem):
+                        self.pick_index.add(item)
+        finally:
+            self.setItemIndexMethod(index_method)
+        self.pick_index.rebuild()
+
+        self._layer_stack.current_item_id = items[-1].idd
+
+    def loadModel(self, model, **kwargs):
+        """
+        create items for all the regions of an annotation model and add them at once, see addItems
+        :param model: DataModels.AnnotationModel
+        :param kwargs: passed to the item constructors
+        :return: the new items, regions of a type without graphics item are skipped
+        """
+        items = []
+        for region in model.regions:
+            item_class = dataModel2GraphicsItem(region)
+            if item_class is None:
+                continue
+
+            options = dict(kwargs)
+            if region.label:
+                options.setdefault('label', region.label)
+            items.append(item_class(region, **options))
+
+        self.addItems(items)
+        return items
+
+    def setSelectedItems(self, items, add=False):
+        """
+        select items with a single selectionChanged notification, none if the selection stays the same
+        :param items:
+        :param add: keep the current selection
+        :return:
+        """
+        before = set(self.selectedItems())
+        self.blockSignals(True)
+        try:
+            if not add:
+                self.clearSelection()
+            for item in items:
+                item.setSelected(True)
+        finally:
+            self.blockSignals(False)
+        if set(self.selectedItems()) != before:
+            self.selectionChanged.emit()
+
+    def itemsInRect(self, rect, mode=Qt.IntersectsItemShape):
+        """
+        items whose shape intersects or is contained in a rect
+        :param rect: QRectF in scene coordinates
+        :param mode: Qt.IntersectsItemShape or Qt.ContainsItemShape
+        :return: topmost first
+        """
+        candidates = [item for item in self.pick_index.itemsInRect(rect.left(), rect.top(), rect.right(),
+                                                                   rect.bottom()) if item.isVisible()]
+        vertices, owners = _itemVertices(candidates)
+        inside = (vertices[:, 0] >= rect.left()) & (vertices[:, 0] <= rect.right()) & \
+                 (vertices[:, 1] >= rect.top()) & (vertices[:, 1] <= rect.bottom())
+        region = QPainterPath()
+        region.addRect(rect)
+        return _itemsInRegion(region, candidates, vertices, owners, inside, mode)
+
+    def itemsInPolygon(self, points, mode=Qt.IntersectsItemShape):
+        """
+        items whose shape intersects or is contained in a polygon, e.g. a lasso
+        :param points: (n, 2) array in scene coordinates
+        :param mode: Qt.IntersectsItemShape or Qt.ContainsItemShape
+        :return: topmost first
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 3:
+            return []
+
+        (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        candidates = [item for item in self.pick_index.itemsInRect(x0, y0, x1, y1) if item.isVisible()]
+        vertices, owners = _itemVertices(candidates)
+        inside = (vertices[:, 0] >= x0) & (vertices[:, 0] <= x1) & (vertices[:, 1] >= y0) & (vertices[:, 1] <= y1)
+        inside[inside] = pointsInPolies(vertices[inside], [points])
+        region = QPainterPath()
+        region.addPolygon(_QPolygon(points))
+        region.closeSubpath()
+        return _itemsInRegion(region, candidates, vertices, owners, inside, mode)
+
+    def _selectionOutline(self):
+        path = QPainterPath()
+        points = self._selection_points
+        if self._selection_mode == self.SelectRubberBand:
+            path.addRect(QRectF(points[0], points[-1]).normalized())
+        else:
+            path.addPolygon(_QPolygon([[p.x(), p.y()] for p in points]))
+            path.closeSubpath()
+        return path
+
+    def _cancelDragSelection(self):
+        if self._selection_item is not None:
+            super(InteractiveScene, self).removeItem(self._selection_item)
+        self._selection_item = None
+        self._selection_points = []
 
     def mousePressEvent(self, e):
         """
-        if the user click on an item, set it to the current_item in the LayerStack.
+        if the user click on an item, set it to the current_item in the LayerStack. In a drag selection mode, start
+        a rubber band or a lasso instead
         :param e:
         :return:
         """
         pos = e.scenePos()
-        items = [item for item in self.items(pos) if issubclass(item.__class__, ControllableItem)]
+        if self._selection_mode != self.NoDragSelection and e.button() == Qt.LeftButton:
+            self._cancelDragSelection()
+            self._selection_points = [pos]
+            pen = QPen(Qt.DashLine)
+            pen.setCosmetic(True)
+            self._selection_item = QGraphicsPathItem()
+            self._selection_item.setPen(pen)
+            self._selection_item.setZValue(float('inf'))
+            super(InteractiveScene, self).addItem(self._selection_item)
+            return
+
+        items = self.pick_index.itemsAt(pos)
 
         if len(items) == 0 and self._layer_stack.hasCurrentItem():
             self.sendEvent(self._layer_stack.current_item, e)
@@ -216,14 +851,68 @@ class InteractiveScene(QGraphicsScene):
                 self.sendEvent(item, e)
                 return super(InteractiveScene, self).mousePressEvent(e)
 
-        item = self.itemAt(pos.x(), pos.y(), QTransform())
-        if item in self._layer_stack:
-            self._layer_stack.current_item = item
+        if len(items) > 0 and items[0] in self._layer_stack:
+            self._layer_stack.current_item = items[0]
 
         return super(InteractiveScene, self).mousePressEvent(e)
 
+    def _setHoverItem(self, item):
+        if item is self._hover_item:
+            return
+
+        if self._hover_item is not None:
+            self._hover_item.highlighted = False
+        self._hover_item = item
+        if item is not None:
+            item.highlighted = True
+        self.hoverItemChanged.emit(item)
+
+    def mouseMoveEvent(self, e):
+        """
+        highlight the topmost item under the mouse
+        :param e:
+        :return:
+        """
+        if self._selection_item is not None:
+            self._selection_points.append(e.scenePos())
+            self._selection_item.setPath(self._selectionOutline())
+            return
+
+        self._setHoverItem(self.pick_index.topItemAt(e.scenePos()))
+        return super(InteractiveScene, self).mouseMoveEvent(e)
+
+    def mouseReleaseEvent(self, e):
+        """
+        select the items in the rubber band or lasso, shift adds them to the selection
+        :param e:
+        :return:
+        """
+        if self._selection_item is None:
+            return super(InteractiveScene, self).mouseReleaseEvent(e)
+
+        self._selection_points.append(e.scenePos())
+        points = self._selection_points
+        if self._selection_mode == self.SelectRubberBand:
+            items = self.itemsInRect(QRectF(points[0], points[-1]).normalized())
+        else:
+            items = self.itemsInPolygon([[p.x(), p.y()] for p in points])
+        self._cancelDragSelection()
+        self.setSelectedItems(items, add=bool(e.modifiers() & Qt.ShiftModifier))
+
+    def transformSelection(self, matrix):
+        """
+        apply an affine transform to the selected items
+        :param matrix: 2x3 or 3x3 affine matrix, see DataModels.translation, scaling and rotation
+        :return:
+        """
+        transformItems([item for item in self.selectedItems() if isinstance(item, ControllableItem)], matrix)
+
     def reset(self):
         self._layer_stack.clear()
+        self.pick_index.clear()
+        self._hover_item = None
+        self._selection_item = None
+        self._selection_points = []
         self.clear()
         self.setBackgroundBrush(QBrush(Qt.white, Qt.SolidPattern))
         self.addLine(0, 0, 1000, 0, QPen(Qt.DashLine))
@@ -1,9 +1,13 @@
 from PyQt5 import QtGui
 from PyQt5.QtCore import (QByteArray, QDataStream, QFile, QFileInfo,
         QIODevice, QPoint, QPointF, QRectF, Qt, QRect, QSize, pyqtSignal, pyqtSlot)
-from PyQt5.QtGui import (QColor, QBrush, QPixmap, QPainter, QBitmap, QIcon, QFont, QPen, QTransform, QPainterPath)
+from PyQt5.QtGui import (QColor, QBrush, QPixmap, QPainter, QBitmap, QIcon, QFont, QPen, QTransform, QPainterPath,
+                         QImage)
 from PyQt5.QtWidgets import (QGraphicsScene, QGraphicsItem, QGraphicsTextItem, QGraphicsView)
 
+from .InteractiveScene import InteractiveScene
+from .ImagePyramid import ImagePyramid
+
 
 class InteractiveView(QGraphicsView):
     # signals:
@@ -16,11 +20,29 @@ class InteractiveView(QGraphicsView):
 
     def __init__(self):
         super(InteractiveView, self).__init__()
+        self.scenes = []
 
     # public slots:
     # void initScenes(QList < QImage * >);
     def initScenes(self, images):
-        pass
+        """
+        create one scene per image, the image being drawn as a tiled background
+        :param images: QImages, uint8 arrays (e.g. memory-mapped), lists of pyramid levels or TileSources
+        :return:
+        """
+        for scene in self.scenes:
+            if scene.background_pyramid is not None:
+                scene.background_pyramid.close()
+
+        self.scenes = []
+        for image in images:
+            scene = InteractiveScene(self)
+            scene.setBackgroundPyramid(ImagePyramid(image, parent=scene))
+            self.scenes.append(scene)
+
+        if len(self.scenes) > 0:
+            self.setScene(self.scenes[0])
+        self.pushScenes.emit(self.scenes)
 
     # void changeScene(qreal);
     def changeScene(self, value):
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental parsing of GeoJSON-like FeatureCollection files.
+
+Only one chunk of the file and the feature being decoded are held in memory, so files of hundreds of MB can be
+scanned with a small, constant footprint.
+"""
+
+import codecs
+import json
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+_WHITESPACE = ' \t\n\r'
+
+
+def _byteLen(text):
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+
+class _Reader(object):
+    """
+    a growing text window over a binary file which knows the byte offset of its first character
+    """
+    def __init__(self, fp, chunk_size):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.byte_pos = 0
+        self.eof = False
+
+    def more(self):
+        """
+        read the next chunk, dropping what has already been consumed
+        :return: False at the end of the file
+        """
+        if self.eof:
+            return False
+
+        data = self._fp.read(self._chunk_size)
+        self.eof = len(data) == 0
+        self.text = self.text[self.pos:] + self._decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def advance(self, pos):
+        self.byte_pos += _byteLen(self.text[self.pos:pos])
+        self.pos = pos
+
+    def skip(self, chars=_WHITESPACE):
+        """
+        skip the given characters
+        :return: the next character, '' at the end of the file
+        """
+        while True:
+            pos = self.pos
+            while pos < len(self.text) and self.text[pos] in chars:
+                pos += 1
+            self.advance(pos)
+            if pos < len(self.text) or not self.more():
+                return self.text[self.pos:self.pos + 1]
+
+
+def _decode(decoder, reader):
+    """
+    decode the value starting at the reader position, reading more chunks until it is complete
+    :param decoder: json.JSONDecoder
+    :param reader: _Reader
+    :return: the value and the byte position of its first character
+    """
+    while True:
+        try:
+            value, end = decoder.raw_decode(reader.text, reader.pos)
+        except ValueError:
+            # the value continues in the next chunk
+            if not reader.more():
+                raise
+            continue
+
+        # a number at the end of the window may continue in the next chunk
+        if end < len(reader.text) or reader.eof:
+            break
+        reader.more()
+
+    start = reader.byte_pos
+    reader.advance(end)
+    return value, start
+
+
+def _findFeatures(decoder, reader):
+    """
+    walk the members of the top-level object up to the features array, skipping the other ones whatever they
+    contain
+    :param decoder:
+    :param reader:
+    :return:
+    """
+    if reader.skip() != '{':
+        raise ValueError('not a FeatureCollection')
+    reader.advance(reader.pos + 1)
+
+    while True:
+        if reader.skip(_WHITESPACE + ',') != '"':
+            raise ValueError('not a FeatureCollection')
+        key, start = _decode(decoder, reader)
+        if reader.skip(_WHITESPACE + ':') == '':
+            raise ValueError('unexpected end of file')
+        if key == 'features':
+            if reader.text[reader.pos] != '[':
+                raise ValueError('not a FeatureCollection')
+            reader.advance(reader.pos + 1)
+            return
+        _decode(decoder, reader)
+
+
+def iterFeatures(fp, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    decode the features of a FeatureCollection one at a time
+    :param fp: file opened in binary mode
+    :param chunk_size: number of bytes read at once
+    :return: generator of (feature dict, first byte, last byte + 1)
+    """
+    decoder = json.JSONDecoder()
+    reader = _Reader(fp, chunk_size)
+    _findFeatures(decoder, reader)
+
+    while True:
+        char = reader.skip(_WHITESPACE + ',')
+        if char == ']':
+            return
+        elif char == '':
+            raise ValueError('unexpected end of file')
+
+        feature, start = _decode(decoder, reader)
+        yield feature, start, reader.byte_pos
+
+
+def readFeature(buf, start, end):
+    """
+    decode a single feature from a buffer (e.g. a memory-mapped file) given its byte range
+    :param buf:
+    :param start:
+    :param end:
+    :return:
+    """
+    return json.loads(bytes(buf[start:end]).decode('utf-8'))
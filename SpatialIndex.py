@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Uniform-grid spatial index over axis-aligned bounding boxes.
+
+Every box is registered in the grid cells it overlaps, boxes covering too many cells are kept in a separate list
+that every query checks. Candidates coming from the cells are then filtered with one vectorized test on their
+exact boxes.
+"""
+
+import numpy as np
+
+# boxes overlapping more cells than this are not put in the grid
+MAX_CELLS_PER_BOX = 64
+# points tested against all edges at once in pointsInPolies, bounds the memory used
+POINT_BATCH = 4096
+
+
+def pointsInPolies(points, polies):
+    """
+    even-odd point-in-polygon test of many points against a set of polygons (a polygon inside another is a hole),
+    consistent with Raster.rasterize
+    :param points: (n, 2) array
+    :param polies: list of (m, 2) arrays
+    :return: (n,) bool array
+    """
+    points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+    polies = [np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polies]
+    polies = [p for p in polies if len(p) >= 3]
+    inside = np.zeros(len(points), dtype=bool)
+    if len(polies) == 0 or len(points) == 0:
+        return inside
+
+    x0 = np.concatenate([p[:, 0] for p in polies])
+    y0 = np.concatenate([p[:, 1] for p in polies])
+    x1 = np.concatenate([np.roll(p[:, 0], -1) for p in polies])
+    y1 = np.concatenate([np.roll(p[:, 1], -1) for p in polies])
+    keep = y0 != y1
+    x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+    ylo, yhi = np.minimum(y0, y1), np.maximum(y0, y1)
+    slope = (x1 - x0) / (y1 - y0)
+
+    for start in range(0, len(points), POINT_BATCH):
+        px = points[start:start + POINT_BATCH, 0][:, None]
+        py = points[start:start + POINT_BATCH, 1][:, None]
+        crosses = (ylo <= py) & (py < yhi) & (x0 + (py - y0) * slope < px)
+        inside[start:start + POINT_BATCH] = crosses.sum(axis=1) % 2 == 1
+
+    return inside
+
+
+class GridIndex(object):
+    """
+    Spatial index of boxes (xmin, ymin, xmax, ymax) identified by hashable keys
+    """
+    def __init__(self, cell_size=64.):
+        self._cell_size = float(cell_size)
+        self._cells = {}
+        self._large = set()
+        self._rows = {}
+        self._keys = []
+        self._boxes = np.zeros((16, 4))
+        self._free = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    @property
+    def cell_size(self):
+        return self._cell_size
+
+    def _cellRange(self, box):
+        cs = self._cell_size
+        return (int(np.floor(box[0] / cs)), int(np.floor(box[1] / cs)),
+                int(np.floor(box[2] / cs)), int(np.floor(box[3] / cs)))
+
+    def _register(self, row, box):
+        cx0, cy0, cx1, cy1 = self._cellRange(box)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_BOX:
+            self._large.add(row)
+            return
+
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is None:
+                    cell = self._cells[(cx, cy)] = set()
+                cell.add(row)
+
+    def _unregister(self, row):
+        if row in self._large:
+            self._large.discard(row)
+            return
+
+        cx0, cy0, cx1, cy1 = self._cellRange(self._boxes[row])
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(row)
+                    if len(cell) == 0:
+                        del self._cells[(cx, cy)]
+
+    def _candidates(self, box):
+        """
+        rows of the boxes registered in the cells overlapping a box
+        :param box:
+        :return: int array
+        """
+        cx0, cy0, cx1, cy1 = self._cellRange(box)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > max(len(self._cells), 1):
+            # the query covers more cells than there are: scan every row
+            rows = np.array(list(self._rows.values()), dtype=np.int64)
+        else:
+            rows = set(self._large)
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cell = self._cells.get((cx, cy))
+                    if cell is not None:
+                        rows.update(cell)
+            rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+        return rows
+
+    @staticmethod
+    def build(keys, boxes, cell_size=None):
+        """
+        create an index from many boxes, the cell size defaults to twice the median box size
+        :param keys: list of keys
+        :param boxes: (n, 4) array-like of xmin, ymin, xmax, ymax
+        :param cell_size:
+        :return:
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if cell_size is None:
+            valid = boxes[~np.isnan(boxes).any(axis=1)]
+            extent = np.maximum(valid[:, 2] - valid[:, 0], valid[:, 3] - valid[:, 1]) if len(valid) else []
+            cell_size = max(2 * float(np.median(extent)), 1.) if len(extent) else 64.
+
+        index = GridIndex(cell_size)
+        for key, box in zip(keys, boxes):
+            index.insert(key, box)
+        return index
+
+    def insert(self, key, box):
+        """
+        :param key:
+        :param box: xmin, ymin, xmax, ymax, boxes containing NaN are ignored
+        :return:
+        """
+        if key in self._rows:
+            self.remove(key)
+        if box is None or np.isnan(box).any():
+            return
+
+        if len(self._free) > 0:
+            row = self._free.pop()
+            self._keys[row] = key
+        else:
+            row = len(self._keys)
+            self._keys.append(key)
+            if row >= len(self._boxes):
+                self._boxes = np.concatenate([self._boxes, np.zeros_like(self._boxes)])
+
+        self._boxes[row] = box
+        self._rows[key] = row
+        self._register(row, self._boxes[row])
+
+    def remove(self, key):
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+
+        self._unregister(row)
+        self._keys[row] = None
+        self._free.append(row)
+
+    def update(self, key, box):
+        row = self._rows.get(key)
+        if row is not None and box is not None and not np.isnan(box).any() and \
+                self._cellRange(self._boxes[row]) == self._cellRange(box):
+            self._boxes[row] = box
+        else:
+            self.insert(key, box)
+
+    def box(self, key):
+        return tuple(self._boxes[self._rows[key]])
+
+    def queryRect(self, xmin, ymin, xmax, ymax):
+        """
+        :return: keys of the boxes intersecting the rectangle
+        """
+        rows = self._candidates((xmin, ymin, xmax, ymax))
+        b = self._boxes[rows]
+        rows = rows[(b[:, 0] <= xmax) & (b[:, 2] >= xmin) & (b[:, 1] <= ymax) & (b[:, 3] >= ymin)]
+        return [self._keys[r] for r in np.sort(rows)]
+
+    def queryPoint(self, x, y):
+        """
+        :return: keys of the boxes containing the point
+        """
+        return self.queryRect(x, y, x, y)
+
+    def distances(self, keys, x, y):
+        """
+        :return: distance from a point to the boxes of keys, 0 inside
+        """
+        b = self._boxes[[self._rows[k] for k in keys]].reshape(-1, 4)
+        dx = np.maximum(np.maximum(b[:, 0] - x, x - b[:, 2]), 0)
+        dy = np.maximum(np.maximum(b[:, 1] - y, y - b[:, 3]), 0)
+        return np.hypot(dx, dy)
+
+    def nearest(self, x, y, k=1):
+        """
+        the k boxes closest to a point, searching rings of cells of growing radius
+        :param x:
+        :param y:
+        :param k:
+        :return: list of (key, distance), closest first
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+
+        radius = self._cell_size
+        while True:
+            rows = self._candidates((x - radius, y - radius, x + radius, y + radius))
+            keys = [self._keys[r] for r in rows]
+            dist = self.distances(keys, x, y)
+            # only boxes within the searched square are guaranteed to be found
+            found = dist <= radius
+            if found.sum() >= k or len(rows) == len(self):
+                order = np.argsort(dist, kind='stable')[:k]
+                return [(keys[i], float(dist[i])) for i in order]
+            radius *= 2
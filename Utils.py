@@ -1,9 +1,11 @@
-from PyQt5.QtCore import (QByteArray, QDataStream, QFile, QFileInfo,
+from PyQt5.QtCore import (QByteArray, QDataStream, QFile, QFileInfo, QObject, pyqtSignal,
                           QIODevice, QPoint, QPointF, QRectF, Qt, QRect, QSize)
-from PyQt5.QtGui import (QColor, QBrush, QPixmap, QPainter, QBitmap, QIcon, QFont, QPen)
+from PyQt5.QtGui import (QColor, QBrush, QPixmap, QPainter, QBitmap, QIcon, QFont, QPen, QPolygonF)
 
 import numpy as np
 
+from .Curves import circleTable
+
 
 def colorPixmap(pix, color):
     newPix = QPixmap(pix.size())
@@ -21,13 +23,28 @@ def colorPixmap(pix, color):
 
 
 def _circle_to_poly(center, r, astep=10):
-    i = 0
-    points = []
-    while i < np.pi * 2:
-        points.append([np.math.cos(i) * r +  center[0], np.math.sin(i) * r + center[1]])
-        i += np.math.radians(astep)
+    table = circleTable(int(np.ceil(360. / astep)))
+    return (table * r + np.asarray(center)).tolist()
+
+
+class QtSignalAdapter(QObject):
+    """
+    re-emit a pure-python Common.Signal as a Qt signal, e.g. to reach slots living in another thread
+
+        adapter = QtSignalAdapter(geometry.changed)
+        adapter.signal.connect(slot, Qt.QueuedConnection)
+    """
+    signal = pyqtSignal(object)
+
+    def __init__(self, bound_signal, parent=None):
+        super(QtSignalAdapter, self).__init__(parent)
+        self._source = bound_signal
+        # every access to self.signal creates a new bound signal, keep the one connected to disconnect it later
+        self._emit = self.signal.emit
+        bound_signal.connect(self._emit)
 
-    return points
+    def detach(self):
+        self._source.disconnect(self._emit)
 
 
 def _NC(rgb):
@@ -53,4 +70,19 @@ def _QP(pos):
 
 
 def _NP(point):
-    return np.array([point.x(), point.y()])
\ No newline at end of file
+    return np.array([point.x(), point.y()])
+
+
+def _QPolygon(points):
+    """
+    QPolygonF from an (n, 2) array, written through its buffer rather than one QPointF at a time
+    :param points:
+    :return:
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    polygon = QPolygonF(len(points))
+    if len(points) > 0:
+        buf = polygon.data()
+        buf.setsize(points.nbytes)
+        np.frombuffer(buf, dtype=np.float64).reshape(-1, 2)[:] = points
+    return polygon
\ No newline at end of file
@@ -0,0 +1,136 @@
+import gc
+
+import numpy as np
+import pytest
+
+from PyWidgets.Common import Signal
+
+
+class Emitter(object):
+    changed = Signal(object)
+
+
+class Receiver(object):
+    def __init__(self):
+        self.received = []
+
+    def slot(self, value):
+        self.received.append(value)
+
+
+def test_signals_are_per_instance():
+    a, b = Emitter(), Emitter()
+    received = []
+    a.changed.connect(received.append)
+    b.changed.emit(1)
+    a.changed.emit(2)
+    assert received == [2]
+
+
+def test_disconnect():
+    emitter, receiver = Emitter(), Receiver()
+    emitter.changed.connect(receiver.slot)
+    emitter.changed.disconnect(receiver.slot)
+    emitter.changed.emit(1)
+    assert receiver.received == []
+    with pytest.raises(ValueError):
+        emitter.changed.disconnect(receiver.slot)
+
+
+def test_bound_method_slots_do_not_keep_receivers_alive():
+    emitter, receiver = Emitter(), Receiver()
+    emitter.changed.connect(receiver.slot)
+    emitter.changed.emit(1)
+    assert receiver.received == [1]
+
+    del receiver
+    gc.collect()
+    emitter.changed.emit(2)
+    assert emitter.changed._slots == []
+
+
+def test_qt_adapter_detach(qapp):
+    from PyWidgets.Utils import QtSignalAdapter
+
+    emitter = Emitter()
+    adapter = QtSignalAdapter(emitter.changed)
+    received = []
+    adapter.signal.connect(received.append)
+    emitter.changed.emit(1)
+    adapter.detach()
+    emitter.changed.emit(2)
+    assert received == [1]
+
+
+def test_point_buffer_converts_to_float():
+    from PyWidgets.Common import PointBuffer
+
+    source = np.array([[0, 0], [1, 1]])
+    buf = PointBuffer(source)
+    assert buf.points.dtype == np.float64
+    buf.writable()[1] = 10.6, 12.7
+    np.testing.assert_array_equal(buf.points[1], [10.6, 12.7])
+    np.testing.assert_array_equal(source, [[0, 0], [1, 1]])
+
+
+def test_point_buffer_copies_shared_arrays_on_write():
+    from PyWidgets.Common import PointBuffer
+
+    source = np.array([[0., 0.], [1., 1.]])
+    a, b = PointBuffer(source), PointBuffer(source)
+    # no copy until written to
+    assert np.shares_memory(a.points, source)
+    a.writable()[0] = 5, 5
+    b.append([[2, 2]])
+    np.testing.assert_array_equal(source, [[0, 0], [1, 1]])
+    np.testing.assert_array_equal(a.points, [[5, 5], [1, 1]])
+    np.testing.assert_array_equal(b.points, [[0, 0], [1, 1], [2, 2]])
+
+
+def test_point_buffer_edits():
+    from PyWidgets.Common import PointBuffer
+
+    buf = PointBuffer()
+    for ix in range(100):
+        buf.append([[ix, ix]])
+    assert len(buf) == 100 and buf.capacity == 128
+    assert buf.insert(1, [[-1, -1], [-2, -2]]) == (1, 3)
+    assert buf.delete(0, 3) == (0, 3)
+    np.testing.assert_array_equal(buf.points[:2], [[1, 1], [2, 2]])
+    assert len(buf) == 99
+
+
+@pytest.mark.parametrize('index, start, expected', [
+    (10, 3, [0, 1, 2, 9]),
+    (-1, 2, [0, 1, 9, 2]),
+    (-10, 0, [9, 0, 1, 2]),
+])
+def test_point_buffer_insert_resolves_indices(index, start, expected):
+    from PyWidgets.Common import PointBuffer
+
+    buf = PointBuffer([[0, 0], [1, 1], [2, 2]])
+    assert buf.insert(index, [[9, 9]]) == (start, start + 1)
+    np.testing.assert_array_equal(buf.points[:, 0], expected)
+
+
+@pytest.mark.parametrize('start, stop, removed, expected', [
+    (-1, 3, (2, 3), [0, 1]),
+    (1, 10, (1, 3), [0]),
+    (-10, 1, (0, 1), [1, 2]),
+    (5, 6, (3, 3), [0, 1, 2]),
+])
+def test_point_buffer_delete_resolves_indices(start, stop, removed, expected):
+    from PyWidgets.Common import PointBuffer
+
+    buf = PointBuffer([[0, 0], [1, 1], [2, 2]])
+    assert buf.delete(start, stop) == removed
+    np.testing.assert_array_equal(buf.points[:, 0], expected)
+
+
+def test_point_buffer_rejects_reversed_ranges():
+    from PyWidgets.Common import PointBuffer
+
+    buf = PointBuffer([[0, 0], [1, 1], [2, 2]])
+    with pytest.raises(ValueError):
+        buf.delete(2, 1)
+    assert len(buf) == 3
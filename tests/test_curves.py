@@ -0,0 +1,50 @@
+import numpy as np
+
+from PyWidgets.Curves import (bezierSegments, flattenBeziers, circlePolygons, circleSegments, simplifyPolyline,
+                              MIN_CIRCLE_SEGMENTS)
+
+
+def test_bezier_segments_ignore_trailing_points():
+    points = np.arange(16, dtype=np.float64).reshape(8, 2)
+    assert bezierSegments(points).shape == (2, 4, 2)
+    assert bezierSegments(points[:3]).shape == (0, 4, 2)
+
+
+def test_straight_bezier_needs_one_piece():
+    line = flattenBeziers([[0, 0], [1, 1], [2, 2], [3, 3]])
+    np.testing.assert_allclose(line, [[0, 0], [3, 3]])
+
+
+def test_flattened_curve_stays_within_tolerance():
+    control = np.array([[0, 0], [0, 100], [100, 100], [100, 0]], dtype=np.float64)
+    fine = flattenBeziers(control, 0.01)
+    coarse = flattenBeziers(control, 1.)
+    np.testing.assert_allclose(coarse[[0, -1]], control[[0, 3]])
+    # every point of the fine curve is close to the coarse polyline
+    a, b = coarse[:-1], coarse[1:]
+    d = b - a
+    t = np.clip(((fine[:, None] - a) * d).sum(-1) / (d * d).sum(-1), 0, 1)
+    dist = np.linalg.norm(fine[:, None] - (a + t[..., None] * d), axis=-1).min(axis=1)
+    assert dist.max() <= 1.
+
+
+def test_circle_polygons_alternate_orientation():
+    polies = circlePolygons((5, 5), [10, 4])
+    assert polies.shape[0] == 2 and polies.shape[1] % 4 == 0
+    np.testing.assert_allclose(np.linalg.norm(polies[0] - 5, axis=1), 10)
+
+    def area(p):
+        return 0.5 * (p[:, 0] * np.roll(p[:, 1], -1) - np.roll(p[:, 0], -1) * p[:, 1]).sum()
+
+    assert area(polies[0]) > 0 > area(polies[1])
+
+
+def test_circle_segments_grow_with_radius():
+    assert circleSegments(0.1) == MIN_CIRCLE_SEGMENTS
+    assert circleSegments(1000) > circleSegments(10)
+
+
+def test_simplify_keeps_ends_and_corners():
+    points = np.array([[0, 0], [1, 0.01], [2, 0], [2, 1], [2, 2]], dtype=np.float64)
+    np.testing.assert_allclose(simplifyPolyline(points, 0.1), [[0, 0], [2, 0], [2, 2]])
+    assert len(simplifyPolyline(points, 0)) == len(points)
@@ -0,0 +1,176 @@
+import json
+
+import numpy as np
+import pytest
+
+from PyWidgets.DataModels import AnnotationModel, Polyline, Spline
+
+
+def writeModel(path, regions):
+    filename = str(path / 'model.json')
+    AnnotationModel(regions).save(filename)
+    return filename
+
+
+def test_lazy_model_parses_regions_on_access(tmp_path):
+    filename = writeModel(tmp_path, [Polyline([[0, 0], [1, 1]]), Spline([[0, 0], [1, 1], [2, 2], [3, 3]])])
+    with AnnotationModel.loadLazy(filename) as model:
+        assert len(model.regions) == 2
+        assert not model.regions.isLoaded(1)
+        np.testing.assert_array_equal(model.regions[1].control_points, [[0, 0], [1, 1], [2, 2], [3, 3]])
+        assert model.regions.isLoaded(1)
+
+    assert model._fp.closed
+    with pytest.raises(ValueError):
+        model.regions[0]
+
+
+def test_lazy_model_filters(tmp_path):
+    a, b = Polyline([[0, 0], [1, 1]]), Polyline([[2, 2], [3, 3]])
+    a.label, b.label = 'a', 'b'
+    filename = writeModel(tmp_path, [a, b, Spline()])
+    with AnnotationModel.loadLazy(filename, types=['Polyline'], labels=['b']) as model:
+        assert [r.label for r in model.regions] == ['b']
+
+
+def test_load_skips_members_before_features(tmp_path):
+    filename = str(tmp_path / 'model.json')
+    feature = json.loads(AnnotationModel([Polyline([[0, 0], [1, 1]])]).toString())['features'][0]
+    with open(filename, 'w') as fp:
+        json.dump({"description": {"features": []}, "features": [feature]}, fp)
+    assert len(AnnotationModel.load(filename).regions) == 1
+    with AnnotationModel.loadLazy(filename) as model:
+        assert len(model.regions) == 1
+
+
+def test_lazy_model_closes_the_file_of_invalid_documents(tmp_path):
+    filename = str(tmp_path / 'model.json')
+    with open(filename, 'w') as fp:
+        fp.write('{"type": "Feature"}')
+    with pytest.raises(ValueError):
+        AnnotationModel.loadLazy(filename)
+
+
+def test_sample_json(sample_json):
+    model = AnnotationModel.load(sample_json)
+    assert [type(r).__name__ for r in model.regions] == ['Polygon', 'MultiSpline', 'Group']
+    assert [r.label for r in model.regions] == ['Region 1', 'Region 1', 'Region 3']
+    with open(sample_json) as fp:
+        assert model._toDict() == json.load(fp)
+
+    with AnnotationModel.loadLazy(sample_json) as lazy:
+        assert [r.label for r in lazy.regions] == ['Region 1', 'Region 1', 'Region 3']
+    assert model.toMasks().sum() > 0
+
+
+@pytest.mark.parametrize('x, y, pixel', [(3, 4, (4, 3)), (3.2, 4.7, (5, 3)), (0.5, 0.5, (0, 0))])
+def test_point_polygon_is_centered(x, y, pixel):
+    from PyWidgets.DataModels import Point
+    from PyWidgets.Raster import rasterize
+
+    point = Point(x, y)
+    assert point.centroid == pytest.approx((x, y))
+    assert point.bounds == pytest.approx((x - .5, y - .5, x + .5, y + .5))
+    mask = rasterize(point.polies, (8, 8))
+    assert mask.sum() == 1 and mask[pixel] == 1
+
+
+def test_int_points_are_not_truncated():
+    source = np.array([[0, 0], [1, 1], [2, 2]])
+    a, b = Polyline(source), Polyline(source)
+    a.moveControlPoints([1], [[10.6, 12.7]])
+    np.testing.assert_array_equal(a.control_points[1], [10.6, 12.7])
+    np.testing.assert_array_equal(b.control_points[1], [1, 1])
+    np.testing.assert_array_equal(source[1], [1, 1])
+
+
+def test_json_regions_hold_floats(tmp_path):
+    filename = writeModel(tmp_path, [Polyline([[0, 0], [1, 1]])])
+    region = AnnotationModel.load(filename).regions[0]
+    assert region.control_points.dtype == np.float64
+    region.moveControlPoints([0], [[3.5, 4.25]])
+    np.testing.assert_array_equal(region.control_points[0], [3.5, 4.25])
+
+
+def test_transforms():
+    from PyWidgets.DataModels import Rect, MultiSpline, translation, scaling, rotation
+
+    source = np.array([[0, 0], [10, 0]])
+    line = Polyline(source)
+    changes = []
+    line.changed.connect(changes.append)
+    line.transform(translation(100.5, 0))
+    np.testing.assert_array_equal(line.control_points, [[100.5, 0], [110.5, 0]])
+    np.testing.assert_array_equal(source, [[0, 0], [10, 0]])
+    assert len(changes) == 1
+
+    line.transform(rotation(90, origin=(100.5, 0)))
+    np.testing.assert_allclose(line.control_points, [[100.5, 0], [100.5, 10]], atol=1e-12)
+
+    rect = Rect(0, 0, 10, 20)
+    rect.transform(scaling(2, 0.5, origin=(10, 20)))
+    assert (rect.x, rect.y, rect.width, rect.height) == (-10, 10, 20, 10)
+
+    multi = MultiSpline([[[0, 0], [1, 1], [2, 2], [3, 3]], [[5, 5], [6, 6], [7, 7], [8, 8]]])
+    changes = []
+    multi.changed.connect(changes.append)
+    multi.transform(translation(1, 1))
+    assert len(changes) == 1
+    np.testing.assert_array_equal(multi.control_points[[0, -1]], [[1, 1], [9, 9]])
+
+
+def test_model_polies_follow_the_tolerance():
+    model = AnnotationModel([Spline([[0, 0], [0, 100], [100, 100], [100, 0]]), Polyline([[0, 0], [5, 5]])])
+    fine, coarse = model.toPolies(0.01), model.toPolies(1.)
+    assert len(fine) == len(coarse) == 2
+    assert len(coarse[0]) < len(fine[0])
+    np.testing.assert_array_equal(coarse[1], fine[1])
+
+
+def test_derived_data_is_cached_until_the_geometry_changes():
+    polyline = Polyline([[0, 0], [10, 0], [10, 10], [0, 10]])
+    polies = polyline.polies
+    assert polyline.polies is polies and not polies[0].flags.writeable
+    assert polyline.cachedPolies(1.) is not polies
+    assert polyline.bounds == (0, 0, 10, 10)
+    assert polyline.area == 100 and polyline.centroid == (5, 5)
+
+    polyline.moveControlPoints([2], [[20, 10]])
+    assert polyline.polies is not polies
+    assert polyline.bounds == (0, 0, 20, 10)
+    assert polyline.area == 150
+
+    polyline.control_points = [[0, 0], [2, 0], [2, 2], [0, 2]]
+    assert polyline.bounds == (0, 0, 2, 2) and polyline.centroid == (1, 1)
+
+
+def test_cached_data_of_shapes_and_groups():
+    from PyWidgets.DataModels import Circle, Group
+
+    circle = Circle(0, 0, 5)
+    assert circle.bounds == pytest.approx((-5, -5, 5, 5))
+    circle.r = 10
+    assert circle.bounds == pytest.approx((-10, -10, 10, 10))
+
+    part = Polyline([[0, 0], [1, 0], [1, 1]])
+    group = Group([part, Polyline([[5, 5], [6, 5], [6, 6]])])
+    assert group.bounds == (0, 0, 6, 6)
+    part.transform([[1, 0, -1], [0, 1, -2]])
+    assert group.bounds == (-1, -2, 6, 6)
+
+
+def test_control_point_changes_report_the_resolved_range():
+    from PyWidgets.DataModels import Geometry, GeometryChange
+
+    polyline = Polyline([[0, 0], [1, 1], [2, 2]])
+    changes = []
+    polyline.changed.connect(changes.append)
+    polyline.insertControlPoints(10, [[3, 3]])
+    polyline.insertControlPoints(-1, [[5, 5]])
+    polyline.deleteControlPoints(-2, 5)
+    with pytest.raises(ValueError):
+        polyline.deleteControlPoints(2, 1)
+    assert changes == [GeometryChange(Geometry.ControlPointsInserted, 3, 4),
+                       GeometryChange(Geometry.ControlPointsInserted, 3, 4),
+                       GeometryChange(Geometry.ControlPointsRemoved, 3, 5)]
+    np.testing.assert_array_equal(polyline.control_points, [[0, 0], [1, 1], [2, 2]])
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+from PyWidgets.DataModels import AnnotationModel, Polyline
+from PyWidgets.ExportMasks import exportMasks, outputNames, findInputs, FORMAT_NPZ
+
+
+def writeModel(filename, x):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    AnnotationModel([Polyline([[x, 0], [x + 4, 0], [x + 4, 4], [x, 4]])]).save(filename)
+
+
+def test_output_names_are_unique():
+    inputs = ['a/x.json', 'b/x.json', 'x_0.json', 'y.json', 'a/x.npz']
+    names = outputNames(inputs, 'out', 'png')
+    assert len(set(names)) == len(names)
+    assert names[3] == os.path.join('out', 'y.png')
+    assert names[2] == os.path.join('out', 'x_0.png')
+
+
+def test_same_stems_do_not_overwrite(tmp_path):
+    writeModel(str(tmp_path / 'a' / 'x.json'), 0)
+    writeModel(str(tmp_path / 'b' / 'x.json'), 10)
+    inputs = findInputs([str(tmp_path / 'a'), str(tmp_path / 'b')])
+    out = str(tmp_path / 'out')
+    assert exportMasks(inputs + inputs[:1], out, fmt=FORMAT_NPZ, workers=1, log=None) == []
+
+    offsets = sorted(int(np.load(os.path.join(out, name))['offset'][0]) for name in os.listdir(out))
+    assert offsets == [0, 10]
+
+
+def test_png_masks_keep_their_offset(tmp_path):
+    from PyWidgets.ExportMasks import readPngOffset, writePng
+
+    filename = str(tmp_path / 'x.json')
+    AnnotationModel([Polyline([[12, 5], [16, 5], [16, 9], [12, 9]])]).save(filename)
+    out = str(tmp_path / 'out')
+    assert exportMasks([filename], out, workers=1, log=None) == []
+    assert readPngOffset(os.path.join(out, 'x.png')) == (12, 5)
+
+    plain = str(tmp_path / 'plain.png')
+    writePng(plain, np.zeros((2, 2), dtype=np.uint8))
+    assert readPngOffset(plain) == (0, 0)
@@ -0,0 +1,83 @@
+import json
+import os
+
+import numpy as np
+
+from PyWidgets.DataModels import AnnotationModel, Circle, Ring, Polyline, Spline, Polygon, MultiSpline, Group, Point
+from PyWidgets.GeometryStore import GeometryStore
+
+
+def regions():
+    a = Polyline([[0, 0], [10.5, 0], [10, 10]])
+    a.label = 'a'
+    b = MultiSpline([[[0, 0], [1, 1], [2, 2], [3, 3]], [[5, 5], [6, 6], [7, 7], [8, 8]]])
+    b.properties = {'score': 0.5}
+    return [a, b, Group([Polygon([[0, 0], [1, 0], [1, 1]]), Spline([[0, 0], [1, 1], [2, 2], [3, 3]])]),
+            Point(3, 4)]
+
+
+def test_binary_round_trip(tmp_path):
+    filename = str(tmp_path / 'store.npz')
+    store = GeometryStore.fromRegions(regions())
+    store.saveBinary(filename)
+    for mmap in (True, False):
+        loaded = GeometryStore.loadBinary(filename, mmap)
+        assert loaded._toDict() == store._toDict()
+        assert loaded[1].properties == {'score': 0.5}
+
+
+def test_sample_json_round_trip(sample_json, tmp_path):
+    with open(sample_json) as fp:
+        document = json.load(fp)
+
+    store = GeometryStore.load(sample_json)
+    assert store._toDict() == document
+    filename = str(tmp_path / 'sample.npz')
+    store.saveBinary(filename)
+    loaded = GeometryStore.loadBinary(filename)
+    assert loaded._toDict() == document
+    assert isinstance(loaded[0], Polygon)
+    np.testing.assert_array_equal(loaded[0].control_points, [[0, 0], [10, 10], [0, 10]])
+    assert [type(g) for g in loaded[2].geos] == [Polygon, Polygon]
+
+
+def test_regions_round_trip():
+    store = GeometryStore.fromRegions(regions())
+    assert list(store.type_names) == ['Polyline', 'MultiSpline', 'Group', 'Point']
+    assert store._toDict() == AnnotationModel(regions())._toDict()
+
+
+def test_edits_are_written_back(tmp_path):
+    store = GeometryStore.fromRegions(regions())
+    store[0].moveControlPoints([1], [[20, 1]])
+    store[0].appendControlPoints([[30, 30]])
+    np.testing.assert_array_equal(store.bounds()[0], [0, 0, 30, 30])
+    store.translate(1, 2, regions=[3])
+    assert store._toDict()['features'][3]['geometry']['coordinates'] == [4, 6]
+
+
+def test_bounds_match_the_model(sample_json):
+    model = AnnotationModel.load(sample_json)
+    model.regions.extend([Circle(5, 6, 2), Ring(-3, 1, 1, 4),
+                          Group([Circle(20, 20, 3), Polyline([[0, 0], [1, 1]])]), Group([])])
+    bounds = GeometryStore.fromModel(model).bounds()
+    for region, box in zip(model.regions[:-1], bounds):
+        if isinstance(region, MultiSpline):
+            # the control points contain the curve
+            assert (box[:2] <= region.bounds[:2]).all() and (box[2:] >= region.bounds[2:]).all()
+        else:
+            np.testing.assert_allclose(box, region.bounds, atol=1e-9)
+    np.testing.assert_allclose(bounds[3:5], [[3, 4, 7, 8], [-7, -3, 1, 5]])
+    assert np.isnan(bounds[-1]).all()
+
+
+def test_save_over_the_mapped_file(tmp_path):
+    filename = str(tmp_path / 'store.npz')
+    GeometryStore.fromRegions(regions()).saveBinary(filename)
+    store = GeometryStore.loadBinary(filename)
+    store[0].moveControlPoints([0], [[-1, -1]])
+    store.saveBinary(filename)
+    # the columns of store are still mapped from the replaced file
+    assert store._toDict() == GeometryStore.loadBinary(filename)._toDict()
+    assert store._toDict()['features'][0]['geometry']['coordinates'][0] == [-1, -1]
+    assert not os.path.exists(filename + '.tmp')
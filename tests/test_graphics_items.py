@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+from PyWidgets.DataModels import Polyline
+
+
+@pytest.fixture
+def scene(qapp):
+    from PyWidgets.InteractiveScene import InteractiveScene
+    return InteractiveScene()
+
+
+def polylineItem(scene, points, **kwargs):
+    from PyWidgets.GraphicsItems import PolylineItem
+
+    item = PolylineItem(Polyline(points), **kwargs)
+    scene.addItem(item)
+    return item
+
+
+def handlePositions(item):
+    return np.array([[c.pos().x(), c.pos().y()] for c in item._controls]).reshape(-1, 2)
+
+
+def test_handles_follow_the_model(scene):
+    item = polylineItem(scene, [[0, 0], [10, 0], [10, 10]])
+    model = item._model
+    model.appendControlPoints([[0, 10]])
+    model.deleteControlPoints(0, 1)
+    model.moveControlPoints([0], [[20, 0]])
+    np.testing.assert_array_equal(handlePositions(item), model.control_points)
+    assert [c.index for c in item._controls] == [0, 1, 2]
+
+
+def test_hidden_handles_stay_hidden(scene):
+    item = polylineItem(scene, [[0, 0], [10, 0], [10, 10]])
+    item.hideHandles()
+    item._model.deleteControlPoints(1, 2)
+    item._model.appendControlPoints([[5, 5], [6, 6]])
+    # pooled and new handles
+    assert len(item._controls) == 4
+    assert not any(c.isVisible() for c in item._controls)
+
+    item.showHandles()
+    assert all(c.isVisible() for c in item._controls)
+    item._model.appendControlPoints([[7, 7]])
+    assert item._controls[-1].isVisible()
+
+
+def test_drag_on_int_model(scene, qapp):
+    from PyQt5.QtCore import QPointF
+
+    item = polylineItem(scene, np.array([[0, 0], [10, 0], [10, 10]]))
+    changes = []
+    item._model.changed.connect(changes.append)
+    for step in range(10):
+        item._controls[1].setPos(QPointF(3.5 + step, 4.25))
+    # nothing is written before the event loop runs
+    assert changes == []
+    qapp.processEvents()
+
+    assert len(changes) == 1
+    np.testing.assert_array_equal(item._model.control_points[1], [12.5, 4.25])
+    np.testing.assert_array_equal(handlePositions(item)[1], [12.5, 4.25])
+
+
+def test_flush_handles(scene):
+    from PyQt5.QtCore import QPointF
+
+    item = polylineItem(scene, [[0, 0], [10, 0]])
+    item._controls[0].setPos(QPointF(-1.5, 2))
+    item.flushHandles()
+    np.testing.assert_array_equal(item._model.control_points[0], [-1.5, 2])
+
+
+def pathPoints(path):
+    return [(path.elementAt(ix).x, path.elementAt(ix).y) for ix in range(path.elementCount())]
+
+
+def test_paths_are_cached_until_the_points_change(scene):
+    from PyQt5.QtCore import QPointF
+
+    item = polylineItem(scene, [[0, 0], [10, 0], [10, 10]])
+    path, = item.paths
+    assert item.paths[0] is path and item.shape() is path
+    lod_path = item.lodPath(0.1)
+    assert item.lodPath(0.12) is lod_path and item.lodPath(1) is None
+
+    item._model.moveControlPoints([2], [[20, 10]])
+    assert item.paths[0] is not path and item.lodPath(0.1) is not lod_path
+    assert pathPoints(item.paths[0])[:3] == [(0, 0), (10, 0), (20, 10)]
+
+    # a dragged handle changes the path before the model is written
+    item._controls[0].setPos(QPointF(-5, 0))
+    assert pathPoints(item.paths[0])[0] == (-5, 0)
+
+
+def test_spline_paths(scene):
+    from PyWidgets.DataModels import Spline
+    from PyWidgets.GraphicsItems import SplineItem
+
+    item = SplineItem(Spline([[0, 0], [0, 10], [10, 10], [10, 0]]))
+    scene.addItem(item)
+    path, tangents = item.paths
+    assert item.paths[0] is path
+    assert path.elementCount() == 4 and tangents.elementCount() == 4
+    assert path.pointAtPercent(0.5).y() == pytest.approx(7.5)
+
+    item.model.appendControlPoints([[10, -10], [20, -10], [20, 0]])
+    path, tangents = item.paths
+    assert path.elementCount() == 7 and tangents.elementCount() == 8
+
+
+def renderAt(scene, lod):
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+
+    target = QImage(100, 100, QImage.Format_RGBA8888)
+    painter = QPainter(target)
+    scene.render(painter, QRectF(0, 0, 100, 100), QRectF(-10, -10, 100 / lod, 100 / lod))
+    painter.end()
+
+
+def test_handles_hidden_by_the_level_of_detail_cannot_be_hit(scene):
+    from PyQt5.QtCore import QPointF
+
+    item = polylineItem(scene, [[0, 0], [50, 0], [50, 50]])
+    handle = item._controls[1]
+    renderAt(scene, 0.1)
+    # disabled items get no mouse events
+    assert not handle.isEnabled()
+    assert item.handleAt(QPointF(50, 0)) is None
+
+    renderAt(scene, 1)
+    assert handle.isEnabled()
+    assert item.handleAt(QPointF(50, 0)) == 1
+
+
+def test_batch_handles_follow_the_level_of_detail(scene):
+    from PyQt5.QtCore import QPointF
+
+    item = polylineItem(scene, [[0, 0], [50, 0], [50, 50]], batch_handles=True)
+    item._pickHandle(QPointF(50, 0))
+    assert item._live_handle is not None
+    renderAt(scene, 0.1)
+    assert item._live_handle is None
+    item._pickHandle(QPointF(50, 0))
+    assert item._live_handle is None
+
+    renderAt(scene, 1)
+    item._pickHandle(QPointF(50, 0))
+    assert item._live_handle is not None and item._live_handle.isEnabled()
+
+
+def test_group_item_covers_its_parts(scene):
+    from PyQt5.QtCore import QPointF, QRectF
+    from PyWidgets.GraphicsItems import GroupItem, PolylineItem
+
+    a = PolylineItem(Polyline([[0, 0], [10, 0], [10, 10], [0, 10]]))
+    b = PolylineItem(Polyline([[100, 50], [120, 50], [120, 70], [100, 70]]))
+    group = GroupItem([a, b])
+    scene.addItem(group)
+    assert group.rect == a.rect.united(b.rect)
+    assert scene.pick_index.topItemAt(QPointF(110, 60)) is group
+    # between the parts
+    assert scene.pick_index.topItemAt(QPointF(50, 30)) is None
+
+    # the group follows its parts
+    b.model.transform([[1, 0, 100], [0, 1, 0]])
+    assert group.rect == a.rect.united(b.rect)
+    assert scene.pick_index.topItemAt(QPointF(110, 60)) is None
+    assert scene.pick_index.topItemAt(QPointF(210, 60)) is group
+
+    c = PolylineItem(Polyline([[-50, -50], [-40, -50], [-40, -40]]))
+    group.addItem(c)
+    assert group.rect.topLeft() == c.rect.topLeft()
+    assert scene.pick_index.itemsInRect(-45, -48, -44, -47) == [group]
+    assert GroupItem([]).rect == QRectF()
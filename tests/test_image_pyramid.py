@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+
+from PyWidgets.ImagePyramid import TileCache, TileSource, ImagePyramid, savePyramid
+
+
+def image(nbytes):
+    from PyQt5.QtGui import QImage
+    return QImage(nbytes // 4, 1, QImage.Format_RGBA8888)
+
+
+def test_tile_cache_evicts_least_recently_used(qapp):
+    cache = TileCache(max_bytes=300)
+    for key in 'abc':
+        cache.put(key, image(100))
+    assert cache.n_bytes == 300
+    cache.get('a')
+    cache.put('d', image(100))
+    assert 'b' not in cache and 'a' in cache
+    # peek does not change the order
+    cache.peek('c')
+    cache.put('e', image(100))
+    assert 'c' not in cache
+    assert cache.n_bytes == 300 and len(cache) == 3
+
+
+def test_tile_source_levels():
+    pixels = np.arange(600 * 1000, dtype=np.uint32).reshape(600, 1000).astype(np.uint8)
+    source = TileSource(pixels, tile_size=256)
+    assert source.n_levels == 3
+    assert source.tileCounts(0) == (3, 4)
+    assert source.tileCounts(1) == (2, 2)
+    np.testing.assert_array_equal(source.readTile(0, 3, 2), pixels[512:, 768:])
+    np.testing.assert_array_equal(source.readTile(1, 0, 0), pixels[:512:2, :512:2])
+
+
+def test_save_pyramid(tmp_path):
+    pixels = np.random.default_rng(0).integers(0, 255, (300, 301, 3), dtype=np.uint8)
+    filenames = savePyramid(pixels, str(tmp_path / 'level'), tile_size=64)
+    assert len(filenames) == 3
+    level1 = np.load(filenames[0])
+    assert level1.shape == (150, 151, 3)
+    assert abs(int(level1[0, 0, 0]) - int(round(pixels[:2, :2, 0].mean()))) <= 1
+
+
+def waitFor(condition, timeout=5.):
+    start = time.time()
+    while not condition():
+        if time.time() - start > timeout:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_partial_repaints_keep_pending_requests(qapp):
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+
+    pyramid = ImagePyramid(np.zeros((1024, 1024), dtype=np.uint8), prefetch_margin=0)
+    target = QImage(1024, 1024, QImage.Format_RGBA8888)
+    painter = QPainter(target)
+    try:
+        pyramid.paint(painter, QRectF(0, 0, 1024, 1024), 1.)
+        pyramid.paint(painter, QRectF(0, 0, 256, 256), 1.)
+        keys = [(0, tx, ty) for tx in range(4) for ty in range(4)]
+        assert waitFor(lambda: all(key in pyramid.cache for key in keys))
+    finally:
+        painter.end()
+        pyramid.close()
+
+
+def test_unthreaded_paint_loads_tiles(qapp):
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+
+    pyramid = ImagePyramid(np.full((512, 512), 200, dtype=np.uint8), threaded=False)
+    target = QImage(64, 64, QImage.Format_RGBA8888)
+    target.fill(0)
+    painter = QPainter(target)
+    pyramid.paint(painter, QRectF(0, 0, 512, 512), 0.125)
+    painter.end()
+    assert (pyramid.levelForScale(0.125), 0, 0) in pyramid.cache
+    assert target.pixelColor(10, 10).red() == 200
+
+
+def test_queued_tiles_are_not_requested_again(qapp):
+    import threading
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+    from PyWidgets.ImagePyramid import PRIORITY_VISIBLE
+
+    pyramid = ImagePyramid(np.zeros((1024, 1024), dtype=np.uint8), prefetch_margin=0)
+    loading, release = threading.Event(), threading.Event()
+    load = pyramid.loadTile
+
+    def blockedLoad(*key):
+        loading.set()
+        release.wait(5)
+        return load(*key)
+
+    pyramid.loadTile = blockedLoad
+    target = QImage(1024, 1024, QImage.Format_RGBA8888)
+    painter = QPainter(target)
+    try:
+        pyramid.paint(painter, QRectF(0, 0, 1024, 1024), 1.)
+        assert loading.wait(5)
+        queued = pyramid._queue.qsize()
+        for step in range(3):
+            pyramid.paint(painter, QRectF(0, 0, 1024, 1024), 1.)
+            pyramid.paint(painter, QRectF(0, 0, 256, 256), 1.)
+        assert pyramid._queue.qsize() == queued
+        # prefetched tiles are queued again once, when they become visible
+        pyramid._request([(2, 0, 0)], PRIORITY_VISIBLE + 1)
+        pyramid._request([(2, 0, 0)], PRIORITY_VISIBLE)
+        pyramid._request([(2, 0, 0)], PRIORITY_VISIBLE)
+        assert pyramid._queue.qsize() == queued + 2
+
+        release.set()
+        keys = [(0, tx, ty) for tx in range(4) for ty in range(4)]
+        assert waitFor(lambda: all(key in pyramid.cache for key in keys) and len(pyramid._pending) == 0)
+    finally:
+        release.set()
+        painter.end()
+        pyramid.close()
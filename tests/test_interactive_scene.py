@@ -0,0 +1,294 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def stack(qapp):
+    from PyWidgets.InteractiveScene import LayerStack
+    return LayerStack()
+
+
+def makeItems(n):
+    from PyQt5.QtWidgets import QGraphicsRectItem
+    from PyWidgets.GraphicsItems import DEFAULT_IDMAN
+
+    items = []
+    for ix in range(n):
+        item = QGraphicsRectItem()
+        item.idd = DEFAULT_IDMAN.next()
+        items.append(item)
+    return items
+
+
+def checkOrder(stack, layer, expected):
+    assert layer.items == expected
+    z = [item.zValue() for item in expected]
+    assert z == sorted(z) and len(set(z)) == len(z)
+    for ix, item in enumerate(expected):
+        assert stack.itemPosition(item.idd)[1] == ix
+        assert stack.itemById(item.idd) is item
+
+
+def test_item_moves(stack):
+    a, b, c, d = items = makeItems(4)
+    for item in items:
+        stack.addItemToCurrentLayer(item)
+    layer = stack.current_layer
+    checkOrder(stack, layer, [a, b, c, d])
+    assert stack.current_item is d
+
+    stack.moveUp(a.idd)
+    checkOrder(stack, layer, [b, a, c, d])
+    stack.moveDown(d.idd)
+    checkOrder(stack, layer, [b, a, d, c])
+    stack.moveToTop(b.idd)
+    checkOrder(stack, layer, [a, d, c, b])
+    stack.moveToBottom(c.idd)
+    checkOrder(stack, layer, [c, a, d, b])
+    # already at the ends
+    stack.moveUp(b.idd)
+    stack.moveDown(c.idd)
+    stack.moveToBottom(c.idd)
+    checkOrder(stack, layer, [c, a, d, b])
+
+
+def test_remove_item(stack):
+    a, b, c = items = makeItems(3)
+    for item in items:
+        stack.addItemToCurrentLayer(item)
+    stack.removeItem(c)
+    assert c not in stack
+    assert stack.current_item is b
+    stack.removeItem(a)
+    checkOrder(stack, stack.current_layer, [b])
+    with pytest.raises(ValueError):
+        stack.itemById(a.idd)
+
+
+def test_keys_are_spread_again_at_the_ends(qapp):
+    from PyWidgets.InteractiveScene import LayerStack
+
+    class SmallStack(LayerStack):
+        LAYER_Z_SPAN = 2 ** 14
+        FIRST_KEY = LAYER_Z_SPAN // 2
+
+    stack = SmallStack()
+    items = makeItems(5)
+    for item in items:
+        stack.addItemToCurrentLayer(item)
+    layer = stack.current_layer
+    for step in range(40):
+        stack.moveToTop(items[0].idd)
+        items = items[1:] + items[:1]
+        stack.moveToBottom(items[-2].idd)
+        items = items[-2:-1] + items[:-2] + items[-1:]
+        checkOrder(stack, layer, items)
+        assert 0 < min(layer.keys) and max(layer.keys) < SmallStack.LAYER_Z_SPAN
+
+
+def test_layers(stack):
+    from PyWidgets.InteractiveScene import LayerItem
+
+    a, b = makeItems(2)
+    stack.addItemToCurrentLayer(a)
+    top = LayerItem(stack, 'top')
+    stack.push(top)
+    stack.addItem(b, top.idd)
+    assert a.zValue() < b.zValue()
+    assert stack.layerByItemId(b.idd) == top.idd
+
+    stack.moveToBottom(top.idd)
+    assert stack.layerIndexById(top.idd) == 0
+    assert a.zValue() > b.zValue()
+    stack.moveUp(top.idd)
+    assert a.zValue() < b.zValue()
+
+
+def test_lookups_by_id(stack):
+    from PyWidgets.InteractiveScene import LayerItem
+
+    a, b, c = makeItems(3)
+    default = stack.current_layer
+    stack.addItemToCurrentLayer(a)
+    top = LayerItem(stack, 'top')
+    stack.push(top)
+    stack.addItem(b, top.idd)
+    stack.addItem(c, top.idd)
+    assert a in stack and b in stack and makeItems(1)[0] not in stack
+    assert stack.itemPosition(c.idd) == (1, 1)
+    assert stack.layerById(top.idd) == (1, top)
+
+    stack.current_item = b
+    assert stack.current_layer is top and stack.current_item_id == b.idd
+    stack.current_layer_id = default.idd
+    assert stack.current_item is a
+    stack.swap(default.idd, top.idd)
+    assert stack.layerIndexById(top.idd) == 0 and stack.itemPosition(a.idd) == (1, 0)
+
+    stack.removeItem(b)
+    assert b not in stack and stack.itemPosition(c.idd) == (0, 0)
+    with pytest.raises(ValueError):
+        stack.current_item_id = b.idd
+    with pytest.raises(ValueError):
+        stack.layerById(-5)
+
+    stack.clear()
+    assert a not in stack
+    with pytest.raises(ValueError):
+        stack.layerById(top.idd)
+
+
+def test_bulk_load_assigns_z_values_at_the_end(stack):
+    items = makeItems(3)
+    with stack.bulkLoad():
+        for item in items:
+            stack.addItemToCurrentLayer(item)
+        assert all(item.zValue() == 0 for item in items)
+    checkOrder(stack, stack.current_layer, items)
+
+
+def test_removed_items_are_released(qapp):
+    import gc
+    import weakref
+    from PyWidgets.DataModels import Polyline
+    from PyWidgets.GraphicsItems import PolylineItem
+    from PyWidgets.InteractiveScene import InteractiveScene
+
+    scene = InteractiveScene()
+    model = Polyline([[0, 0], [10, 10]])
+    item = PolylineItem(model)
+    scene.addItem(item)
+    scene.removeItem(item)
+    assert item not in scene._layer_stack
+
+    ref = weakref.ref(item)
+    del item
+    gc.collect()
+    assert ref() is None
+    model.changed.emit(0)
+
+
+@pytest.fixture
+def scene(qapp):
+    from PyWidgets.InteractiveScene import InteractiveScene
+    return InteractiveScene()
+
+
+def addPolylines(scene, polylines):
+    from PyWidgets.DataModels import Polyline
+    from PyWidgets.GraphicsItems import PolylineItem
+
+    items = [PolylineItem(Polyline(points)) for points in polylines]
+    scene.addItems(items)
+    return items
+
+
+def test_pick_index(scene):
+    from PyQt5.QtCore import QPointF
+
+    low, high, far = addPolylines(scene, [[[0, 0], [10, 0], [10, 10], [0, 10]],
+                                          [[5, 5], [15, 5], [15, 15], [5, 15]],
+                                          [[100, 100], [110, 100], [110, 110]]])
+    assert scene.pick_index.itemsAt(QPointF(7, 7)) == [high, low]
+    assert scene.pick_index.topItemAt(QPointF(2, 2)) is low
+    assert scene.pick_index.topItemAt(QPointF(50, 50)) is None
+    assert set(scene.pick_index.itemsInRect(0, 0, 200, 200)) == {low, high, far}
+
+    # the index follows model changes
+    far.model.transform(np.array([[1, 0, -100], [0, 1, -100]]))
+    assert scene.pick_index.topItemAt(QPointF(108, 102)) is None
+    assert far in scene.pick_index.itemsAt(QPointF(8, 2))
+
+    scene.removeItem(far)
+    assert far not in scene.pick_index
+    assert far not in scene.pick_index.itemsInRect(0, 0, 200, 200)
+
+
+def test_pick_index_follows_item_transforms(scene):
+    from PyQt5.QtCore import QPointF
+    from PyQt5.QtGui import QTransform
+    from PyWidgets.DataModels import Polyline
+    from PyWidgets.GraphicsItems import GroupItem, PolylineItem
+
+    item, = addPolylines(scene, [[[0, 0], [10, 0], [10, 10], [0, 10]]])
+    item.setPos(200, 0)
+    assert scene.pick_index.topItemAt(QPointF(5, 5)) is None
+    assert scene.pick_index.topItemAt(QPointF(205, 5)) is item
+    item.setTransform(QTransform().scale(3, 3))
+    assert scene.pick_index.topItemAt(QPointF(225, 25)) is item
+    item.setTransform(QTransform())
+    item.setRotation(90)
+    assert scene.pick_index.topItemAt(QPointF(195, 5)) is item
+    assert scene.pick_index.topItemAt(QPointF(205, 5)) is None
+
+    # a group moves the scene bounds of its parts
+    group = GroupItem([PolylineItem(Polyline([[0, 0], [10, 0], [10, 10], [0, 10]]))])
+    scene.addItem(group)
+    group.setPos(0, 300)
+    assert scene.pick_index.topItemAt(QPointF(5, 305)) is group
+
+
+def test_rect_selection_tests_shapes(scene):
+    from PyQt5.QtCore import QRectF, Qt
+
+    crossing, inside, outside = addPolylines(scene, [[[0, 50], [100, 50], [100, 60], [0, 60]],
+                                                     [[45, 0], [55, 0], [55, 10]],
+                                                     [[80, 0], [90, 0], [90, 10]]])
+    band = QRectF(40, -5, 20, 80)
+    # no vertex of the crossing item is in the band
+    assert set(scene.itemsInRect(band)) == {crossing, inside}
+    assert scene.itemsInRect(band, Qt.ContainsItemShape) == [inside]
+
+    lasso = [[40, -5], [60, -5], [60, 75], [40, 75]]
+    assert set(scene.itemsInPolygon(lasso)) == {crossing, inside}
+    assert scene.itemsInPolygon(lasso, Qt.ContainsItemShape) == [inside]
+
+
+def test_selection_uses_item_transforms(scene):
+    from PyQt5.QtCore import QRectF
+
+    item, = addPolylines(scene, [[[0, 0], [10, 0], [10, 10]]])
+    item.setPos(200, 0)
+    assert scene.itemsInRect(QRectF(-5, -5, 20, 20)) == []
+    assert scene.itemsInRect(QRectF(195, -5, 20, 20)) == [item]
+    assert scene.itemsInPolygon([[195, -5], [215, -5], [215, 15]]) == [item]
+
+
+def test_selection_changes_are_notified_once(scene):
+    a, b = addPolylines(scene, [[[0, 0], [10, 0]], [[0, 5], [10, 5]]])
+    notified = []
+    scene.selectionChanged.connect(lambda: notified.append(set(scene.selectedItems())))
+    scene.setSelectedItems([a, b])
+    scene.setSelectedItems([b, a])
+    scene.setSelectedItems([a], add=True)
+    assert notified == [{a, b}]
+    scene.setSelectedItems([b])
+    scene.setSelectedItems([])
+    scene.setSelectedItems([])
+    assert notified == [{a, b}, {b}, set()]
+
+
+def test_load_sample_model(scene, sample_json):
+    from PyQt5.QtCore import QPointF
+    from PyWidgets.DataModels import AnnotationModel
+
+    model = AnnotationModel.load(sample_json)
+    items = scene.loadModel(model)
+    assert [type(item).__name__ for item in items] == ['PolylineItem', 'MultiGeometryItem', 'GroupItem']
+    assert [type(part).__name__ for part in items[1]._parts()] == ['SplineItem']
+    assert len(items[2]._parts()) == 2
+    assert items[1]._controls == [] and len(items[1]._parts()[0]._controls) == 3
+    assert all(item in scene.pick_index for item in items)
+
+    # the groups follow their parts
+    model.regions[2].geos[1].transform([[1, 0, 100], [0, 1, 0]])
+    assert items[2].rect == items[2]._parts()[0].rect.united(items[2]._parts()[1].rect)
+    assert items[2].rect.right() > 110
+    assert scene.pick_index.topItemAt(QPointF(103, 8)) is items[2]
+
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+    target = QImage(100, 100, QImage.Format_RGBA8888)
+    painter = QPainter(target)
+    scene.render(painter, QRectF(0, 0, 100, 100), QRectF(-5, -5, 20, 20))
+    painter.end()
@@ -0,0 +1,45 @@
+import io
+import json
+
+import pytest
+
+from PyWidgets.JsonStream import iterFeatures, readFeature
+
+
+def collection(n):
+    features = [{"type": "Feature", "geometry": {"type": "Polyline", "coordinates": [[ix, 0], [ix, 1]]},
+                 "properties": {"label": u"région %d" % ix}} for ix in range(n)]
+    return json.dumps({"type": "FeatureCollection", "features": features}).encode('utf-8'), features
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64, 1 << 20])
+def test_features_and_byte_ranges(chunk_size):
+    data, features = collection(20)
+    decoded = list(iterFeatures(io.BytesIO(data), chunk_size))
+    assert [f for f, start, end in decoded] == features
+    for feature, start, end in decoded:
+        assert readFeature(data, start, end) == feature
+
+
+def test_empty_collection():
+    assert list(iterFeatures(io.BytesIO(b'{"type": "FeatureCollection", "features": []}'))) == []
+
+
+def test_not_a_collection():
+    with pytest.raises(ValueError):
+        list(iterFeatures(io.BytesIO(b'{"type": "Feature"}')))
+
+
+def test_truncated_file():
+    data, features = collection(3)
+    with pytest.raises(ValueError):
+        list(iterFeatures(io.BytesIO(data[:-10]), 16))
+
+
+@pytest.mark.parametrize('chunk_size', [5, 1 << 20])
+def test_other_members_are_skipped(chunk_size):
+    data, features = collection(2)
+    document = {"name": "\"features\": [1, 2]", "meta": {"features": []}, "bbox": [0, 0, 12345, 1],
+                "features": features}
+    data = json.dumps(document).encode('utf-8')
+    assert [f for f, start, end in iterFeatures(io.BytesIO(data), chunk_size)] == features
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from PyWidgets.Raster import rasterize, polyBounds, labelDtype, LAYOUT_LABEL, LAYOUT_CHANNELS
+
+
+def square(x, y, a):
+    return np.array([[x, y], [x + a, y], [x + a, y + a], [x, y + a]], dtype=np.float64)
+
+
+def test_square_covers_its_pixels():
+    mask = rasterize([square(0, 0, 10)], (20, 20))
+    assert mask.dtype == np.uint8
+    assert mask.sum() == 100
+    assert mask[:10, :10].all()
+
+
+def test_hole_of_the_same_group_is_empty():
+    mask = rasterize([square(0, 0, 10), square(3, 3, 4)], (10, 10), groups=[0, 0])
+    assert mask.sum() == 100 - 16
+    assert not mask[3:7, 3:7].any()
+
+
+def test_label_layout_keeps_topmost_region():
+    mask = rasterize([square(0, 0, 4), square(2, 2, 4)], (8, 8), layout=LAYOUT_LABEL, labels=[5, 7])
+    assert mask[0, 0] == 5
+    assert mask[3, 3] == 7
+    assert mask[7, 7] == 0
+
+
+def test_channels_layout():
+    mask = rasterize([square(0, 0, 4), square(2, 2, 4)], (8, 8), layout=LAYOUT_CHANNELS)
+    assert mask.shape == (2, 8, 8)
+    assert mask[0].sum() == mask[1].sum() == 16
+
+
+def test_offset_and_clipping():
+    mask = rasterize([square(-5, -5, 10)], (10, 10), offset=(-5, -5))
+    assert mask[:10, :10].sum() == 100
+    assert rasterize([square(-5, -5, 10)], (10, 10)).sum() == 25
+
+
+def test_degenerate_polygons_are_ignored():
+    assert rasterize([[[0, 0], [5, 5]]], (10, 10)).sum() == 0
+
+
+def test_poly_bounds():
+    assert polyBounds([square(1, 2, 3), square(-1, 0, 1)]) == (-1, 0, 4, 5)
+    assert polyBounds([]) is None
+
+
+@pytest.mark.parametrize('n, dtype', [(10, np.uint8), (300, np.uint16), (70000, np.uint32)])
+def test_label_dtype(n, dtype):
+    assert labelDtype(n) == dtype
@@ -0,0 +1,87 @@
+import numpy as np
+
+from PyWidgets.SpatialIndex import GridIndex, pointsInPolies
+
+
+def grid():
+    keys = ['a', 'b', 'c', 'big']
+    boxes = [(0, 0, 10, 10), (20, 20, 30, 30), (100, 100, 110, 110), (-1000, -1000, 1000, 1000)]
+    return GridIndex.build(keys, boxes, cell_size=16)
+
+
+def test_query_rect_and_point():
+    index = grid()
+    assert sorted(index.queryRect(5, 5, 25, 25)) == ['a', 'b', 'big']
+    assert sorted(index.queryPoint(105, 105)) == ['big', 'c']
+    assert index.queryPoint(5000, 5000) == []
+
+
+def test_update_and_remove():
+    index = grid()
+    index.update('a', (200, 200, 210, 210))
+    assert 'a' not in index.queryPoint(5, 5)
+    assert 'a' in index.queryPoint(205, 205)
+    index.remove('a')
+    assert 'a' not in index and len(index) == 3
+    # the freed row is reused
+    index.insert('d', (1, 1, 2, 2))
+    assert sorted(index.queryPoint(1.5, 1.5)) == ['big', 'd']
+
+
+def test_nan_boxes_are_not_indexed():
+    index = GridIndex.build([0, 1], [(0, 0, 1, 1), (np.nan,) * 4])
+    assert len(index) == 1
+
+
+def test_nearest():
+    index = GridIndex.build(['a', 'b', 'c'], [(0, 0, 10, 10), (20, 20, 30, 30), (100, 100, 110, 110)], 16)
+    assert index.nearest(12, 12, 2) == [('a', np.hypot(2, 2)), ('b', np.hypot(8, 8))]
+    assert index.nearest(5, 5)[0] == ('a', 0.)
+    assert len(index.nearest(0, 0, 10)) == 3
+
+
+def test_points_in_polies_even_odd():
+    outer = [[0, 0], [10, 0], [10, 10], [0, 10]]
+    hole = [[3, 3], [7, 3], [7, 7], [3, 7]]
+    inside = pointsInPolies([[1, 1], [5, 5], [20, 5]], [outer, hole])
+    assert inside.tolist() == [True, False, False]
+
+
+def squares(*corners):
+    from PyWidgets.DataModels import Polyline
+    return [Polyline([[x, y], [x + 10, y], [x + 10, y + 10], [x, y + 10]]) for x, y in corners]
+
+
+def test_model_index_follows_region_changes():
+    from PyWidgets.DataModels import AnnotationModel
+
+    a, b = squares((0, 0), (50, 50))
+    model = AnnotationModel([a, b])
+    assert model.queryPoint(5, 5) == [0]
+    a.transform([[1, 0, 100], [0, 1, 0]])
+    assert model.queryPoint(5, 5) == []
+    assert model.queryRect(100, 0, 101, 1) == [0]
+
+    model.regions.append(squares((0, 0))[0])
+    model.regions.pop(1)
+    assert model.queryPoint(55, 55) == []
+    assert model.queryPoint(5, 5) == [1]
+
+
+def test_model_index_after_in_place_replacement():
+    from PyWidgets.DataModels import AnnotationModel
+
+    regions = squares((0, 0), (50, 50), (100, 100))
+    model = AnnotationModel(list(regions))
+    assert model.queryPoint(55, 55) == [1]
+    model.regions[1] = squares((200, 200))[0]
+    assert model.queryPoint(55, 55) == []
+    assert model.queryPoint(205, 205) == [1]
+    # the replaced region is no longer watched, the new one is
+    regions[1].transform([[1, 0, 150], [0, 1, 150]])
+    assert model.queryPoint(205, 205) == [1]
+    model.regions[1].transform([[1, 0, 100], [0, 1, 0]])
+    assert model.queryPoint(305, 205) == [1] and model.queryPoint(205, 205) == []
+
+    model.regions[:] = squares((0, 0), (20, 20), (40, 40))
+    assert model.queryPoint(25, 25) == [1] and model.queryPoint(305, 205) == []